@@ -3,6 +3,10 @@ ASGI config for IntelligentStrLighting project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn IntelligentStrLighting.asgi:application``)
+so async views such as ``predict_light`` run natively on the event loop and
+fetch their upstream data concurrently.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +18,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "IntelligentStrLighting.settings")
 
 application = get_asgi_application()
+
+# Only serving processes warm the model up (not migrate, tests or scripts)
+from api.startup import start_serving  # noqa: E402
+
+start_serving()
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 # load env var
 from dotenv import load_dotenv
+from pathlib import Path
+import json
 import os
 
 load_dotenv()  
@@ -22,10 +24,93 @@ THINGSPEAK_READ_API_KEY = os.getenv("THINGSPEAK_READ_API_KEY")
 VISUAL_CROSSING_API_KEY = os.getenv("VISUAL_CROSSING_API_KEY")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
+# Upstream API base URLs (overridable to point at local stand-ins)
+THINGSPEAK_API_URL = os.getenv("THINGSPEAK_API_URL", "https://api.thingspeak.com")
+VISUAL_CROSSING_API_URL = os.getenv("VISUAL_CROSSING_API_URL", "https://weather.visualcrossing.com")
+OPENWEATHER_API_URL = os.getenv("OPENWEATHER_API_URL", "http://api.openweathermap.org")
+
+# Pooled upstream HTTP client (api.upstream): connections kept alive per host,
+# failed connects and 429/5xx responses retried with exponential backoff
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 10))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", 10))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 2))
+UPSTREAM_BACKOFF_FACTOR = float(os.getenv("UPSTREAM_BACKOFF_FACTOR", 0.3))
+
+# ThingSpeak light-control writes are queued and sent no faster than once per
+# THINGSPEAK_WRITE_INTERVAL seconds (15s on the free tier)
+THINGSPEAK_WRITE_INTERVAL = float(os.getenv("THINGSPEAK_WRITE_INTERVAL", 15))
+THINGSPEAK_WRITE_MAX_ATTEMPTS = int(os.getenv("THINGSPEAK_WRITE_MAX_ATTEMPTS", 5))
+
+# The ThingSpeak feed is mirrored into SensorEntry by polling every
+# THINGSPEAK_SYNC_INTERVAL seconds (one process polls at a time); the sensor
+# endpoints read the mirror. ThingSpeak returns at most 8000 entries per call.
+THINGSPEAK_SYNC_INTERVAL = float(os.getenv("THINGSPEAK_SYNC_INTERVAL", 15))
+THINGSPEAK_SYNC_INITIAL_RESULTS = int(os.getenv("THINGSPEAK_SYNC_INITIAL_RESULTS", 100))
+THINGSPEAK_SYNC_MAX_RESULTS = int(os.getenv("THINGSPEAK_SYNC_MAX_RESULTS", 8000))
+SENSOR_LOGS_MAX_RESULTS = int(os.getenv("SENSOR_LOGS_MAX_RESULTS", 500))
+
+# The live sensor stream checks the mirror every SENSOR_STREAM_POLL_INTERVAL
+# seconds and sends a keepalive comment after SENSOR_STREAM_HEARTBEAT idle seconds
+SENSOR_STREAM_POLL_INTERVAL = float(os.getenv("SENSOR_STREAM_POLL_INTERVAL", 2))
+SENSOR_STREAM_HEARTBEAT = float(os.getenv("SENSOR_STREAM_HEARTBEAT", 15))
+SENSOR_STREAM_QUEUE_SIZE = int(os.getenv("SENSOR_STREAM_QUEUE_SIZE", 100))
+
+# Concurrent upstream fetches for a fleet prediction. Keep it at or below
+# UPSTREAM_POOL_MAXSIZE so every fetch reuses a pooled connection.
+FLEET_FETCH_CONCURRENCY = int(os.getenv("FLEET_FETCH_CONCURRENCY", 10))
+
+# Site for the local solar geometry (api.solar): sun position, daylight and
+# clear-sky irradiance. SITE_TIMEZONE is the zone of the training data's times.
+SITE_LATITUDE = float(os.getenv("SITE_LATITUDE", -17.8252))
+SITE_LONGITUDE = float(os.getenv("SITE_LONGITUDE", 31.0335))
+SITE_TIMEZONE = os.getenv("SITE_TIMEZONE", "Africa/Harare")
+
+# Day-ahead lighting schedule: the next SCHEDULE_HOURS hours of the forecast are
+# predicted in one batch every SCHEDULE_REFRESH_INTERVAL seconds (by one process
+# at a time) and stored; /api/schedule/ serves the latest. Older schedules are
+# kept for SCHEDULE_RETENTION_DAYS.
+SCHEDULE_HOURS = int(os.getenv("SCHEDULE_HOURS", 36))
+SCHEDULE_REFRESH_INTERVAL = float(os.getenv("SCHEDULE_REFRESH_INTERVAL", 3600))
+SCHEDULE_RETENTION_DAYS = int(os.getenv("SCHEDULE_RETENTION_DAYS", 7))
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# ML model training data and persisted model artifacts
+TRAINING_DATA_PATH = Path(os.getenv("TRAINING_DATA_PATH", BASE_DIR / "harareweather2.csv"))
+ML_MODEL_DIR = Path(os.getenv("ML_MODEL_DIR", BASE_DIR / "models"))
+# Hyperparameter overrides (JSON object) on top of api.ml_model.DEFAULT_MODEL_PARAMS,
+# e.g. ML_MODEL_PARAMS='{"n_estimators": 1000, "early_stopping_rounds": 20}'.
+# Servers load the artifact trained with these (see manage.py train_model).
+ML_MODEL_PARAMS = json.loads(os.getenv("ML_MODEL_PARAMS") or "{}")
+# Load the ML model on a background thread when a server process starts
+# (wsgi.py/asgi.py, see api.startup) and keep it updated (api.model_updates)
+ML_WARMUP_ON_STARTUP = os.getenv("ML_WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Columnar (.npy) cache of the training CSV, rebuilt when the CSV changes
+DATASET_CACHE_DIR = Path(os.getenv("DATASET_CACHE_DIR", BASE_DIR / ".cache" / "dataset"))
+# Incremental updates (api.model_updates): every MODEL_UPDATE_INTERVAL seconds
+# (0 disables) at least MODEL_UPDATE_MIN_ROWS rows added to the training data are
+# boosted onto the serving model as MODEL_UPDATE_ROUNDS more trees. The update is
+# swapped in only if no validation MAE rises above
+# MAE before * (1 + MODEL_UPDATE_MAE_TOLERANCE) + MODEL_UPDATE_MAE_EPSILON.
+# Past MODEL_UPDATE_MAX_TREES trees the model is retrained from scratch instead.
+MODEL_UPDATE_INTERVAL = float(os.getenv("MODEL_UPDATE_INTERVAL", 3600))
+MODEL_UPDATE_MIN_ROWS = int(os.getenv("MODEL_UPDATE_MIN_ROWS", 24))
+MODEL_UPDATE_ROUNDS = int(os.getenv("MODEL_UPDATE_ROUNDS", 20))
+MODEL_UPDATE_MAE_TOLERANCE = float(os.getenv("MODEL_UPDATE_MAE_TOLERANCE", 0.1))
+MODEL_UPDATE_MAE_EPSILON = float(os.getenv("MODEL_UPDATE_MAE_EPSILON", 0.001))
+MODEL_UPDATE_MAX_TREES = int(os.getenv("MODEL_UPDATE_MAX_TREES", 400))
+
+# Visual Crossing responses are cached for WEATHER_CACHE_TTL seconds, then
+# served stale for up to WEATHER_CACHE_STALE_TTL more while one worker refreshes
+WEATHER_CACHE_ALIAS = "weather"
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 900))
+WEATHER_CACHE_STALE_TTL = int(os.getenv("WEATHER_CACHE_STALE_TTL", 3600))
+# Lock files (api.locks) that let one worker process at a time fetch a weather
+# entry, build a schedule or update the model
+LOCK_DIR = Path(os.getenv("LOCK_DIR", BASE_DIR / ".cache" / "locks"))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -68,27 +153,52 @@ MIDDLEWARE = [
 CORS_ALLOW_ALL_ORIGINS = True
 
 
-# Logging configuration
+# Logging: records are queued by the request thread and written by a background
+# listener as JSON lines to a rotating LOG_FILE (empty to disable) and as text
+# to the console (LOG_CONSOLE=text|json|off)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", str(BASE_DIR / "light_control.log"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "text").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Per-module levels, e.g. "api.ml_model=DEBUG,django.db.backends=INFO"
+LOG_LEVELS = {
+    name.strip(): level.strip().upper()
+    for name, _, level in (item.partition("=") for item in os.getenv("LOG_LEVELS", "").split(","))
+    if name.strip() and level.strip()
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': 'light_control.log',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+        'queue': {
+            'class': 'api.log_handlers.BackgroundQueueHandler',
+            'filename': LOG_FILE or None,
+            'max_bytes': LOG_MAX_BYTES,
+            'backup_count': LOG_BACKUP_COUNT,
+            'console': LOG_CONSOLE,
+            'queue_size': LOG_QUEUE_SIZE,
         },
     },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
     'loggers': {
+        # Django's own handlers are replaced so everything goes through the queue
         'django': {
-            'handlers': ['file', 'console'],
+            'handlers': [],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'django.server': {
+            'handlers': [],
             'level': 'INFO',
             'propagate': True,
         },
+        **{name: {'level': level} for name, level in LOG_LEVELS.items()},
     },
 }
 
@@ -119,9 +229,35 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # WAL lets request threads read while the prediction log flusher writes
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            "timeout": 20,
+        },
     }
 }
 
+# Predictions are buffered in memory and written to PredictionLog in bulk
+# every PREDICTION_LOG_BATCH_SIZE rows or PREDICTION_LOG_FLUSH_INTERVAL seconds
+PREDICTION_LOG_ENABLED = os.getenv("PREDICTION_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+PREDICTION_LOG_BATCH_SIZE = int(os.getenv("PREDICTION_LOG_BATCH_SIZE", 500))
+PREDICTION_LOG_FLUSH_INTERVAL = float(os.getenv("PREDICTION_LOG_FLUSH_INTERVAL", 5))
+PREDICTION_LOG_MAX_BUFFER = int(os.getenv("PREDICTION_LOG_MAX_BUFFER", 100000))
+
+
+# Caches
+# The weather cache is file based so all worker processes share one copy
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "weather": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("WEATHER_CACHE_DIR", BASE_DIR / ".cache" / "weather"),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
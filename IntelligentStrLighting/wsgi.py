@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "IntelligentStrLighting.settings")
 
 application = get_wsgi_application()
+
+# Only serving processes warm the model up (not migrate, tests or scripts)
+from api.startup import start_serving  # noqa: E402
+
+start_serving()
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
+from .models import Streetlight
+
+
 # Register your models here.
+@admin.register(Streetlight)
+class StreetlightAdmin(admin.ModelAdmin):
+    list_display = ('name', 'channel_id', 'area', 'active')
+    list_filter = ('area', 'active')
+    search_fields = ('name', 'channel_id')
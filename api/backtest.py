@@ -0,0 +1,200 @@
+"""
+Rolling-origin backtests of the light intensity model.
+
+train_models scores the model on a random 20% of the hours, so the model
+has seen the hours around (and after) the ones it is scored on. A backtest
+walks forward through time instead. Each fold trains on every hour before
+its origin and is scored on the next `horizon_days`. The origin then moves
+on by one horizon. Each fold fits its own normalization stats on its
+training hours, as train_models does on the full set. The targets and on/off
+labels are the create_streetlight_targets rules, and the predictions go
+through make_prediction_batch just as served ones do.
+
+Folds are independent and run in a process pool. Each worker receives the
+feature frame once, when it starts, and then only row bounds per fold. The
+cores are split between the workers' XGBoost and BLAS thread pools.
+"""
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+class Fold(NamedTuple):
+    train_end: int  # rows [0, train_end) of the time-sorted frame train the fold
+    test_end: int  # rows [train_end, test_end) score it
+
+
+def rolling_origin_folds(times, initial_days=90, horizon_days=30):
+    """
+    Folds over sorted datetime64 `times`. The first origin is `initial_days`
+    after the first hour and each fold is scored on the `horizon_days` after
+    its origin.
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    if len(times) == 0:
+        return []
+    horizon = np.timedelta64(int(horizon_days * 86400), 's')
+    origin = times[0] + np.timedelta64(int(initial_days * 86400), 's')
+    folds = []
+    while origin <= times[-1]:
+        train_end = int(np.searchsorted(times, origin))
+        test_end = int(np.searchsorted(times, origin + horizon))
+        if train_end > 0 and test_end > train_end:
+            folds.append(Fold(train_end, test_end))
+        origin += horizon
+    return folds
+
+
+def score_table(scored, by):
+    """
+    MAE, R² and on/off accuracy of the 'actual', 'predicted', 'label' and
+    'decision' columns of `scored`, per group of `by`. R² is NaN for groups
+    whose actual intensity does not vary (e.g. night hours).
+    """
+    error = scored['predicted'] - scored['actual']
+    grouped = scored.assign(
+        abs_error=error.abs(),
+        squared_error=error ** 2,
+        correct=scored['decision'] == scored['label'],
+    ).groupby(by)
+    table = grouped.agg(
+        rows=('actual', 'size'),
+        mae=('abs_error', 'mean'),
+        squared_error=('squared_error', 'sum'),
+        variance=('actual', 'var'),
+        on_off_accuracy=('correct', 'mean'),
+    )
+    total_squares = table['variance'].fillna(0) * (table['rows'] - 1)
+    table['r2'] = 1 - table['squared_error'] / total_squares.where(total_squares > 0)
+    return table[['rows', 'mae', 'r2', 'on_off_accuracy']]
+
+
+# Worker process state, set once by _init_worker
+_frame = None
+_threads = None
+
+
+def _init_worker(frame, threads):
+    global _frame, _threads
+    from django.apps import apps
+
+    # Workers started with spawn or forkserver have not set Django up
+    if not apps.ready:
+        import django
+        django.setup()
+
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+    _frame = frame
+    _threads = threads
+
+
+def _run_fold(fold, model_params):
+    from .features import FeaturePipeline
+    from .ml_model import StreetlightMLSystem, fit_intensity_model
+
+    started = time.perf_counter()
+    system = StreetlightMLSystem(model_params=model_params)
+    train = _frame.iloc[:fold.train_end]
+    system.feature_pipeline = FeaturePipeline().fit(train)
+    train = system.preprocess_weather_data(train.copy())
+    test = system.preprocess_weather_data(_frame.iloc[fold.train_end:fold.test_end].copy())
+
+    X = train[system.feature_columns].fillna(0)
+    y = system.create_streetlight_targets(train)['light_intensity']
+    # Rows are in time order: early stopping holds out the fold's newest training hours
+    system.light_intensity_model = fit_intensity_model(X, y, model_params, n_jobs=_threads)
+    system.is_trained = True
+
+    targets = system.create_streetlight_targets(test)
+    predictions = system.make_prediction_batch(
+        test[system.feature_columns].fillna(0).to_numpy(dtype=np.float32), record=False
+    )
+    return {
+        'actual': np.asarray(targets['light_intensity'], dtype=np.float64),
+        'predicted': predictions['recommended_intensity'],
+        'label': np.asarray(targets['lights_on']).astype(bool),
+        'decision': predictions['lights_should_be_on'],
+        'train_rows': len(X),
+        'trees': system.light_intensity_model.get_booster().num_boosted_rounds(),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def run_backtest(df_raw, model_params=None, initial_days=90, horizon_days=30, workers=None):
+    """
+    Backtest `model_params` (default: the serving hyperparameters) on the
+    raw training rows `df_raw` over rolling-origin folds.
+
+    Returns a dict with 'folds' (one dict per fold), 'overall' scores,
+    'by_month' and 'by_hour' score tables over every scored hour, the
+    worker and thread counts, and wall times in seconds.
+    """
+    from .ml_model import create_features
+    from .model_registry import available_cores, serving_model_params
+
+    started = time.perf_counter()
+    model_params = dict(model_params or serving_model_params())
+    frame = create_features(df_raw).sort_values('datetime', kind='stable').reset_index(drop=True)
+    folds = rolling_origin_folds(frame['datetime'].to_numpy(), initial_days, horizon_days)
+    if not folds:
+        raise ValueError(f"No backtest folds: the data spans under {initial_days} days")
+    features_seconds = time.perf_counter() - started
+
+    cores = available_cores()
+    workers = max(1, min(len(folds), workers or cores))
+    threads = max(1, cores // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(frame, threads)) as pool:
+        results = list(pool.map(_run_fold, folds, repeat(model_params)))
+
+    times = frame['datetime']
+    scored = pd.DataFrame({
+        'datetime': times.iloc[folds[0].train_end:folds[-1].test_end].to_numpy(),
+        **{name: np.concatenate([result[name] for result in results])
+           for name in ('actual', 'predicted', 'label', 'decision')},
+    })
+    by_fold = score_table(scored, np.repeat(np.arange(len(folds)), [fold.test_end - fold.train_end for fold in folds]))
+    report_folds = []
+    for number, (fold, result, scores) in enumerate(zip(folds, results, by_fold.to_dict('records'))):
+        report_folds.append({
+            'fold': number,
+            'train_from': times.iloc[0].isoformat(),
+            'test_from': times.iloc[fold.train_end].isoformat(),
+            'test_to': times.iloc[fold.test_end - 1].isoformat(),
+            'train_rows': result['train_rows'],
+            'test_rows': scores['rows'],
+            'mae': scores['mae'],
+            'r2': scores['r2'],
+            'on_off_accuracy': scores['on_off_accuracy'],
+            'trees': result['trees'],
+            'seconds': result['seconds'],
+        })
+
+    overall = score_table(scored, np.zeros(len(scored), dtype=int)).iloc[0].to_dict()
+    # The most any intensity model can agree with the labels through the > 15 threshold
+    overall['on_off_ceiling'] = float(np.mean((scored['actual'] > 15) == scored['label']))
+    report = {
+        'model_params': model_params,
+        'folds': report_folds,
+        'overall': overall,
+        'by_month': score_table(scored, scored['datetime'].dt.strftime('%Y-%m')),
+        'by_hour': score_table(scored, scored['datetime'].dt.hour),
+        'workers': workers,
+        'threads_per_worker': threads,
+        'features_seconds': features_seconds,
+        'seconds': time.perf_counter() - started,
+    }
+    logger.info(
+        f"Backtest over {len(folds)} folds: MAE {overall['mae']:.3f}, R² {overall['r2']:.4f}, "
+        f"on/off accuracy {overall['on_off_accuracy']:.1%} in {report['seconds']:.2f}s",
+        extra={'folds': len(folds), 'mae': overall['mae'], 'seconds': report['seconds']}
+    )
+    return report
@@ -0,0 +1,153 @@
+"""
+Columnar binary cache of the training CSV.
+
+The CSV is parsed once into one .npy file per needed column (numeric columns
+as float32, timestamps as datetime64) and later loads memory-map those files
+with no parsing. The cache is keyed by the CSV's content hash and a pointer
+file records its mtime and size, so an unchanged CSV is never re-read or
+re-hashed.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .features import WEATHER_COLUMNS
+
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_COLUMNS = ['datetime', 'sunrise', 'sunset']
+NUMERIC_COLUMNS = list(WEATHER_COLUMNS)
+POINTER_FILENAME = 'current.json'
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, payload):
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def source_hash(csv_path, cache_dir):
+    """
+    Content hash of the CSV, read from the cache pointer when the file's
+    mtime and size are unchanged.
+    """
+    pointer = _read_json(os.path.join(cache_dir, POINTER_FILENAME))
+    signature = _source_signature(csv_path)
+    if pointer and all(pointer.get(key) == value for key, value in signature.items()):
+        return pointer['hash']
+    return file_content_hash(csv_path)
+
+
+def build_dataset_cache(csv_path, cache_dir, data_hash):
+    """Parse the CSV and write its columnar cache under cache_dir/<hash>"""
+    df = pd.read_csv(csv_path, usecols=lambda name: name in TIMESTAMP_COLUMNS or name in NUMERIC_COLUMNS)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    columns = {}
+    for name in TIMESTAMP_COLUMNS:
+        values = pd.to_datetime(df[name], errors='coerce') if name in df else pd.Series(pd.NaT, index=df.index)
+        array = values.to_numpy(dtype='datetime64[ns]')
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+        columns[name] = str(array.dtype)
+    for name in NUMERIC_COLUMNS:
+        if name not in df:
+            continue
+        array = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float32)
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+        columns[name] = str(array.dtype)
+
+    _write_json_atomic(os.path.join(tmp_dir, MANIFEST_FILENAME), {
+        'source': os.fspath(csv_path),
+        'hash': data_hash,
+        'rows': len(df),
+        'columns': columns,
+    })
+
+    target = os.path.join(cache_dir, data_hash[:16])
+    if os.path.isdir(target):
+        # Built concurrently by another process
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    else:
+        os.replace(tmp_dir, target)
+    return target
+
+
+def _remove_stale_caches(cache_dir, keep):
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name != keep and os.path.isdir(path) and not name.startswith('.'):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def ensure_dataset_cache(csv_path, cache_dir):
+    """Return the cache directory for the CSV, building it if the CSV changed"""
+    os.makedirs(cache_dir, exist_ok=True)
+    pointer_path = os.path.join(cache_dir, POINTER_FILENAME)
+    pointer = _read_json(pointer_path)
+    signature = _source_signature(csv_path)
+
+    if pointer and all(pointer.get(key) == value for key, value in signature.items()):
+        path = os.path.join(cache_dir, pointer['hash'][:16])
+        if os.path.isfile(os.path.join(path, MANIFEST_FILENAME)):
+            return path
+
+    data_hash = file_content_hash(csv_path)
+    path = os.path.join(cache_dir, data_hash[:16])
+    if not os.path.isfile(os.path.join(path, MANIFEST_FILENAME)):
+        logger.info(f"Building columnar dataset cache for {csv_path}")
+        path = build_dataset_cache(csv_path, cache_dir, data_hash)
+
+    _write_json_atomic(pointer_path, {**signature, 'hash': data_hash})
+    _remove_stale_caches(cache_dir, keep=data_hash[:16])
+    return path
+
+
+def load_training_frame(csv_path, cache_dir):
+    """
+    Load the training data as a DataFrame of memory-mapped, already typed
+    columns, (re)building the columnar cache first if needed.
+
+    The columns are the read-only memmaps themselves, not copies, so loading
+    reads nothing until a column is used; derive new columns rather than
+    assigning into these in place.
+    """
+    path = ensure_dataset_cache(csv_path, cache_dir)
+    manifest = _read_json(os.path.join(path, MANIFEST_FILENAME))
+    # copy=False keeps one block per column; the default consolidates the
+    # float32 columns into one block, copying every memmap into memory
+    return pd.DataFrame({
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        for name in manifest['columns']
+    }, copy=False)
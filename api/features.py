@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .solar import site_daylight_hours
+
+
+# Feature order expected by the light intensity model
+FEATURE_COLUMNS = [
+    'tempmax', 'tempmin', 'temp', 'humidity', 'sealevelpressure',
+    'cloudcover', 'visibility', 'solarradiation', 'windspeed',
+    'precipprob', 'hour', 'day_of_year', 'month', 'is_weekend',
+    'daylight_duration', 'natural_light_index', 'weather_severity'
+]
+
+# Raw weather inputs, in the same order as the first entries of FEATURE_COLUMNS
+WEATHER_COLUMNS = FEATURE_COLUMNS[:10]
+
+DEFAULT_DAYLIGHT_DURATION = 12.0
+
+# Bumped whenever the features computed from the same data change, so saved
+# models trained on the old features are not reused (see model_registry)
+FEATURES_VERSION = 2
+
+# Stats fitted on harareweather2.csv. Only used for the rule-based fallback
+# before a trained model (and its own fitted stats) is available.
+FALLBACK_NORMALIZATION_STATS = {
+    'visibility_q95': 30.0,
+    'windspeed_q95': 18.4,
+    'natural_light_index_q95': 118.2,
+}
+
+
+def natural_light_index(solarradiation, cloudcover, visibility, visibility_q95):
+    return solarradiation * (100 - cloudcover) / 100 * visibility / max(visibility_q95, 1)
+
+
+def weather_severity(windspeed, precipprob, cloudcover, windspeed_q95):
+    return (
+        windspeed / max(windspeed_q95, 1) * 0.3 +
+        precipprob / 100 * 0.4 +
+        cloudcover / 100 * 0.3
+    )
+
+
+class FeaturePipeline:
+    """
+    Builds model features from weather data using normalization stats fitted
+    once on the training set, so online features match the training features.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = dict(stats) if stats else {}
+        self._local = threading.local()
+
+    @property
+    def is_fitted(self):
+        return bool(self.stats)
+
+    def fit(self, df):
+        """Fit the normalization stats (95th percentiles) on a training DataFrame"""
+        visibility_q95 = float(df['visibility'].quantile(0.95))
+        windspeed_q95 = float(df['windspeed'].quantile(0.95))
+        light_index = natural_light_index(df['solarradiation'], df['cloudcover'], df['visibility'], visibility_q95)
+        self.stats = {
+            'visibility_q95': visibility_q95,
+            'windspeed_q95': windspeed_q95,
+            'natural_light_index_q95': float(light_index.quantile(0.95)),
+        }
+        return self
+
+    def add_features(self, df):
+        """Add the derived feature columns to `df` in place and return it"""
+        if not self.is_fitted:
+            raise ValueError("FeaturePipeline is not fitted")
+
+        df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+        df['hour'] = df['datetime'].dt.hour
+        df['day_of_year'] = df['datetime'].dt.dayofyear
+        df['month'] = df['datetime'].dt.month
+        df['is_weekend'] = df['datetime'].dt.weekday >= 5
+
+        # From the solar geometry rather than the data's sunrise/sunset columns,
+        # so training sees the same daylight values as live predictions
+        df['daylight_duration'] = site_daylight_hours(df['datetime'])
+
+        df['natural_light_index'] = natural_light_index(
+            df['solarradiation'], df['cloudcover'], df['visibility'], self.stats['visibility_q95']
+        )
+        df['weather_severity'] = weather_severity(
+            df['windspeed'], df['precipprob'], df['cloudcover'], self.stats['windspeed_q95']
+        )
+        return df
+
+    def transform(self, df):
+        """Return the N x 17 float32 feature matrix for a DataFrame of weather rows"""
+        features = self.add_features(df.copy())[FEATURE_COLUMNS].fillna(0)
+        return features.to_numpy(dtype=np.float32)
+
+    def row_buffer(self):
+        """A reusable 1 x 17 float32 buffer owned by the calling thread"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.zeros((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+        return buffer
+
+    def transform_one(self, weather, when, daylight_duration=DEFAULT_DAYLIGHT_DURATION, out=None):
+        """
+        Build the features for a single reading straight into a float32 buffer.
+
+        `weather` maps each name in WEATHER_COLUMNS to its value and `when` is
+        the datetime of the reading. Writes into `out` (default: this thread's
+        row buffer) and returns it.
+        """
+        if out is None:
+            out = self.row_buffer()
+        row = out.reshape(-1)
+
+        for i, name in enumerate(WEATHER_COLUMNS):
+            row[i] = weather[name]
+
+        row[10] = when.hour
+        row[11] = when.timetuple().tm_yday
+        row[12] = when.month
+        row[13] = 1 if when.weekday() >= 5 else 0
+        row[14] = daylight_duration
+        row[15] = natural_light_index(
+            weather['solarradiation'], weather['cloudcover'], weather['visibility'], self.stats['visibility_q95']
+        )
+        row[16] = weather_severity(
+            weather['windspeed'], weather['precipprob'], weather['cloudcover'], self.stats['windspeed_q95']
+        )
+        return out
+
+    def transform_hours(self, weather, local_times, daylight_duration=DEFAULT_DAYLIGHT_DURATION, out=None):
+        """
+        Vectorized transform_one for N readings, e.g. an hourly forecast.
+
+        `weather` maps each name in WEATHER_COLUMNS to a length-N array,
+        `local_times` is a datetime64 array of the readings' local wall-clock
+        times and `daylight_duration` a scalar or length-N array. Returns the
+        N x 17 float32 matrix (written into `out` if given).
+        """
+        local_times = np.asarray(local_times, dtype='datetime64[s]')
+        n_rows = local_times.shape[0]
+        if out is None:
+            out = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+
+        for i, name in enumerate(WEATHER_COLUMNS):
+            out[:, i] = weather[name]
+
+        days = local_times.astype('datetime64[D]')
+        out[:, 10] = (local_times - days).astype('timedelta64[h]').astype(np.int64)
+        out[:, 11] = (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+        out[:, 12] = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        # 1970-01-01 was a Thursday (weekday 3)
+        out[:, 13] = (days.astype(np.int64) + 3) % 7 >= 5
+        out[:, 14] = daylight_duration
+        out[:, 15] = natural_light_index(
+            np.asarray(weather['solarradiation'], dtype=np.float64), np.asarray(weather['cloudcover'], dtype=np.float64),
+            np.asarray(weather['visibility'], dtype=np.float64), self.stats['visibility_q95']
+        )
+        out[:, 16] = weather_severity(
+            np.asarray(weather['windspeed'], dtype=np.float64), np.asarray(weather['precipprob'], dtype=np.float64),
+            np.asarray(weather['cloudcover'], dtype=np.float64), self.stats['windspeed_q95']
+        )
+        return out
+
+    def to_dict(self):
+        return dict(self.stats)
+
+    @classmethod
+    def from_dict(cls, stats):
+        return cls(stats)
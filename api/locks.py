@@ -0,0 +1,99 @@
+"""
+Cross-process locks on lock files in LOCK_DIR.
+
+A FileLock is an flock() on its own file, so exactly one holder gets it,
+across processes as well as threads (every acquisition opens its own file
+description), and the kernel releases it if the holder dies. Where fcntl is
+not available, creating the lock file with O_CREAT | O_EXCL is the lock
+instead, and a lock file older than `stale_after` seconds is taken over.
+
+Locks are per host, like the file-based weather cache they guard.
+"""
+import hashlib
+import os
+import re
+import time
+from contextlib import suppress
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+POLL_INTERVAL = 0.05
+
+
+def lock_path(name):
+    """Lock file for `name`: a readable prefix plus a hash, so any string is a valid name"""
+    readable = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:80]
+    digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+    return os.path.join(settings.LOCK_DIR, f'{readable}-{digest}.lock')
+
+
+class FileLock:
+    def __init__(self, name, stale_after=None):
+        self.name = name
+        self.path = lock_path(name)
+        self.stale_after = stale_after
+        self._fd = None
+
+    def acquire(self, timeout=0):
+        """Take the lock, waiting up to `timeout` seconds; False if it could not be taken"""
+        deadline = time.monotonic() + timeout
+        while not self._try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def _try_acquire(self):
+        if self._fd is not None:
+            raise RuntimeError(f"Lock {self.name} is already held by this FileLock")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+        try:
+            self._fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            return True
+        except FileExistsError:
+            if self.stale_after is not None:
+                with suppress(FileNotFoundError):
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.unlink(self.path)
+            return False
+
+    def release(self):
+        """Release the lock if held (from any thread)"""
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        else:
+            os.close(fd)
+            with suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise TimeoutError(f"Lock {self.name} is held elsewhere")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,121 @@
+"""
+Non-blocking, structured logging.
+
+Request threads only put records on a bounded in-memory queue; a single
+listener thread formats them and writes them to the sinks: a rotating file
+of JSON lines and, optionally, the console. When the queue is full (the
+sinks cannot keep up) records are dropped and counted rather than making
+requests wait on disk or stdout.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, `extra` fields and any traceback"""
+
+    def format(self, record):
+        payload = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        if record.stack_info:
+            payload['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that owns its sinks and the QueueListener feeding them.
+
+    Configured from LOGGING like any handler class: `filename`, `max_bytes`
+    and `backup_count` set up the rotating JSON file, `console` is 'text',
+    'json' or 'off', and `queue_size` bounds the queue.
+    """
+
+    def __init__(self, filename=None, max_bytes=10 * 2 ** 20, backup_count=5, console='text',
+                 queue_size=10000, level=logging.NOTSET):
+        # SimpleQueue is the cheapest put; the bound is enforced in enqueue
+        super().__init__(queue.SimpleQueue())
+        self.setLevel(level)
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.closed = False
+        self.sinks = []
+        if filename:
+            file_sink = logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True
+            )
+            file_sink.setFormatter(JsonFormatter())
+            self.sinks.append(file_sink)
+        if console != 'off':
+            console_sink = logging.StreamHandler(sys.stderr)
+            console_sink.setFormatter(
+                JsonFormatter() if console == 'json'
+                else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+            )
+            self.sinks.append(console_sink)
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            # The listener thread does not survive a fork; the child starts its own
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, *self.sinks, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Flush queued records to the sinks and stop the listener"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _restart_after_fork(self):
+        if self.closed:
+            return
+        self.queue = queue.SimpleQueue()
+        self.start()
+
+    def prepare(self, record):
+        # Only resolve the message here (args may change after the call);
+        # formatting happens on the listener thread. Other handlers of the
+        # record get the same message, so the record is updated in place.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+    def close(self):
+        self.closed = True
+        self.stop()
+        for sink in self.sinks:
+            sink.close()
+        super().close()
+
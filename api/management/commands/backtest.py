@@ -0,0 +1,95 @@
+"""
+Backtest the light intensity model over rolling-origin folds (api.backtest).
+
+    python manage.py backtest [--initial-days 90] [--horizon-days 30] [--workers N] [--json]
+
+The serving hyperparameters are used (DEFAULT_MODEL_PARAMS with the
+ML_MODEL_PARAMS overrides), so the model the servers would train is the
+one scored. Prints per-fold, per-month and per-hour-of-day MAE, R² and
+on/off accuracy, with wall times.
+"""
+import json
+import math
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _format(value, spec):
+    return '-' if value is None or (isinstance(value, float) and math.isnan(value)) else format(value, spec)
+
+
+def _nan_to_none(value):
+    # NaN R² (groups whose intensity does not vary) is written as null
+    if isinstance(value, dict):
+        return {str(key): _nan_to_none(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_nan_to_none(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class Command(BaseCommand):
+    help = "Backtest the light intensity model over rolling-origin time-series folds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', default=None,
+                            help="training CSV (default: TRAINING_DATA_PATH)")
+        parser.add_argument('--initial-days', type=float, default=90,
+                            help="days of data before the first fold's origin")
+        parser.add_argument('--horizon-days', type=float, default=30,
+                            help="days each fold is scored on; also the step between origins")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="worker processes (default: one per core, at most one per fold)")
+        parser.add_argument('--json', action='store_true', help="print the report as JSON")
+
+    def handle(self, *args, **options):
+        from api.backtest import run_backtest
+        from api.model_registry import read_training_data
+        from api.responses import NumpyJSONEncoder
+
+        csv_path = options['data'] or settings.TRAINING_DATA_PATH
+        if not os.path.isfile(csv_path):
+            raise CommandError(f"Training data not found: {csv_path}")
+        dataset_cache_dir = settings.DATASET_CACHE_DIR if options['data'] is None else None
+
+        try:
+            report = run_backtest(
+                read_training_data(csv_path, dataset_cache_dir),
+                initial_days=options['initial_days'],
+                horizon_days=options['horizon_days'],
+                workers=options['workers'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            report['by_month'] = report['by_month'].to_dict('index')
+            report['by_hour'] = report['by_hour'].to_dict('index')
+            self.stdout.write(json.dumps(_nan_to_none(report), cls=NumpyJSONEncoder, indent=2))
+            return
+
+        write = self.stdout.write
+        write(f"{'fold':>4s} {'test from':>19s} {'train rows':>10s} {'test rows':>9s} "
+              f"{'MAE':>7s} {'R²':>7s} {'on/off':>7s} {'trees':>5s} {'seconds':>7s}")
+        for fold in report['folds']:
+            write(f"{fold['fold']:4d} {fold['test_from']:>19s} {fold['train_rows']:10d} {fold['test_rows']:9.0f} "
+                  f"{fold['mae']:7.3f} {_format(fold['r2'], '7.4f'):>7s} {fold['on_off_accuracy']:7.1%} "
+                  f"{fold['trees']:5d} {fold['seconds']:7.2f}")
+
+        for title, table in (('month', report['by_month']), ('hour', report['by_hour'])):
+            write(f"\n{title:>7s} {'rows':>6s} {'MAE':>7s} {'R²':>7s} {'on/off':>7s}")
+            for key, row in table.iterrows():
+                write(f"{key!s:>7s} {row['rows']:6.0f} {row['mae']:7.3f} {_format(row['r2'], '7.4f'):>7s} "
+                      f"{row['on_off_accuracy']:7.1%}")
+
+        overall = report['overall']
+        fold_seconds = sum(fold['seconds'] for fold in report['folds'])
+        write(f"\noverall: MAE {overall['mae']:.3f}, R² {_format(overall['r2'], '.4f')}, "
+              f"on/off accuracy {overall['on_off_accuracy']:.1%} "
+              f"(intensity > 15 on the targets themselves: {overall['on_off_ceiling']:.1%})")
+        write(f"wall time {report['seconds']:.2f}s: features {report['features_seconds']:.2f}s, "
+              f"{len(report['folds'])} folds {fold_seconds:.2f}s of fold time on "
+              f"{report['workers']} worker(s) x {report['threads_per_worker']} thread(s)")
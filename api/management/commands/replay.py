@@ -0,0 +1,61 @@
+"""
+Replay weather history through the serving model's decisions (api.replay).
+
+    python manage.py replay [--data history.csv] [--simulate air_quality traffic] [--seed 0]
+                            [--by month|hour] [--output decisions.csv]
+
+Prints the per-month (or per-hour-of-day) summary and the totals, and
+writes the per-hour decision frame to --output if given.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Replay weather history through the decision pipeline and summarize what the lights would have done"
+
+    def add_arguments(self, parser):
+        from api.replay import DEFAULT_SIMULATE, SIMULATED_COLUMNS
+
+        parser.add_argument('--data', default=None,
+                            help="history CSV in the training data's layout (default: TRAINING_DATA_PATH)")
+        parser.add_argument('--simulate', nargs='*', choices=sorted(SIMULATED_COLUMNS), default=list(DEFAULT_SIMULATE),
+                            help="adjustment inputs to simulate where the history has none")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--by', choices=['month', 'hour'], default='month')
+        parser.add_argument('--output', default=None, help="write the per-hour decisions to this CSV")
+
+    def handle(self, *args, **options):
+        from api.model_registry import read_training_data
+        from api.model_service import get_model_system
+        from api.replay import replay, summarize
+
+        csv_path = options['data'] or settings.TRAINING_DATA_PATH
+        if not os.path.isfile(csv_path):
+            raise CommandError(f"History not found: {csv_path}")
+        history = read_training_data(csv_path, settings.DATASET_CACHE_DIR if options['data'] is None else None)
+        system = get_model_system()
+
+        started = time.perf_counter()
+        decisions = replay(system, history, simulate=options['simulate'], seed=options['seed'])
+        table = summarize(decisions, options['by'])
+        summary = summarize(decisions)
+        seconds = time.perf_counter() - started
+
+        write = self.stdout.write
+        write(f"{options['by']:>8s} {'hours':>6s} {'on':>6s} {'rules on':>8s} {'mean':>6s} {'mean on':>7s} "
+              f"{'full-power h':>12s} {'agreement':>9s}")
+        for key, row in table.iterrows():
+            write(f"{key!s:>8s} {row['hours']:6.0f} {row['hours_on']:6.0f} {row['rule_hours_on']:8.0f} "
+                  f"{row['mean_intensity']:6.1f} {row['mean_intensity_when_on']:7.1f} "
+                  f"{row['full_power_hours']:12.1f} {row['rule_agreement']:9.1%}")
+        write(f"\n{summary['hours']:.0f} hours: lights on {summary['hours_on']:.0f} "
+              f"(rules: {summary['rule_hours_on']:.0f}), mean intensity {summary['mean_intensity']:.1f}, "
+              f"{summary['full_power_hours']:.0f} full-power hours; replayed in {seconds:.3f}s")
+
+        if options['output']:
+            decisions.to_csv(options['output'], index=False)
+            write(self.style.SUCCESS(f"Wrote {len(decisions)} hourly decisions to {options['output']}"))
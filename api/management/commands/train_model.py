@@ -0,0 +1,123 @@
+"""
+Train the light intensity model outside the server and save it as an artifact.
+
+    python manage.py train_model [--n-jobs 8] [--tree-method hist] [--max-bin 256]
+                                 [--n-estimators 1000 --early-stopping-rounds 20]
+
+Hyperparameters start from the serving ones (DEFAULT_MODEL_PARAMS with the
+ML_MODEL_PARAMS overrides) and the options replace single values. The
+artifact is saved under the key for the training data and hyperparameters,
+which is the key servers look up when they start and which the model
+updater checks every MODEL_UPDATE_INTERVAL. With the serving hyperparameters,
+running servers switch to the new model at their next check. A model with
+other hyperparameters is served only once ML_MODEL_PARAMS is set to match,
+and the command prints the setting to use. --n-jobs sets thread counts only
+and is not part of the key.
+"""
+import json
+import os
+import resource
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Train the light intensity model and save the artifact that servers load"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', default=None,
+                            help="training CSV (default: TRAINING_DATA_PATH)")
+        parser.add_argument('--model-dir', default=None,
+                            help="artifact directory (default: ML_MODEL_DIR)")
+        parser.add_argument('--n-jobs', type=int, default=None,
+                            help="training threads (default: every core available to the process)")
+        parser.add_argument('--tree-method', choices=['hist', 'approx', 'exact'], default=None)
+        parser.add_argument('--max-bin', type=int, default=None,
+                            help="histogram bins per feature (hist and approx)")
+        parser.add_argument('--n-estimators', type=int, default=None)
+        parser.add_argument('--max-depth', type=int, default=None)
+        parser.add_argument('--learning-rate', type=float, default=None)
+        parser.add_argument('--early-stopping-rounds', type=int, default=None,
+                            help="stop once the held-out MAE has not improved for this many rounds (0: off)")
+        parser.add_argument('--no-save', action='store_true',
+                            help="train and report without writing an artifact")
+
+    def handle(self, *args, **options):
+        # Imported here so other management commands do not pay for xgboost
+        from threadpoolctl import threadpool_info, threadpool_limits
+
+        from api.dataset import file_content_hash, source_hash
+        from api.ml_model import DEFAULT_MODEL_PARAMS
+        from api.model_registry import (
+            artifact_key, available_cores, new_version_dir, serving_model_params, train_system
+        )
+
+        csv_path = options['data'] or settings.TRAINING_DATA_PATH
+        model_dir = options['model_dir'] or settings.ML_MODEL_DIR
+        if not os.path.isfile(csv_path):
+            raise CommandError(f"Training data not found: {csv_path}")
+        n_jobs = options['n_jobs'] or available_cores()
+
+        serving_params = serving_model_params()
+        model_params = dict(serving_params)
+        for name in ('tree_method', 'max_bin', 'n_estimators', 'max_depth', 'learning_rate', 'early_stopping_rounds'):
+            if options[name] is not None:
+                model_params[name] = options[name]
+        if not model_params.get('early_stopping_rounds'):
+            model_params.pop('early_stopping_rounds', None)
+
+        # The default training data goes through the dataset cache, as in the servers
+        if options['data'] is None:
+            dataset_cache_dir = settings.DATASET_CACHE_DIR
+            data_hash = source_hash(csv_path, dataset_cache_dir)
+        else:
+            dataset_cache_dir = None
+            data_hash = file_content_hash(csv_path)
+
+        self.stdout.write(f"Training on {csv_path} with {n_jobs} thread(s)")
+        self.stdout.write(f"Hyperparameters: {json.dumps(model_params, sort_keys=True)}")
+
+        started = time.perf_counter()
+        # Caps the OpenMP and BLAS pools used by XGBoost, NumPy and scikit-learn
+        with threadpool_limits(limits=n_jobs):
+            pools = sorted({f"{pool['internal_api']} ({pool['num_threads']})" for pool in threadpool_info()})
+            system = train_system(
+                csv_path,
+                model_params,
+                dataset_cache_dir,
+                n_jobs=n_jobs,
+                visual_crossing_api_key=settings.VISUAL_CROSSING_API_KEY,
+                openweather_api_key=settings.OPENWEATHER_API_KEY,
+            )
+        wall_time = time.perf_counter() - started
+        # ru_maxrss is in kilobytes on Linux, and covers the whole process
+        # (Django, the data load), not training alone
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        metrics = system.metrics
+        self.stdout.write(f"Thread pools: {', '.join(pools) or 'none detected'}")
+        self.stdout.write(f"Wall time: {wall_time:.2f}s")
+        self.stdout.write(f"Process peak RSS: {peak_rss_mb:.0f} MB")
+        self.stdout.write(f"Test split MAE: {metrics['mae']:.4f}  R²: {metrics['r2']:.4f}  trees: {metrics['trees']}")
+
+        if options['no_save']:
+            return
+        key = artifact_key(data_hash, model_params)
+        path = new_version_dir(model_dir, key)
+        try:
+            system.save_model(path, data_hash=data_hash)
+        except OSError as e:
+            raise CommandError(f"Could not save model artifact to {path}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Saved model artifact {path}"))
+
+        if model_params != serving_params:
+            overrides = {
+                name: value for name, value in model_params.items()
+                if name not in DEFAULT_MODEL_PARAMS or DEFAULT_MODEL_PARAMS[name] != value
+            }
+            self.stdout.write(
+                "Servers use other hyperparameters; to serve this model set "
+                f"ML_MODEL_PARAMS='{json.dumps(overrides, sort_keys=True)}'"
+            )
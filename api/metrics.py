@@ -0,0 +1,226 @@
+"""
+In-process latency histograms and error counters, exported in the
+Prometheus text format at /api/metrics/.
+
+Views time their stages with a StageTimer, which records each stage in
+STAGE_SECONDS and renders the same timings as a Server-Timing header.
+Upstream calls are timed and their failures counted in api.upstream.
+Metrics are per process: with several workers, Prometheus scrapes each
+one (or aggregates them with its own relabelling).
+"""
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Seconds; covers a sub-millisecond booster call up to a slow upstream timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple([labels[name] for name in self.labelnames])
+        except KeyError:
+            pass
+        raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for suffix, pairs, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield '_total', list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in values:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', pairs + [('le', _format_value(float(bound)))], cumulative
+            yield '_sum', pairs, total
+            yield '_count', pairs, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+    def _reset_after_fork(self):
+        # A forked worker starts its own series, with locks nobody holds
+        for metric in self._metrics:
+            metric._lock = threading.Lock()
+            metric._values = {}
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'streetlight_stage_duration_seconds', 'Time spent in each stage of a request.', ('view', 'stage')
+))
+UPSTREAM_SECONDS = registry.register(Histogram(
+    'streetlight_upstream_request_duration_seconds', 'Upstream API call latency, retries included.', ('upstream',)
+))
+UPSTREAM_ERRORS = registry.register(Counter(
+    'streetlight_upstream_errors', 'Failed upstream API calls by kind of failure.', ('upstream', 'error')
+))
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry._reset_after_fork)
+
+
+class StageTimer:
+    """
+    Times the stages of one request. Every stage is observed in STAGE_SECONDS
+    under the view's name and listed in the response's Server-Timing header.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.stages = []
+        self._started = time.perf_counter()
+
+    def record(self, stage, seconds):
+        self.stages.append((stage, seconds))
+        STAGE_SECONDS.observe(seconds, view=self.view, stage=stage)
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    async def timed(self, stage, awaitable):
+        """Await `awaitable` as `stage`; concurrent stages each get their own timing"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def server_timing(self):
+        return ', '.join(f'{stage};dur={seconds * 1e3:.2f}' for stage, seconds in self.stages)
+
+    def finish(self, response):
+        """Record the request total and attach the Server-Timing header to `response`"""
+        self.record('total', time.perf_counter() - self._started)
+        response['Server-Timing'] = self.server_timing()
+        return response
+
+
+def timed_view(name):
+    """
+    View decorator giving the request a StageTimer as `request.stage_timer`
+    and adding Server-Timing to whatever response the view returns.
+    """
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                timer = request.stage_timer = StageTimer(name)
+                return timer.finish(await view(request, *args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timer = request.stage_timer = StageTimer(name)
+            return timer.finish(view(request, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.3 on 2026-10-16 22:55
+
+from datetime import timezone as dt_timezone
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Trunc
+
+
+def backfill_rollups(apps, schema_editor):
+    """Fold predictions logged before this migration into 5-minute rollups"""
+    PredictionLog = apps.get_model("api", "PredictionLog")
+    PredictionRollup = apps.get_model("api", "PredictionRollup")
+    db_alias = schema_editor.connection.alias
+
+    # Aggregate per minute in the database, then fold minutes into buckets
+    minutes = (
+        PredictionLog.objects.using(db_alias)
+        .annotate(minute=Trunc("timestamp", "minute", tzinfo=dt_timezone.utc))
+        .values("minute")
+        .annotate(
+            total=Count("id"),
+            total_intensity=Sum("intensity"),
+            lowest_intensity=Min("intensity"),
+            highest_intensity=Max("intensity"),
+            total_lights_on=Count("id", filter=Q(lights_on=True)),
+            total_confidence=Sum("confidence"),
+        )
+        .order_by("minute")
+    )
+    rollups = {}
+    for row in minutes.iterator():
+        start = row["minute"].replace(minute=row["minute"].minute // 5 * 5)
+        rollup = rollups.get(start)
+        if rollup is None:
+            rollups[start] = PredictionRollup(
+                bucket_start=start,
+                count=row["total"],
+                intensity_sum=row["total_intensity"],
+                intensity_min=row["lowest_intensity"],
+                intensity_max=row["highest_intensity"],
+                lights_on_count=row["total_lights_on"],
+                confidence_sum=row["total_confidence"],
+            )
+            continue
+        rollup.count += row["total"]
+        rollup.intensity_sum += row["total_intensity"]
+        rollup.intensity_min = min(rollup.intensity_min, row["lowest_intensity"])
+        rollup.intensity_max = max(rollup.intensity_max, row["highest_intensity"])
+        rollup.lights_on_count += row["total_lights_on"]
+        rollup.confidence_sum += row["total_confidence"]
+    PredictionRollup.objects.using(db_alias).bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ("api", "0003_predictionlog_timestamp_index"),
+        ("api", "0004_predictionlog_history"),
+    ]
+
+    dependencies = [
+        ("api", "0002_lightcontrolwrite"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PredictionRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField(unique=True)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("intensity_sum", models.FloatField(default=0)),
+                ("intensity_min", models.FloatField()),
+                ("intensity_max", models.FloatField()),
+                ("lights_on_count", models.PositiveIntegerField(default=0)),
+                ("confidence_sum", models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="predictionlog",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="predictionlog",
+            index=models.Index(
+                fields=["timestamp", "id"], name="predictionlog_ts_id_idx"
+            ),
+        ),
+        migrations.RunPython(
+            backfill_rollups, reverse_code=migrations.RunPython.noop, elidable=True
+        ),
+    ]
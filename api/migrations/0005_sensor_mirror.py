@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_predictionlog_history"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SensorSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("channel_id", models.IntegerField(unique=True)),
+                ("last_entry_id", models.IntegerField(default=0)),
+                ("last_polled_at", models.DateTimeField(blank=True, null=True)),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SensorEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("channel_id", models.IntegerField()),
+                ("entry_id", models.IntegerField()),
+                ("created_at", models.DateTimeField(blank=True, null=True)),
+                ("ambient_light", models.FloatField(blank=True, null=True)),
+                ("motion", models.IntegerField(blank=True, null=True)),
+                ("light_control", models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("channel_id", "entry_id"),
+                        name="sensorentry_channel_entry_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_sensor_mirror"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Streetlight",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("channel_id", models.IntegerField(unique=True)),
+                ("read_api_key", models.CharField(blank=True, max_length=64)),
+                ("write_api_key", models.CharField(blank=True, max_length=64)),
+                (
+                    "area",
+                    models.CharField(
+                        db_index=True, default="Harare,Zimbabwe", max_length=100
+                    ),
+                ),
+                ("active", models.BooleanField(default=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
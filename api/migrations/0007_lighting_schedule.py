@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_streetlight"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LightingSchedule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("location", models.CharField(max_length=100)),
+                (
+                    "generated_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("starts_at", models.DateTimeField()),
+                ("ends_at", models.DateTimeField()),
+                ("hours", models.JSONField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["location", "-generated_at"],
+                        name="schedule_location_latest_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_lighting_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lightcontrolwrite",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
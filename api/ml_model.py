@@ -8,13 +8,52 @@ from sklearn.metrics import mean_absolute_error, r2_score
 import xgboost as xgb
 import requests
 import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
+from .weather_cache import fetch_visual_crossing_timeline
+from . import upstream
+from .features import FEATURE_COLUMNS, FeaturePipeline, natural_light_index, weather_severity
+from .solar import cloud_adjusted_irradiance, site_daylight_hours, site_solar_radiation, site_sun
+from .tree_predictor import TreeEnsemblePredictor
 
 
+logger = logging.getLogger(__name__)
 
 
-def create_features(df):
+# Hyperparameters for the light intensity model. Part of the artifact key,
+# so changing them invalidates any saved model. Thread counts (n_jobs) are
+# not hyperparameters and are passed to train_models instead.
+DEFAULT_MODEL_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'random_state': 42,
+    'tree_method': 'hist',
+    'max_bin': 256,
+}
+
+# Trees added to the serving model per incremental update
+DEFAULT_UPDATE_ROUNDS = 20
+
+# Newest share of the training rows held out for early stopping
+EARLY_STOPPING_FRACTION = 0.1
+
+MODEL_FILENAME = 'model.ubj'
+METADATA_FILENAME = 'metadata.json'
+
+# Visual Crossing location used when a caller does not name one
+DEFAULT_LOCATION = "Harare,Zimbabwe"
+
+
+def create_features(df, pipeline=None):
     """
     Create features from your actual Harare weather CSV data
+
+    Composite features are normalized with `pipeline`'s stats; if no fitted
+    pipeline is given, one is fitted on `df`.
     """
     df = df.copy()
     df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
@@ -29,7 +68,7 @@ def create_features(df):
         df['datetime'] = df['datetime'].fillna(first_valid)
     
     # Time-based features
-    df['hour'] = 12 
+    df['hour'] = df['datetime'].dt.hour
     df['day_of_year'] = df['datetime'].dt.dayofyear
     df['month'] = df['datetime'].dt.month
     df['season'] = df['month'].apply(lambda x: (x - 1) // 3)
@@ -39,26 +78,32 @@ def create_features(df):
     default_vals = {
         'tempmax': 20.0, 'tempmin': 10.0, 'temp': 15.0, 'humidity': 60.0,
         'sealevelpressure': 1013.25, 'cloudcover': 50.0, 'visibility': 10.0,
-        'solarradiation': 200.0, 'windspeed': 10.0, 'precipprob': 0.0
+        'windspeed': 10.0, 'precipprob': 0.0
     }
 
     for col, default_val in default_vals.items():
         df[col] = df.get(col, default_val)
         df[col] = df[col].fillna(default_val)
 
-    # Approximate daylight 
-    df['daylight_duration'] = 12
+    # Missing solar radiation is estimated from the sun's position and the cloud cover
+    df['solarradiation'] = df.get('solarradiation', np.nan)
+    missing = df['solarradiation'].isna()
+    if missing.any():
+        df.loc[missing, 'solarradiation'] = site_solar_radiation(
+            df.loc[missing, 'datetime'], df.loc[missing, 'cloudcover']
+        )
+
+    df['daylight_duration'] = site_daylight_hours(df['datetime'])
 
     # Composite light and weather features
-    df['natural_light_index'] = (
-        df['solarradiation'] * (100 - df['cloudcover']) / 100 *
-        df['visibility'] / max(df['visibility'].quantile(0.95), 1)
-    )
+    if pipeline is None or not pipeline.is_fitted:
+        pipeline = FeaturePipeline().fit(df)
 
-    df['weather_severity'] = (
-        df['windspeed'] / max(df['windspeed'].quantile(0.95), 1) * 0.3 +
-        df['precipprob'] / 100 * 0.4 +
-        df['cloudcover'] / 100 * 0.3
+    df['natural_light_index'] = natural_light_index(
+        df['solarradiation'], df['cloudcover'], df['visibility'], pipeline.stats['visibility_q95']
+    )
+    df['weather_severity'] = weather_severity(
+        df['windspeed'], df['precipprob'], df['cloudcover'], pipeline.stats['windspeed_q95']
     )
 
     return df
@@ -66,106 +111,262 @@ def create_features(df):
 
 
 
+def streetlight_rules(hour, cloudcover, visibility, precipprob, natural_light_index, weather_severity, light_index_q95):
+    """
+    Rule-based streetlight decision used to build the training targets.
+    Works on scalars, arrays and Series alike.
+    """
+    rules = {}
+    
+    # Light intensity needed (0-100 scale)
+    # Higher values when less natural light available
+    rules['light_intensity'] = np.clip(
+        100 - (natural_light_index / light_index_q95 * 100),
+        0, 100
+    )
+    
+    # Binary streetlight status
+    rules['lights_on'] = np.asarray(
+        (hour < 6) | (hour > 18) |  # Night hours
+        (cloudcover > 80) |  # Very cloudy
+        (visibility < 5) |   # Poor visibility
+        (precipprob > 70)    # High chance of rain
+    ).astype(int)
+    
+    # Adaptive brightness based on conditions
+    rules['adaptive_brightness'] = np.where(
+        rules['lights_on'] == 1,
+        np.clip(rules['light_intensity'] + weather_severity * 20, 20, 100),
+        0
+    )
+    
+    return rules
+
+
+def apply_adjustments(base_intensity, external_data=None, sensor_data=None):
+    """Adjust a base light intensity for external and IoT sensor data"""
+    # Adjust based on external data
+    if external_data:
+        # Adjust for air quality (poor air quality = more light needed)
+        if external_data.get('air_quality', {}).get('aqi', 50) > 100:
+            base_intensity = min(100, base_intensity * 1.2)
+        
+        # Adjust for traffic (more traffic = more light needed)
+        traffic_factor = (
+            external_data.get('traffic_data', {}).get('pedestrian_count', 0) +
+            external_data.get('traffic_data', {}).get('vehicle_count', 0)
+        ) / 20
+        base_intensity = min(100, base_intensity + traffic_factor)
+    
+    # Adjust based on IoT sensor data
+    if sensor_data:
+        # Real-time ambient light reading
+        ambient_light = sensor_data.get('ambient_light_sensor', 50)
+        if ambient_light < 20:  # Very dark
+            base_intensity = max(base_intensity, 80)
+        elif ambient_light > 70:  # Bright enough
+            base_intensity = min(base_intensity, 30)
+        
+        # Motion detection
+        if sensor_data.get('motion_sensor', 0):
+            base_intensity = max(base_intensity, 60)  # Ensure minimum light when motion detected
+    
+    return {
+        'recommended_intensity': max(0, min(100, base_intensity)),
+        'lights_should_be_on': base_intensity > 15,
+        'confidence': min(1.0, abs(base_intensity - 50) / 50)
+    }
+
+
+def apply_adjustments_batch(base_intensity, aqi=None, pedestrian_count=None, vehicle_count=None,
+                            ambient_light=None, motion=None):
+    """
+    apply_adjustments for arrays: each input is None or one value per row
+    of `base_intensity`, and an adjustment is skipped when its inputs are
+    None, as apply_adjustments skips missing external or sensor data.
+    """
+    intensity = np.asarray(base_intensity, dtype=np.float64).reshape(-1)
+    n_rows = intensity.shape[0]
+
+    def as_column(values):
+        column = np.asarray(values, dtype=np.float64).reshape(-1)
+        if column.shape[0] != n_rows:
+            raise ValueError(f"Expected {n_rows} values per column, got {column.shape[0]}")
+        return column
+
+    # Adjust based on external data
+    if aqi is not None:
+        intensity = np.where(as_column(aqi) > 100, np.minimum(100, intensity * 1.2), intensity)
+
+    if pedestrian_count is not None or vehicle_count is not None:
+        traffic = np.zeros(n_rows)
+        if pedestrian_count is not None:
+            traffic += as_column(pedestrian_count)
+        if vehicle_count is not None:
+            traffic += as_column(vehicle_count)
+        intensity = np.minimum(100, intensity + traffic / 20)
+
+    # Adjust based on IoT sensor data
+    if ambient_light is not None:
+        ambient = as_column(ambient_light)
+        intensity = np.where(ambient < 20, np.maximum(intensity, 80), intensity)
+        intensity = np.where(ambient > 70, np.minimum(intensity, 30), intensity)
+
+    if motion is not None:
+        intensity = np.where(as_column(motion) != 0, np.maximum(intensity, 60), intensity)
+
+    return {
+        'recommended_intensity': np.clip(intensity, 0, 100),
+        'lights_should_be_on': intensity > 15,
+        'confidence': np.minimum(1.0, np.abs(intensity - 50) / 50)
+    }
+
+
+def _newest_time(df):
+    """ISO time of the newest row of a feature DataFrame, or None"""
+    if 'datetime' not in df:
+        return None
+    newest = pd.to_datetime(df['datetime'], errors='coerce').max()
+    return None if pd.isna(newest) else newest.isoformat()
+
+
+def _best_iteration_model(model):
+    """A copy of an early-stopped XGBRegressor without the trees after its best iteration"""
+    booster = model.get_booster()[:model.best_iteration + 1]
+    trimmed = xgb.XGBRegressor()
+    trimmed.load_model(bytearray(booster.save_raw('ubj')))
+    return trimmed
+
+
+def fit_intensity_model(X, y, model_params, n_jobs=None):
+    """
+    Fit the light intensity XGBRegressor on rows in time order. With
+    'early_stopping_rounds' in `model_params`, the newest
+    EARLY_STOPPING_FRACTION of the rows is held out: boosting stops once it
+    stops improving and the trees after the best iteration are dropped.
+    """
+    params = dict(model_params)
+    if n_jobs is not None:
+        params['n_jobs'] = n_jobs
+    model = xgb.XGBRegressor(**params)
+    if params.get('early_stopping_rounds'):
+        n_eval = max(1, int(len(X) * EARLY_STOPPING_FRACTION))
+        model.fit(X.iloc[:-n_eval], y.iloc[:-n_eval], eval_set=[(X.iloc[-n_eval:], y.iloc[-n_eval:])], verbose=False)
+        return _best_iteration_model(model)
+    model.fit(X, y)
+    return model
+
+
+def weather_inputs(current_weather, sun=None):
+    """
+    Raw weather inputs (WEATHER_COLUMNS) from the current conditions returned
+    by get_external_api_data, filling what the API does not provide. Solar
+    radiation is estimated from `sun` (solar.site_sun(), default now) and
+    the cloud cover.
+    """
+    sun = sun or site_sun()
+    return {
+        'tempmax': current_weather['temperature'] + 5,
+        'tempmin': current_weather['temperature'] - 5,
+        'temp': current_weather['temperature'],
+        'humidity': current_weather['humidity'],
+        'sealevelpressure': 1013.25,
+        'cloudcover': current_weather['cloudcover'],
+        'visibility': current_weather['visibility'],
+        'solarradiation': float(cloud_adjusted_irradiance(sun.clear_sky_radiation, current_weather['cloudcover'])),
+        'windspeed': current_weather['wind_speed'],
+        'precipprob': 30,  # Default or get from API
+    }
+
+
+def rule_based_prediction(weather_features, light_index_q95, external_data=None, sensor_data=None):
+    """
+    Prediction from the target rules alone, for use while no trained model
+    is available. Takes the same 17-feature row as make_prediction.
+    """
+    row = np.asarray(weather_features, dtype=np.float64).reshape(-1)
+    rules = streetlight_rules(
+        hour=row[10], cloudcover=row[5], visibility=row[6], precipprob=row[9],
+        natural_light_index=row[15], weather_severity=row[16], light_index_q95=light_index_q95
+    )
+    return apply_adjustments(float(rules['adaptive_brightness']), external_data, sensor_data)
+
+
 class StreetlightMLSystem:
-    def __init__(self, visual_crossing_api_key=None, openweather_api_key=None):
+    def __init__(self, visual_crossing_api_key=None, openweather_api_key=None, model_params=None):
         self.weather_model = None
         self.light_intensity_model = None
         self.is_trained = False
         self.visual_crossing_api_key = visual_crossing_api_key
         self.openweather_api_key = openweather_api_key
+        self.model_params = dict(model_params or DEFAULT_MODEL_PARAMS)
+        self.feature_columns = list(FEATURE_COLUMNS)
+        self.feature_pipeline = FeaturePipeline()
+        # Optional recorder (e.g. api.prediction_log) that is handed every prediction
+        self.prediction_sink = None
+        self.metrics = {}
+        # NumPy export of the booster for single-row predictions
+        self.single_row_predictor = None
+        # Time of the newest training row, where incremental updates continue from
+        self.trained_through = None
+        # Artifact directory this model was loaded from or saved to
+        self.artifact_path = None
         
     def preprocess_weather_data(self, df):
         """Preprocess the weather dataset for ML training"""
         
-        # Convert datetime
-        df['sunrise'] = pd.to_datetime(df['sunrise'], errors='coerce')
-        df['sunset'] = pd.to_datetime(df['sunset'], errors='coerce')
-        df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-        
-        # Create time-based features
-        df['hour'] = df['datetime'].dt.hour
-        df['day_of_year'] = df['datetime'].dt.dayofyear
-        df['month'] = df['datetime'].dt.month
-        df['is_weekend'] = df['datetime'].dt.weekday >= 5
-        
-        # Calculate daylight duration
-        df['daylight_duration'] = (df['sunset'] - df['sunrise']).dt.total_seconds() / 3600
+        # Normalization stats are fitted once and reused on later calls
+        if not self.feature_pipeline.is_fitted:
+            self.feature_pipeline.fit(df)
         
-        # Create composite light features
-        df['natural_light_index'] = (
-            df['solarradiation'] * (100 - df['cloudcover']) / 100 * 
-            df['visibility'] / df['visibility'].quantile(0.95)
-        )
-        
-        # Time to sunrise/sunset in minutes
-        current_time = df['datetime'].dt.time
-        sunrise_time = df['sunrise'].dt.time
-        sunset_time = df['sunset'].dt.time
-        
-        # Weather severity score
-        df['weather_severity'] = (
-            df['windspeed'] / df['windspeed'].quantile(0.95) * 0.3 +
-            df['precipprob'] / 100 * 0.4 +
-            df['cloudcover'] / 100 * 0.3
-        )
-        
-        return df
+        return self.feature_pipeline.add_features(df)
     
     def create_streetlight_targets(self, df):
         """Create target variables for streetlight control"""
-        targets = {}
-        
-        # Light intensity needed (0-100 scale)
-        # Higher values when less natural light available
-        targets['light_intensity'] = np.clip(
-            100 - (df['natural_light_index'] / df['natural_light_index'].quantile(0.95) * 100),
-            0, 100
-        )
-        
-        # Binary streetlight status
-        targets['lights_on'] = (
-            (df['hour'] < 6) | (df['hour'] > 18) |  # Night hours
-            (df['cloudcover'] > 80) |  # Very cloudy
-            (df['visibility'] < 5) |   # Poor visibility
-            (df['precipprob'] > 70)    # High chance of rain
-        ).astype(int)
-        
-        # Adaptive brightness based on conditions
-        targets['adaptive_brightness'] = np.where(
-            targets['lights_on'] == 1,
-            np.clip(targets['light_intensity'] + df['weather_severity'] * 20, 20, 100),
-            0
+        if self.feature_pipeline.is_fitted:
+            light_index_q95 = self.feature_pipeline.stats['natural_light_index_q95']
+        else:
+            light_index_q95 = df['natural_light_index'].quantile(0.95)
+        
+        return streetlight_rules(
+            hour=df['hour'],
+            cloudcover=df['cloudcover'],
+            visibility=df['visibility'],
+            precipprob=df['precipprob'],
+            natural_light_index=df['natural_light_index'],
+            weather_severity=df['weather_severity'],
+            light_index_q95=light_index_q95
         )
-        
-        return targets
     
-    def train_models(self, df):
-        """Train ML models for streetlight prediction"""
-        # Preprocess data
+    def train_models(self, df, n_jobs=None):
+        """
+        Train ML models for streetlight prediction.
+
+        `n_jobs` sets XGBoost's thread count (default: all cores). The model
+        is scored on a random 20% of the rows it never sees. With
+        'early_stopping_rounds' in the model params, the newest rows of the
+        training 80% decide where boosting stops (fit_intensity_model).
+        """
+        # Fit the feature pipeline on this training set, then preprocess
+        self.feature_pipeline = FeaturePipeline().fit(df)
         df_processed = self.preprocess_weather_data(df.copy())
         targets = self.create_streetlight_targets(df_processed)
         
         # Feature selection
-        feature_cols = [
-            'tempmax', 'tempmin', 'temp', 'humidity', 'sealevelpressure',
-            'cloudcover', 'visibility', 'solarradiation', 'windspeed',
-            'precipprob', 'hour', 'day_of_year', 'month', 'is_weekend',
-            'daylight_duration', 'natural_light_index', 'weather_severity'
-        ]
+        feature_cols = self.feature_columns
         
         X = df_processed[feature_cols].fillna(0)
         
         # Train light intensity model
         y_intensity = targets['light_intensity']
         X_train, X_test, y_train, y_test = train_test_split(X, y_intensity, test_size=0.2, random_state=42)
+        # Time order, so early stopping holds out the newest training rows
+        order = np.argsort(df_processed.loc[X_train.index, 'datetime'].to_numpy(), kind='stable')
+        X_train, y_train = X_train.iloc[order], y_train.iloc[order]
         
-        self.light_intensity_model = xgb.XGBRegressor(
-            n_estimators=100,
-            max_depth=6,
-            learning_rate=0.1,
-            random_state=42
-        )
-        self.light_intensity_model.fit(X_train, y_train)
+        model = fit_intensity_model(X_train, y_train, self.model_params, n_jobs=n_jobs)
+        self.light_intensity_model = model
+        trees = model.get_booster().num_boosted_rounds()
         
         # Evaluate model
         y_pred = self.light_intensity_model.predict(X_test)
@@ -173,15 +374,155 @@ class StreetlightMLSystem:
         r2 = r2_score(y_test, y_pred)
         
         
-        print(f"Light Intensity Model Performance:")
-        print(f"MAE: {mae:.2f}")
-        print(f"R² Score: {r2:.3f}")
+        logger.info(
+            f"Light intensity model trained: MAE {mae:.2f}, R² {r2:.3f}, {trees} trees",
+            extra={'mae': float(mae), 'r2': float(r2), 'trees': trees}
+        )
         
         self.is_trained = True
+        self.metrics = {'mae': float(mae), 'r2': float(r2), 'trees': trees}
+        self.trained_through = _newest_time(df_processed)
+        self._build_single_row_predictor()
         return {'mae': mae, 'r2': r2}
+
+    def update_model(self, new_rows, rounds=DEFAULT_UPDATE_ROUNDS, validation_fraction=0.2, reference_rows=None):
+        """
+        Continue boosting from the trained booster on `new_rows` only.
+
+        `new_rows` are raw rows like the training CSV's. Their features use
+        the normalization stats fitted at training time. The newest
+        `validation_fraction` of them is held out. The system itself is left
+        untouched, so predictions in flight keep using it; an updated copy is
+        returned together with a report of the held-out MAE before and after
+        (and on `reference_rows`, older rows checked for regressions).
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
+
+        df = self.preprocess_weather_data(create_features(new_rows, self.feature_pipeline))
+        df = df.sort_values('datetime', kind='stable')
+        X = df[self.feature_columns].fillna(0)
+        y = self.create_streetlight_targets(df)['light_intensity']
+        n_holdout = max(1, int(len(df) * validation_fraction))
+        if len(df) - n_holdout < 1:
+            raise ValueError(f"Need at least 2 new rows to update the model, got {len(df)}")
+
+        # A fixed number of rounds: the held-out rows are for the validation gate
+        model = xgb.XGBRegressor(**{**self.model_params, 'n_estimators': rounds, 'early_stopping_rounds': None})
+        model.fit(X.iloc[:-n_holdout], y.iloc[:-n_holdout], xgb_model=self.light_intensity_model.get_booster())
+
+        updated = StreetlightMLSystem(
+            visual_crossing_api_key=self.visual_crossing_api_key,
+            openweather_api_key=self.openweather_api_key,
+            model_params=self.model_params
+        )
+        updated.light_intensity_model = model
+        updated.feature_columns = list(self.feature_columns)
+        updated.feature_pipeline = FeaturePipeline.from_dict(self.feature_pipeline.to_dict())
+        updated.prediction_sink = self.prediction_sink
+        updated.trained_through = max(filter(None, [self.trained_through, _newest_time(df)]))
+        updated.is_trained = True
+
+        def scores(X_eval, y_eval):
+            before = self.light_intensity_model.predict(X_eval)
+            after = model.predict(X_eval)
+            return {
+                'rows': len(y_eval),
+                'mae_before': float(mean_absolute_error(y_eval, before)),
+                'mae_after': float(mean_absolute_error(y_eval, after)),
+                'r2_after': float(r2_score(y_eval, after)) if len(y_eval) > 1 else None,
+            }
+
+        report = {
+            'train_rows': len(df) - n_holdout,
+            'rounds': rounds,
+            'trees': model.get_booster().num_boosted_rounds(),
+            'holdout': scores(X.iloc[-n_holdout:], y.iloc[-n_holdout:]),
+        }
+        if reference_rows is not None and len(reference_rows):
+            reference = self.preprocess_weather_data(create_features(reference_rows, self.feature_pipeline))
+            report['reference'] = scores(
+                reference[self.feature_columns].fillna(0), self.create_streetlight_targets(reference)['light_intensity']
+            )
+
+        updated.metrics = {
+            'mae': report['holdout']['mae_after'],
+            'r2': report['holdout']['r2_after'],
+            'updated_from': self.artifact_path,
+        }
+        updated._build_single_row_predictor()
+        return updated, report
+
+    def _build_single_row_predictor(self):
+        try:
+            self.single_row_predictor = TreeEnsemblePredictor.from_booster(self.light_intensity_model)
+        except ValueError as e:
+            # Unsupported model layout: single rows go through XGBoost instead
+            logger.warning(f"Single-row predictor unavailable: {e}")
+            self.single_row_predictor = None
+
+    def predict_intensity(self, weather_features):
+        """Base light intensity from the booster for one feature row"""
+        if self.single_row_predictor is not None:
+            return self.single_row_predictor.predict_one(weather_features)
+        row = np.asarray(weather_features, dtype=np.float32).reshape(1, -1)
+        return self.light_intensity_model.predict(row)[0]
+
+    def save_model(self, directory, data_hash=None):
+        """
+        Write the trained booster and its metadata (feature list, normalization
+        stats, hyperparameters, metrics) into `directory`.
+
+        The directory is populated under a temporary name and renamed into
+        place, so a concurrent loader never sees a half-written artifact.
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
+
+        directory = os.fspath(directory)
+        parent = os.path.dirname(directory) or '.'
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+
+        self.light_intensity_model.save_model(os.path.join(tmp_dir, MODEL_FILENAME))
+        metadata = {
+            'data_hash': data_hash,
+            'feature_columns': self.feature_columns,
+            'normalization_stats': self.feature_pipeline.to_dict(),
+            'model_params': self.model_params,
+            'metrics': self.metrics,
+            'trained_through': self.trained_through,
+            'xgboost_version': xgb.__version__,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }
+        with open(os.path.join(tmp_dir, METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        os.replace(tmp_dir, directory)
+        self.artifact_path = directory
+        return metadata
+
+    @classmethod
+    def load_model(cls, directory, **kwargs):
+        """Create a trained system from an artifact written by `save_model`"""
+        directory = os.fspath(directory)
+        with open(os.path.join(directory, METADATA_FILENAME)) as f:
+            metadata = json.load(f)
+
+        system = cls(model_params=metadata['model_params'], **kwargs)
+        system.light_intensity_model = xgb.XGBRegressor()
+        system.light_intensity_model.load_model(os.path.join(directory, MODEL_FILENAME))
+        system.feature_columns = metadata['feature_columns']
+        system.feature_pipeline = FeaturePipeline.from_dict(metadata['normalization_stats'])
+        system.metrics = metadata['metrics']
+        system.trained_through = metadata.get('trained_through')
+        system.artifact_path = directory
+        system.is_trained = True
+        system._build_single_row_predictor()
+        return system
     
 
-    def get_external_api_data(self):
+    def get_external_api_data(self, location=DEFAULT_LOCATION):
         """
         Fetch real data from Visual Crossing Weather API and other sources
         Returns data in the same format as the original simulated data
@@ -189,11 +530,9 @@ class StreetlightMLSystem:
         
         # Check if API key is provided
         if not self.visual_crossing_api_key:
-            print("⚠ No Visual Crossing API key provided, using simulated data")
+            logger.warning("No Visual Crossing API key provided, using simulated data")
             return self._get_simulated_data()
         
-        LOCATION = "Harare,Zimbabwe"  
-        
         # Initialize with default/fallback values
         external_data = {
             'current_weather': {
@@ -214,54 +553,43 @@ class StreetlightMLSystem:
         }
         
         try:
-            # Fetch current weather from Visual Crossing
-            weather_url = f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{LOCATION}/today"
-            weather_params = {
-                'key': self.visual_crossing_api_key,
-                'include': 'current',
-                'elements': 'temp,humidity,cloudcover,visibility,windspeed,conditions,datetime',
-                'unitGroup': 'metric'
-            }
-            
-            print(f"Fetching weather data for {LOCATION}...")
-            weather_response = requests.get(weather_url, params=weather_params, timeout=10)
+            # Fetch current weather from Visual Crossing (shared cache across workers)
+            weather_data = fetch_visual_crossing_timeline(
+                location,
+                'today',
+                self.visual_crossing_api_key,
+                include='current',
+                elements='temp,humidity,cloudcover,visibility,windspeed,conditions,datetime'
+            )
             
-            if weather_response.status_code == 200:
-                weather_data = weather_response.json()
+            # Extract current conditions
+            if 'currentConditions' in weather_data:
+                current = weather_data['currentConditions']
+                
+                external_data['current_weather'] = {
+                    'temperature': float(current.get('temp', 20.0)),
+                    'humidity': float(current.get('humidity', 60)),
+                    'cloudcover': float(current.get('cloudcover', 50)),
+                    'visibility': float(current.get('visibility', 10)),
+                    'wind_speed': float(current.get('windspeed', 10))
+                }
+                
+                logger.debug("Weather data fetched", extra={'location': location, **external_data['current_weather']})
                 
-                # Extract current conditions
-                if 'currentConditions' in weather_data:
-                    current = weather_data['currentConditions']
-                    
-                    external_data['current_weather'] = {
-                        'temperature': float(current.get('temp', 20.0)),
-                        'humidity': float(current.get('humidity', 60)),
-                        'cloudcover': float(current.get('cloudcover', 50)),
-                        'visibility': float(current.get('visibility', 10)),
-                        'wind_speed': float(current.get('windspeed', 10))
-                    }
-                    
-                    print(f"✓ Weather data fetched successfully")
-                    print(f"  Temperature: {external_data['current_weather']['temperature']}°C")
-                    print(f"  Humidity: {external_data['current_weather']['humidity']}%")
-                    print(f"  Cloud Cover: {external_data['current_weather']['cloudcover']}%")
-                    
-                else:
-                    print("⚠ No current conditions found in API response, using defaults")
-                    
             else:
-                print(f"⚠ Weather API request failed: {weather_response.status_code}")
-                if weather_response.status_code == 401:
-                    print("  Check your Visual Crossing API key")
-                elif weather_response.status_code == 429:
-                    print("  API rate limit exceeded")
+                logger.warning("No current conditions found in API response, using defaults", extra={'location': location})
                 
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            hint = {401: ' (check the Visual Crossing API key)', 429: ' (rate limit exceeded)'}.get(status_code, '')
+            logger.warning(f"Weather API request failed: {status_code}{hint}, using default values",
+                           extra={'location': location, 'status_code': status_code})
         except requests.exceptions.Timeout:
-            print("⚠ Weather API request timed out, using default values")
+            logger.warning("Weather API request timed out, using default values", extra={'location': location})
         except requests.exceptions.ConnectionError:
-            print("⚠ Failed to connect to weather API, using default values")
+            logger.warning("Failed to connect to weather API, using default values", extra={'location': location})
         except Exception as e:
-            print(f"⚠ Error fetching weather data: {str(e)}")
+            logger.exception(f"Error fetching weather data: {e}")
         
 
         # if self.openweather_api_key:
@@ -279,16 +607,23 @@ class StreetlightMLSystem:
         
         return external_data
     
+    async def aget_external_api_data(self, location=DEFAULT_LOCATION):
+        """
+        Async get_external_api_data. Runs in a worker thread so it can overlap
+        with other upstream fetches instead of blocking the event loop.
+        """
+        return await sync_to_async(self.get_external_api_data, thread_sensitive=False)(location)
+
     def _get_air_quality_data(self, lat=-17.8252, lon=31.0335):
         """Fetch real air quality data from OpenWeatherMap"""
-        url = f"http://api.openweathermap.org/data/2.5/air_pollution"
+        url = f"{settings.OPENWEATHER_API_URL}/data/2.5/air_pollution"
         params = {
             'lat': lat,
             'lon': lon,
             'appid': self.openweather_api_key
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get(url, params=params)
         
         if response.status_code == 200:
             data = response.json()
@@ -315,7 +650,7 @@ class StreetlightMLSystem:
                 'pm25': round(estimated_pm25, 1)
             }
         except Exception as e:
-            print(f"⚠ Error estimating air quality: {str(e)}")
+            logger.warning(f"Error estimating air quality: {e}")
     
     def _generate_traffic_data(self, external_data):
         """Generate traffic data based on time patterns"""
@@ -348,7 +683,7 @@ class StreetlightMLSystem:
                 'vehicle_count': max(0, base_vehicles + vehicle_variance)
             }
         except Exception as e:
-            print(f"⚠ Error generating traffic data: {str(e)}")
+            logger.warning(f"Error generating traffic data: {e}")
 
     def _get_simulated_data(self):
         """Fallback simulated data (your original function)"""
@@ -378,19 +713,17 @@ class StreetlightMLSystem:
         myReadAPIKey = settings.THINGSPEAK_READ_API_KEY
 
      
-        url = f"https://api.thingspeak.com/channels/{myChannelID}/feeds.json?results=1&api_key={myReadAPIKey}"
+        url = f"{settings.THINGSPEAK_API_URL}/channels/{myChannelID}/feeds.json?results=1&api_key={myReadAPIKey}"
 
         try:
-            print(f"Fetching data from: {url}")
-            response = requests.get(url, timeout=10)
+            response = upstream.get(url)
             response.raise_for_status()  # Raises an HTTPError for bad responses
 
             json_data = response.json()
-            print(f"ThingSpeak response: {json_data}")
 
             # Check if feeds exist and have data
             if 'feeds' not in json_data or not json_data['feeds']:
-                print("No data available from ThingSpeak, using random data")
+                logger.warning("No data available from ThingSpeak, using random data")
                 # Fallback to random data if ThingSpeak is unavailable
                 sensor_data = {
                     'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
@@ -405,7 +738,8 @@ class StreetlightMLSystem:
 
             # Validate that required fields exist
             if 'field1' not in data or 'field2' not in data:
-                print("Missing required sensor data fields, using random data")
+                logger.warning("Missing required sensor data fields, using random data",
+                               extra={'entry_id': data.get('entry_id')})
                 # Fallback to random data if required fields are missing
                 sensor_data = {
                     'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
@@ -425,6 +759,10 @@ class StreetlightMLSystem:
             if motion_sensor is None:
                 motion_sensor = 0
 
+            logger.debug("ThingSpeak reading", extra={
+                'entry_id': data.get('entry_id'), 'ambient_light': ambient_light, 'motion': motion_sensor
+            })
+
             # Return sensor data with ThingSpeak data for ambient light and motion,
             # and random data for other sensors
             sensor_data = {
@@ -438,7 +776,7 @@ class StreetlightMLSystem:
             return sensor_data
 
         except requests.exceptions.Timeout:
-            print("Request to ThingSpeak timed out, using random data")
+            logger.warning("Request to ThingSpeak timed out, using random data")
             sensor_data = {
                 'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
                 'motion_sensor': np.random.choice([0, 1]),  # Motion detected
@@ -448,7 +786,7 @@ class StreetlightMLSystem:
             }
             return sensor_data
         except requests.exceptions.ConnectionError:
-            print("Connection error to ThingSpeak, using random data")
+            logger.warning("Connection error to ThingSpeak, using random data")
             sensor_data = {
                 'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
                 'motion_sensor': np.random.choice([0, 1]),  # Motion detected
@@ -458,7 +796,7 @@ class StreetlightMLSystem:
             }
             return sensor_data
         except requests.exceptions.HTTPError as e:
-            print(f"HTTP error: {e}, using random data")
+            logger.warning(f"ThingSpeak HTTP error: {e}, using random data")
             sensor_data = {
                 'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
                 'motion_sensor': np.random.choice([0, 1]),  # Motion detected
@@ -468,7 +806,7 @@ class StreetlightMLSystem:
             }
             return sensor_data
         except KeyError as e:
-            print(f"KeyError: {e}, using random data")
+            logger.warning(f"Missing ThingSpeak field {e}, using random data")
             sensor_data = {
                 'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
                 'motion_sensor': np.random.choice([0, 1]),  # Motion detected
@@ -478,7 +816,7 @@ class StreetlightMLSystem:
             }
             return sensor_data
         except ValueError as e:
-            print(f"ValueError: {e}, using random data")
+            logger.warning(f"Invalid ThingSpeak value: {e}, using random data")
             sensor_data = {
                 'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
                 'motion_sensor': np.random.choice([0, 1]),  # Motion detected
@@ -488,7 +826,7 @@ class StreetlightMLSystem:
             }
             return sensor_data
         except Exception as e:
-            print(f"Unexpected error: {e}, using random data")
+            logger.exception(f"Unexpected error reading ThingSpeak: {e}, using random data")
             sensor_data = {
                 'ambient_light_sensor': np.random.uniform(0, 100),  # Lux reading
                 'motion_sensor': np.random.choice([0, 1]),  # Motion detected
@@ -498,57 +836,54 @@ class StreetlightMLSystem:
             }
             return sensor_data
         
+    async def asimulate_iot_sensor_data(self):
+        """Async simulate_iot_sensor_data, run in a worker thread like aget_external_api_data"""
+        return await sync_to_async(self.simulate_iot_sensor_data, thread_sensitive=False)()
+
     def make_prediction(self, weather_features, external_data=None, sensor_data=None):
         """Make streetlight control prediction"""
         if not self.is_trained:
             raise ValueError("Model not trained yet!")
         
-        # Base prediction from weather model
-        base_intensity = self.light_intensity_model.predict([weather_features])[0]
+        # Base prediction from weather model (accepts a list or a float32 row buffer)
+        base_intensity = self.predict_intensity(weather_features)
         
-        # Adjust based on external data
-        if external_data:
-            # Adjust for air quality (poor air quality = more light needed)
-            if external_data.get('air_quality', {}).get('aqi', 50) > 100:
-                base_intensity = min(100, base_intensity * 1.2)
-            
-            # Adjust for traffic (more traffic = more light needed)
-            traffic_factor = (
-                external_data.get('traffic_data', {}).get('pedestrian_count', 0) +
-                external_data.get('traffic_data', {}).get('vehicle_count', 0)
-            ) / 20
-            base_intensity = min(100, base_intensity + traffic_factor)
-        
-        # Adjust based on IoT sensor data
-        if sensor_data:
-            # Real-time ambient light reading
-            ambient_light = sensor_data.get('ambient_light_sensor', 50)
-            if ambient_light < 20:  # Very dark
-                base_intensity = max(base_intensity, 80)
-            elif ambient_light > 70:  # Bright enough
-                base_intensity = min(base_intensity, 30)
-            
-            # Motion detection
-            if sensor_data.get('motion_sensor', 0):
-                base_intensity = max(base_intensity, 60)  # Ensure minimum light when motion detected
-        
-        return {
-            'recommended_intensity': max(0, min(100, base_intensity)),
-            'lights_should_be_on': base_intensity > 15,
-            'confidence': min(1.0, abs(base_intensity - 50) / 50)
-        }
+        prediction = apply_adjustments(base_intensity, external_data, sensor_data)
+        if self.prediction_sink is not None:
+            self.prediction_sink.record_prediction(prediction)
+        return prediction
     
+    def make_prediction_batch(self, weather_features, aqi=None, pedestrian_count=None,
+                              vehicle_count=None, ambient_light=None, motion=None, record=True):
+        """
+        Vectorized make_prediction for N rows.
+
+        `weather_features` is an N x 17 array in FEATURE_COLUMNS order. The
+        remaining arguments are optional length-N arrays; an adjustment is
+        skipped when its inputs are None, just as make_prediction skips it
+        when external_data or sensor_data is missing. The booster is invoked
+        once for the whole batch. With record=False the predictions are not
+        passed to the prediction sink (e.g. forecasts rather than served ones).
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
+
+        X = np.asarray(weather_features, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_columns):
+            raise ValueError(f"Expected an N x {len(self.feature_columns)} feature array, got shape {X.shape}")
+        predictions = apply_adjustments_batch(
+            self.light_intensity_model.predict(X), aqi, pedestrian_count, vehicle_count, ambient_light, motion
+        )
+        if record and self.prediction_sink is not None:
+            self.prediction_sink.record_batch(predictions)
+        return predictions
+
     def get_feature_importance(self):
         """Get feature importance from the trained model"""
         if not self.is_trained:
             return None
         
-        feature_names = [
-            'tempmax', 'tempmin', 'temp', 'humidity', 'sealevelpressure',
-            'cloudcover', 'visibility', 'solarradiation', 'windspeed',
-            'precipprob', 'hour', 'day_of_year', 'month', 'is_weekend',
-            'daylight_duration', 'natural_light_index', 'weather_severity'
-        ]
+        feature_names = self.feature_columns
         
         importance_scores = self.light_intensity_model.feature_importances_
         feature_importance = dict(zip(feature_names, importance_scores))
@@ -577,7 +912,7 @@ class StreetlightMLSystem:
             print(f"  {i:2d}. {name:20s}: {value:8.2f}")
 
         # Make base prediction
-        base_intensity = self.light_intensity_model.predict([weather_features])[0]
+        base_intensity = self.predict_intensity(weather_features)
         print(f"\nBase model prediction: {base_intensity:.2f}")
 
         # Apply adjustments step by step
@@ -631,12 +966,7 @@ class StreetlightMLSystem:
 
     def get_expected_features(self):
         """Return the expected feature names in order"""
-        return [
-            'tempmax', 'tempmin', 'temp', 'humidity', 'sealevelpressure',
-            'cloudcover', 'visibility', 'solarradiation', 'windspeed',
-            'precipprob', 'hour', 'day_of_year', 'month', 'is_weekend',
-            'daylight_duration', 'natural_light_index', 'weather_severity'
-        ]
+        return list(self.feature_columns)
 
     def validate_features(self, weather_features):
         """Validate that features are in expected ranges"""
@@ -963,4 +1293,5 @@ def debug_model_directly():
         
         
         
-example_usage()
\ No newline at end of file
+if __name__ == "__main__":
+    example_usage()
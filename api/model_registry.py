@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+from django.conf import settings
+
+from .dataset import file_content_hash, load_training_frame, source_hash
+from .features import FEATURES_VERSION
+from .ml_model import StreetlightMLSystem, create_features, DEFAULT_MODEL_PARAMS, METADATA_FILENAME, MODEL_FILENAME
+
+
+logger = logging.getLogger(__name__)
+
+
+def params_hash(model_params):
+    """Return a short stable hash of the model hyperparameters"""
+    encoded = json.dumps(model_params, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+def artifact_key(data_hash, model_params):
+    """
+    Key that identifies a model artifact: the training CSV content hash, the
+    hyperparameters and the feature version. A change to any of them means
+    the model must be retrained.
+    """
+    return f"{data_hash[:16]}-{params_hash(model_params)}-f{FEATURES_VERSION}"
+
+
+def available_cores():
+    """CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def serving_model_params():
+    """DEFAULT_MODEL_PARAMS with the ML_MODEL_PARAMS overrides, the hyperparameters servers load"""
+    return {**DEFAULT_MODEL_PARAMS, **settings.ML_MODEL_PARAMS}
+
+
+def list_artifacts(model_dir, key):
+    """Return the version directories stored under `key`, newest first"""
+    key_dir = os.path.join(model_dir, key)
+    if not os.path.isdir(key_dir):
+        return []
+
+    versions = []
+    for name in os.listdir(key_dir):
+        path = os.path.join(key_dir, name)
+        if name.startswith('.'):
+            continue
+        if os.path.isfile(os.path.join(path, METADATA_FILENAME)) and os.path.isfile(os.path.join(path, MODEL_FILENAME)):
+            versions.append(path)
+
+    # Version names are UTC timestamps, so lexical order is chronological
+    return sorted(versions, reverse=True)
+
+
+def latest_artifact(model_dir, key):
+    """Return the newest artifact directory for `key`, or None"""
+    artifacts = list_artifacts(model_dir, key)
+    return artifacts[0] if artifacts else None
+
+
+def new_version_dir(model_dir, key):
+    """Return a fresh version directory path under `key`"""
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    return os.path.join(model_dir, key, version)
+
+
+def read_training_data(csv_path, dataset_cache_dir=None):
+    """
+    Read the training data, through the columnar dataset cache when
+    `dataset_cache_dir` is given (no CSV parsing once the cache is built).
+    """
+    if dataset_cache_dir is not None:
+        return load_training_frame(csv_path, dataset_cache_dir)
+    return pd.read_csv(csv_path)
+
+
+def train_system(csv_path, model_params=None, dataset_cache_dir=None, n_jobs=None, **system_kwargs):
+    """Train a new StreetlightMLSystem from the CSV at `csv_path`"""
+    system = StreetlightMLSystem(model_params=model_params, **system_kwargs)
+    df_raw = read_training_data(csv_path, dataset_cache_dir)
+    df = create_features(df_raw)
+    system.train_models(df, n_jobs=n_jobs)
+    return system
+
+
+def load_or_train(csv_path, model_dir, model_params=None, dataset_cache_dir=None, **system_kwargs):
+    """
+    Load the newest artifact matching the training data and hyperparameters,
+    training and saving a new one only if none exists.
+    """
+    model_params = dict(model_params or DEFAULT_MODEL_PARAMS)
+    if dataset_cache_dir is not None:
+        data_hash = source_hash(csv_path, dataset_cache_dir)
+    else:
+        data_hash = file_content_hash(csv_path)
+    key = artifact_key(data_hash, model_params)
+
+    path = latest_artifact(model_dir, key)
+    if path is not None:
+        try:
+            system = StreetlightMLSystem.load_model(path, **system_kwargs)
+            logger.info(f"Loaded model artifact {path}")
+            return system
+        except Exception as e:
+            logger.warning(f"Failed to load model artifact {path}, retraining: {e}")
+
+    logger.info(f"No model artifact for {key}, training from {csv_path}")
+    system = train_system(csv_path, model_params, dataset_cache_dir, **system_kwargs)
+
+    path = new_version_dir(model_dir, key)
+    try:
+        system.save_model(path, data_hash=data_hash)
+        logger.info(f"Saved model artifact {path}")
+    except OSError as e:
+        # Serving still works with the in-memory model
+        logger.warning(f"Could not save model artifact to {path}: {e}")
+
+    return system
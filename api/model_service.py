@@ -0,0 +1,158 @@
+"""
+Process-wide owner of the trained StreetlightMLSystem.
+
+The model is loaded (or trained) at most once per process, under a lock, and
+can be warmed up on a background thread at startup so no request has to wait
+for it. Until it is ready, views can fall back to the rule-based prediction.
+A failed load is retried by requests only after WARMUP_RETRY_INTERVAL.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds after a failed load before requests start another warm-up
+WARMUP_RETRY_INTERVAL = 60
+
+_model_system = None
+_load_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_warmup_error = None
+_warmup_started_at = None
+_warmup_seconds = None
+_failed_at = None
+
+
+def _load():
+    # Imported here so startup (wsgi.py/asgi.py, api.startup) does not pay for xgboost/sklearn
+    from .model_registry import load_or_train, serving_model_params
+    from .prediction_log import prediction_log
+
+    system = load_or_train(
+        settings.TRAINING_DATA_PATH,
+        settings.ML_MODEL_DIR,
+        model_params=serving_model_params(),
+        dataset_cache_dir=settings.DATASET_CACHE_DIR,
+        visual_crossing_api_key=settings.VISUAL_CROSSING_API_KEY,
+        openweather_api_key=settings.OPENWEATHER_API_KEY
+    )
+    # Serving predictions are recorded in PredictionLog
+    if settings.PREDICTION_LOG_ENABLED:
+        system.prediction_sink = prediction_log
+    return system
+
+
+def is_ready():
+    return _model_system is not None
+
+
+def get_model_system(block=True):
+    """
+    Return the trained system. With block=False, return None instead of
+    waiting while the model is still loading (and start warm-up if needed).
+    Within WARMUP_RETRY_INTERVAL of a failed load, blocking calls re-raise
+    its error instead of loading again.
+    """
+    global _model_system, _warmup_error, _failed_at
+    if _model_system is not None:
+        return _model_system
+
+    if not block:
+        start_warmup()
+        return None
+
+    with _load_lock:
+        if _model_system is None:
+            error, failed_at = _warmup_error, _failed_at
+            if error is not None and time.monotonic() - failed_at < WARMUP_RETRY_INTERVAL:
+                raise error
+            try:
+                _model_system = _load()
+            except Exception as e:
+                _warmup_error = e
+                _failed_at = time.monotonic()
+                raise
+    return _model_system
+
+
+def swap_model_system(system):
+    """
+    Serve `system` from now on. The swap is a single reference assignment, so
+    requests already holding the previous system finish with it. The new
+    system keeps recording predictions wherever the previous one did.
+    """
+    global _model_system
+    with _load_lock:
+        if _model_system is not None and system.prediction_sink is None:
+            system.prediction_sink = _model_system.prediction_sink
+        _model_system = system
+
+
+def _warmup():
+    global _warmup_seconds
+    try:
+        get_model_system()
+        _warmup_seconds = time.monotonic() - _warmup_started_at
+        logger.info(f"ML model warm-up finished in {_warmup_seconds:.2f}s")
+    except Exception as e:
+        logger.exception(f"ML model warm-up failed, retrying after {WARMUP_RETRY_INTERVAL}s: {e}")
+
+
+def start_warmup():
+    """
+    Load the model on a background thread unless it is loaded, loading, or
+    its last load failed less than WARMUP_RETRY_INTERVAL seconds ago.
+    """
+    global _warmup_thread, _warmup_error, _warmup_started_at
+    if _model_system is not None:
+        return
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        if _failed_at is not None and time.monotonic() - _failed_at < WARMUP_RETRY_INTERVAL:
+            return
+        _warmup_error = None
+        _warmup_started_at = time.monotonic()
+        _warmup_thread = threading.Thread(target=_warmup, name='ml-model-warmup', daemon=True)
+        _warmup_thread.start()
+
+
+def status():
+    """Readiness details for the load balancer endpoint"""
+    if _model_system is not None:
+        state = 'ready'
+    elif _warmup_error is not None:
+        state = 'failed'
+    elif _warmup_thread is not None and _warmup_thread.is_alive():
+        state = 'loading'
+    else:
+        state = 'idle'
+
+    result = {'status': state, 'ready': state == 'ready'}
+    if _warmup_seconds is not None:
+        result['warmup_seconds'] = round(_warmup_seconds, 3)
+    elif state == 'loading':
+        result['loading_seconds'] = round(time.monotonic() - _warmup_started_at, 3)
+    if _warmup_error is not None:
+        result['error'] = str(_warmup_error)
+        result['retry_in_seconds'] = round(max(0.0, _failed_at + WARMUP_RETRY_INTERVAL - time.monotonic()), 3)
+    return result
+
+
+def _reset_after_fork():
+    # Locks and threads do not survive fork (e.g. gunicorn --preload); a child
+    # that forked mid warm-up starts its own on its first request
+    global _load_lock, _warmup_lock, _warmup_thread
+    _load_lock = threading.Lock()
+    _warmup_lock = threading.Lock()
+    _warmup_thread = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,185 @@
+"""
+Scheduled incremental updates of the serving model.
+
+Every MODEL_UPDATE_INTERVAL seconds the updater checks the training data.
+Rows newer than the serving model's last training row are boosted onto
+the model (StreetlightMLSystem.update_model). The updated model is kept
+only if it passes the validation gate, and is then saved as the artifact
+for the new data and swapped in. Other worker processes find that artifact
+on their next check and load it rather than repeating the update. A
+rejected update leaves a marker file next to its lock, so no process retries
+it until the training data changes. Once the booster would grow past
+MODEL_UPDATE_MAX_TREES, the model is retrained from scratch instead.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+from django.conf import settings
+
+from .dataset import source_hash
+from .locks import FileLock
+
+
+logger = logging.getLogger(__name__)
+
+# Older rows sampled to check an update for regressions on past data
+REFERENCE_SAMPLE_SIZE = 2000
+
+
+def passes_validation(report, tolerance, epsilon):
+    """
+    The gate: held-out (and reference) MAE may rise by at most the relative
+    `tolerance`, plus `epsilon` so a near-zero MAE is not failed by noise.
+    """
+    return all(
+        scores['mae_after'] <= scores['mae_before'] * (1 + tolerance) + epsilon
+        for name, scores in report.items()
+        if name in ('holdout', 'reference')
+    )
+
+
+class ModelUpdater:
+    def __init__(self, interval=None, rounds=None, min_rows=None, max_trees=None, mae_tolerance=None,
+                 mae_epsilon=None):
+        self.interval = interval
+        self.rounds = rounds
+        self.min_rows = min_rows
+        self.max_trees = max_trees
+        self.mae_tolerance = mae_tolerance
+        self.mae_epsilon = mae_epsilon
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _config(self):
+        return (
+            self.interval if self.interval is not None else settings.MODEL_UPDATE_INTERVAL,
+            self.rounds if self.rounds is not None else settings.MODEL_UPDATE_ROUNDS,
+            self.min_rows if self.min_rows is not None else settings.MODEL_UPDATE_MIN_ROWS,
+            self.max_trees if self.max_trees is not None else settings.MODEL_UPDATE_MAX_TREES,
+            self.mae_tolerance if self.mae_tolerance is not None else settings.MODEL_UPDATE_MAE_TOLERANCE,
+            self.mae_epsilon if self.mae_epsilon is not None else settings.MODEL_UPDATE_MAE_EPSILON,
+        )
+
+    def start(self):
+        """Start the updater thread unless it is running or updates are disabled"""
+        if self._config()[0] <= 0:
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='model-updater', daemon=True)
+                self._thread.start()
+
+    def _system_kwargs(self):
+        return {
+            'visual_crossing_api_key': settings.VISUAL_CROSSING_API_KEY,
+            'openweather_api_key': settings.OPENWEATHER_API_KEY,
+        }
+
+    def run_once(self):
+        """
+        Bring the serving model up to date with the training data.
+
+        Returns a report dict with a 'status' of 'loaded', 'updated',
+        'retrained', 'rejected' or 'skipped', or None when there is nothing
+        to do.
+        """
+        # Imported here so starting the updater (api.startup) does not pay for xgboost
+        from .ml_model import StreetlightMLSystem
+        from .model_registry import artifact_key, latest_artifact, new_version_dir
+        from .model_service import get_model_system, swap_model_system
+
+        _, rounds, min_rows, max_trees, mae_tolerance, mae_epsilon = self._config()
+        system = get_model_system()
+        data_hash = source_hash(settings.TRAINING_DATA_PATH, settings.DATASET_CACHE_DIR)
+        key = artifact_key(data_hash, system.model_params)
+
+        path = latest_artifact(settings.ML_MODEL_DIR, key)
+        if path is not None:
+            if path == system.artifact_path:
+                return None
+            # Another process already brought a model up to date with this data
+            swap_model_system(StreetlightMLSystem.load_model(path, **self._system_kwargs()))
+            logger.info(f"Loaded updated model artifact {path}")
+            return {'status': 'loaded', 'path': path}
+
+        lock = FileLock(f'model-update:{key}')
+        # An update of this data rejected by any process is not retried
+        rejected_marker = f'{lock.path}.rejected'
+        if os.path.exists(rejected_marker) or not lock.acquire():
+            return None
+        try:
+            if os.path.exists(rejected_marker) or latest_artifact(settings.ML_MODEL_DIR, key) is not None:
+                # Settled by another process since the checks above
+                return None
+            report = self._update(system, rounds, min_rows, max_trees, mae_tolerance, mae_epsilon)
+            if report['status'] == 'rejected':
+                with open(rejected_marker, 'w') as f:
+                    json.dump(report, f, indent=2)
+            elif report['status'] in ('updated', 'retrained'):
+                candidate = report.pop('system')
+                path = new_version_dir(settings.ML_MODEL_DIR, key)
+                try:
+                    candidate.save_model(path, data_hash=data_hash)
+                except OSError as e:
+                    # Still serve the update from memory; other processes make their own
+                    logger.warning(f"Could not save updated model artifact to {path}: {e}")
+                swap_model_system(candidate)
+                report['path'] = candidate.artifact_path
+                logger.info(f"Model {report['status']} and swapped in", extra=report)
+        finally:
+            lock.release()
+        return report
+
+    def _update(self, system, rounds, min_rows, max_trees, mae_tolerance, mae_epsilon):
+        from .model_registry import read_training_data, train_system
+
+        started = time.perf_counter()
+        df = read_training_data(settings.TRAINING_DATA_PATH, settings.DATASET_CACHE_DIR)
+        times = pd.to_datetime(df['datetime'], errors='coerce')
+
+        trees = system.light_intensity_model.get_booster().num_boosted_rounds()
+        if system.trained_through is None or trees + rounds > max_trees:
+            candidate = train_system(
+                settings.TRAINING_DATA_PATH, system.model_params, settings.DATASET_CACHE_DIR, **self._system_kwargs()
+            )
+            return {'status': 'retrained', 'system': candidate, 'metrics': candidate.metrics,
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+        is_new = times > pd.Timestamp(system.trained_through)
+        new_rows = df[is_new]
+        if len(new_rows) < min_rows:
+            return {'status': 'skipped', 'new_rows': len(new_rows)}
+
+        old_rows = df[~is_new]
+        reference = old_rows.sample(min(len(old_rows), REFERENCE_SAMPLE_SIZE), random_state=42)
+        candidate, report = system.update_model(new_rows, rounds=rounds, reference_rows=reference)
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        if not passes_validation(report, mae_tolerance, mae_epsilon):
+            report['status'] = 'rejected'
+            logger.warning("Model update rejected by the validation gate", extra=report)
+            return report
+        report['status'] = 'updated'
+        report['system'] = candidate
+        return report
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"Model update failed: {e}")
+            time.sleep(self._config()[0])
+
+    def _reset_after_fork(self):
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+
+model_updater = ModelUpdater()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=model_updater._reset_after_fork)
@@ -1,8 +1,121 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class PredictionLog(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the prediction is made, not when the buffered row is written
+    timestamp = models.DateTimeField(default=timezone.now)
     intensity = models.FloatField()
     lights_on = models.BooleanField()
-    confidence = models.FloatField()
\ No newline at end of file
+    confidence = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the prediction history orders on (timestamp, id)
+            models.Index(fields=['timestamp', 'id'], name='predictionlog_ts_id_idx'),
+        ]
+
+
+class PredictionRollup(models.Model):
+    """
+    PredictionLog aggregated into 5-minute buckets, kept up to date as logged
+    predictions are written. History queries read these instead of the log.
+    """
+    bucket_start = models.DateTimeField(unique=True)
+    count = models.PositiveIntegerField(default=0)
+    intensity_sum = models.FloatField(default=0)
+    intensity_min = models.FloatField()
+    intensity_max = models.FloatField()
+    lights_on_count = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0)
+
+
+class LightControlWrite(models.Model):
+    """A requested ThingSpeak light-control write (field3), tracked by ticket"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_SUPERSEDED = 'superseded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_SUPERSEDED, 'Superseded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    ticket = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    channel_id = models.IntegerField()
+    lights_on = models.IntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    # Set when a later request replaced this one before it was sent
+    coalesced_into = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='coalesced')
+    thingspeak_entry_id = models.IntegerField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When a flusher last marked it sending; a stale claim is requeued
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+
+class Streetlight(models.Model):
+    """A light in the fleet: its ThingSpeak channel and the area its weather comes from"""
+    name = models.CharField(max_length=100)
+    channel_id = models.IntegerField(unique=True)
+    read_api_key = models.CharField(max_length=64, blank=True)
+    write_api_key = models.CharField(max_length=64, blank=True)
+    # Visual Crossing location; lights in the same area share one weather lookup
+    area = models.CharField(max_length=100, default='Harare,Zimbabwe', db_index=True)
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} (channel {self.channel_id})'
+
+
+class SensorEntry(models.Model):
+    """A ThingSpeak feed entry mirrored locally by the sensor sync worker"""
+    channel_id = models.IntegerField()
+    entry_id = models.IntegerField()
+    created_at = models.DateTimeField(null=True, blank=True)
+    # field1, field2 and field3 of the channel
+    ambient_light = models.FloatField(null=True, blank=True)
+    motion = models.IntegerField(null=True, blank=True)
+    light_control = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Also the index behind latest-entry and ?since_entry_id= lookups
+            models.UniqueConstraint(fields=['channel_id', 'entry_id'], name='sensorentry_channel_entry_unique'),
+        ]
+
+
+class SensorSyncState(models.Model):
+    """Sync progress for one ThingSpeak channel, shared by all worker processes"""
+    channel_id = models.IntegerField(unique=True)
+    last_entry_id = models.IntegerField(default=0)
+    # Claimed by the process that polls next, so only one polls per interval
+    last_polled_at = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+
+class LightingSchedule(models.Model):
+    """Hour-by-hour lighting plan for an area, predicted in one batch from its hourly forecast"""
+    location = models.CharField(max_length=100)
+    generated_at = models.DateTimeField(default=timezone.now)
+    # First and last forecast hour covered, in UTC
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    # One dict per hour: time, local_time, the prediction and its weather inputs
+    hours = models.JSONField()
+
+    class Meta:
+        indexes = [
+            # The endpoint serves the latest schedule of a location
+            models.Index(fields=['location', '-generated_at'], name='schedule_location_latest_idx'),
+        ]
@@ -0,0 +1,303 @@
+"""
+Downsampled time-series queries over PredictionLog.
+
+Logged predictions are folded into 5-minute PredictionRollup rows as they are
+written, so a bucketed query aggregates at most a few thousand rollups in SQL
+instead of scanning every prediction in the range. Pages are keyset-paginated:
+raw rows on (timestamp, id), buckets on the bucket start, and each bucket page
+spans at most `limit` buckets.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PredictionLog, PredictionRollup
+
+
+BUCKET_SECONDS = {'5m': 300, '1h': 3600, '1d': 86400}
+
+# Width of a PredictionRollup row; every bucket is a multiple of it
+ROLLUP_BUCKET = '5m'
+
+# Trunc kinds of the buckets wider than a rollup
+_TRUNC_KINDS = {'1h': 'hour', '1d': 'day'}
+
+# SQLite datetimes are UTC text 'YYYY-MM-DD HH:MM:SS': the prefix kept by a
+# bucket, and what completes it to the bucket start
+_SQLITE_PREFIXES = {'hour': (13, ':00:00'), 'day': (10, ' 00:00:00')}
+
+# Backends whose INSERT ... ON CONFLICT DO UPDATE adds a batch to existing
+# rollups in one statement, with their two-argument min and max functions
+_UPSERT_FUNCTIONS = {'sqlite': ('min', 'max'), 'postgresql': ('LEAST', 'GREATEST')}
+
+# Range covered when the request gives no start
+DEFAULT_SPANS = {
+    None: timedelta(hours=1),
+    '5m': timedelta(days=1),
+    '1h': timedelta(days=7),
+    '1d': timedelta(days=90),
+}
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 query parameter; naive values are taken as UTC"""
+    if value and 'T' in value:
+        # An unencoded '+' in the UTC offset arrives as a space
+        value = value.replace(' ', '+')
+    parsed = parse_datetime(value) if value else None
+    if parsed is None:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def floor_to_bucket(when, bucket):
+    """Start of the UTC bucket containing `when`"""
+    seconds = BUCKET_SECONDS[bucket]
+    epoch = int(when.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+class TruncRollup(Trunc):
+    """
+    Trunc to an hour or day in UTC. SQLite runs Trunc as a Python function on
+    every row, so there the stored text is cut to the bucket instead.
+    """
+    def __init__(self, expression, kind):
+        super().__init__(expression, kind, tzinfo=dt_timezone.utc)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.lhs)
+        length, suffix = _SQLITE_PREFIXES[self.kind]
+        return f"substr({sql}, 1, {length}) || '{suffix}'", params
+
+
+def record_rollups(rows):
+    """
+    Add (timestamp, intensity, lights_on, confidence) rows to their 5-minute
+    rollups. Call in the same transaction that writes the rows to PredictionLog.
+    """
+    buckets = {}
+    for timestamp, intensity, lights_on, confidence in rows:
+        key = floor_to_bucket(timestamp, ROLLUP_BUCKET)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, intensity, intensity, intensity, int(lights_on), confidence]
+        else:
+            bucket[0] += 1
+            bucket[1] += intensity
+            bucket[2] = min(bucket[2], intensity)
+            bucket[3] = max(bucket[3], intensity)
+            bucket[4] += int(lights_on)
+            bucket[5] += confidence
+
+    if not buckets:
+        return 0
+    if connection.vendor in _UPSERT_FUNCTIONS:
+        _upsert_rollups(buckets)
+    else:
+        _merge_rollups(buckets)
+    return len(buckets)
+
+
+def _upsert_rollups(buckets):
+    least, greatest = _UPSERT_FUNCTIONS[connection.vendor]
+    qn = connection.ops.quote_name
+    table = qn(PredictionRollup._meta.db_table)
+    columns = ['bucket_start', 'count', 'intensity_sum', 'intensity_min', 'intensity_max',
+               'lights_on_count', 'confidence_sum']
+    merge = {
+        'count': '{table}.{column} + excluded.{column}',
+        'intensity_sum': '{table}.{column} + excluded.{column}',
+        'intensity_min': least + '({table}.{column}, excluded.{column})',
+        'intensity_max': greatest + '({table}.{column}, excluded.{column})',
+        'lights_on_count': '{table}.{column} + excluded.{column}',
+        'confidence_sum': '{table}.{column} + excluded.{column}',
+    }
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({qn('bucket_start')}) DO UPDATE SET "
+        + ', '.join(f"{qn(column)} = {expression.format(table=table, column=qn(column))}"
+                    for column, expression in merge.items())
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (connection.ops.adapt_datetimefield_value(key), *values) for key, values in buckets.items()
+        ])
+
+
+def _merge_rollups(buckets):
+    # Other backends: lock the existing rollups, add to them and create the rest
+    existing = PredictionRollup.objects.select_for_update().in_bulk(list(buckets), field_name='bucket_start')
+    created = []
+    for key, (count, intensity_sum, intensity_min, intensity_max, lights_on_count, confidence_sum) in buckets.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            created.append(PredictionRollup(
+                bucket_start=key, count=count, intensity_sum=intensity_sum, intensity_min=intensity_min,
+                intensity_max=intensity_max, lights_on_count=lights_on_count, confidence_sum=confidence_sum,
+            ))
+            continue
+        rollup.count += count
+        rollup.intensity_sum += intensity_sum
+        rollup.intensity_min = min(rollup.intensity_min, intensity_min)
+        rollup.intensity_max = max(rollup.intensity_max, intensity_max)
+        rollup.lights_on_count += lights_on_count
+        rollup.confidence_sum += confidence_sum
+    PredictionRollup.objects.bulk_update(existing.values(), [
+        'count', 'intensity_sum', 'intensity_min', 'intensity_max', 'lights_on_count', 'confidence_sum',
+    ])
+    PredictionRollup.objects.bulk_create(created)
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        after = parse_timestamp(payload['t'])
+        return after, payload.get('id')
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor")
+
+
+def bucket_history(start, end, bucket, limit=DEFAULT_LIMIT):
+    """
+    Aggregate predictions from the bucket containing `start` up to `end` into
+    buckets of `bucket` width. Rollups are whole 5-minute periods, so the
+    range is effectively widened to 5-minute boundaries.
+
+    Returns (rows, next_start): at most `limit` buckets, and where the next
+    page begins (None on the last page). Buckets without predictions are
+    omitted.
+    """
+    seconds = BUCKET_SECONDS[bucket]
+    window_start = floor_to_bucket(start, bucket)
+    window_end = min(end, window_start + timedelta(seconds=seconds * limit))
+
+    if bucket == ROLLUP_BUCKET:
+        key = F('bucket_start')
+    else:
+        key = TruncRollup('bucket_start', _TRUNC_KINDS[bucket])
+    records = (
+        PredictionRollup.objects
+        .filter(bucket_start__gte=window_start, bucket_start__lt=window_end)
+        .annotate(bucket=key)
+        .values('bucket')
+        .annotate(
+            total=Sum('count'),
+            total_intensity=Sum('intensity_sum'),
+            lowest_intensity=Min('intensity_min'),
+            highest_intensity=Max('intensity_max'),
+            total_lights_on=Sum('lights_on_count'),
+            total_confidence=Sum('confidence_sum'),
+        )
+        .order_by('bucket')
+    )
+
+    rows = [
+        {
+            'bucket_start': record['bucket'].astimezone(dt_timezone.utc).isoformat(),
+            'count': record['total'],
+            'avg_intensity': record['total_intensity'] / record['total'],
+            'min_intensity': record['lowest_intensity'],
+            'max_intensity': record['highest_intensity'],
+            'lights_on_fraction': record['total_lights_on'] / record['total'],
+            'avg_confidence': record['total_confidence'] / record['total'],
+        }
+        for record in records
+    ]
+    return rows, (window_end if window_end < end else None)
+
+
+def raw_history(start, end, limit=DEFAULT_LIMIT, after=None):
+    """
+    Individual predictions in [start, end) ordered by (timestamp, id).
+
+    `after` is the (timestamp, id) of the last row of the previous page.
+    Returns (rows, next_key), next_key being None on the last page.
+    """
+    queryset = PredictionLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if after is not None:
+        after_timestamp, after_id = after
+        queryset = queryset.filter(timestamp__gte=after_timestamp).exclude(
+            timestamp=after_timestamp, id__lte=after_id
+        )
+    records = list(
+        queryset
+        .order_by('timestamp', 'id')
+        .values_list('id', 'timestamp', 'intensity', 'lights_on', 'confidence')[:limit + 1]
+    )
+
+    next_key = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_key = (records[-1][1], records[-1][0])
+
+    rows = [
+        {
+            'id': row_id,
+            'timestamp': timestamp.isoformat(),
+            'intensity': intensity,
+            'lights_on': lights_on,
+            'confidence': confidence,
+        }
+        for row_id, timestamp, intensity, lights_on, confidence in records
+    ]
+    return rows, next_key
+
+
+def query_history(params):
+    """
+    Run a history query from request parameters (bucket, start, end, limit,
+    cursor) and return the response payload. Raises ValueError on bad input.
+    """
+    bucket = params.get('bucket') or None
+    if bucket is not None and bucket not in BUCKET_SECONDS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKET_SECONDS)}")
+
+    limit = int(params.get('limit') or DEFAULT_LIMIT)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    end = parse_timestamp(params['end']) if params.get('end') else timezone.now()
+    start = parse_timestamp(params['start']) if params.get('start') else end - DEFAULT_SPANS[bucket]
+    if start >= end:
+        raise ValueError("start must be before end")
+
+    after = decode_cursor(params['cursor']) if params.get('cursor') else None
+
+    if bucket is None:
+        if after is not None and after[1] is None:
+            raise ValueError("Invalid cursor")
+        rows, next_key = raw_history(start, end, limit, after)
+        next_cursor = encode_cursor({'t': next_key[0].isoformat(), 'id': next_key[1]}) if next_key else None
+    else:
+        if after is not None:
+            start = max(start, after[0])
+        rows, next_start = bucket_history(start, end, bucket, limit)
+        next_cursor = encode_cursor({'t': next_start.isoformat()}) if next_start else None
+
+    return {
+        'bucket': bucket or 'raw',
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': len(rows),
+        'results': rows,
+        'next_cursor': next_cursor,
+    }
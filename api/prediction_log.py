@@ -0,0 +1,118 @@
+"""
+Buffered persistence of predictions into PredictionLog.
+
+Recording a prediction only appends a tuple to an in-process buffer; a
+background thread writes the buffer with bulk_create every
+PREDICTION_LOG_BATCH_SIZE rows or PREDICTION_LOG_FLUSH_INTERVAL seconds,
+whichever comes first, and folds the rows into their 5-minute rollups in the
+same transaction.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import PredictionLog
+from .prediction_history import record_rollups
+
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionLogBuffer:
+    def __init__(self, batch_size=None, flush_interval=None, max_buffer=None):
+        self.batch_size = batch_size or settings.PREDICTION_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.PREDICTION_LOG_FLUSH_INTERVAL
+        # Oldest rows are dropped if the database can't keep up
+        self._rows = deque(maxlen=max_buffer or settings.PREDICTION_LOG_MAX_BUFFER)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def record(self, intensity, lights_on, confidence, timestamp=None):
+        """Queue one prediction for writing; never touches the database"""
+        self._rows.append((timestamp or timezone.now(), float(intensity), bool(lights_on), float(confidence)))
+        if self._thread is None:
+            self.start()
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    def record_prediction(self, prediction):
+        """Queue a make_prediction result"""
+        self.record(prediction['recommended_intensity'], prediction['lights_should_be_on'], prediction['confidence'])
+
+    def record_batch(self, predictions):
+        """Queue a make_prediction_batch result, one row per prediction"""
+        now = timezone.now()
+        self._rows.extend(
+            (now, intensity, lights_on, confidence)
+            for intensity, lights_on, confidence in zip(
+                predictions['recommended_intensity'].tolist(),
+                predictions['lights_should_be_on'].tolist(),
+                predictions['confidence'].tolist()
+            )
+        )
+        if self._thread is None:
+            self.start()
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered rows; returns the number written"""
+        with self._flush_lock:
+            rows = []
+            while self._rows and len(rows) < self.batch_size * 10:
+                rows.append(self._rows.popleft())
+            if not rows:
+                return 0
+            try:
+                with transaction.atomic():
+                    PredictionLog.objects.bulk_create(
+                        [
+                            PredictionLog(timestamp=ts, intensity=intensity, lights_on=lights_on, confidence=confidence)
+                            for ts, intensity, lights_on, confidence in rows
+                        ],
+                        batch_size=self.batch_size
+                    )
+                    record_rollups(rows)
+            except Exception as e:
+                logger.error(f"Dropped {len(rows)} prediction log rows: {e}")
+                return 0
+            return len(rows)
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='prediction-log-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            while self.flush():
+                pass
+
+    def _reset_after_fork(self):
+        self._rows.clear()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+
+prediction_log = PredictionLogBuffer()
+
+atexit.register(prediction_log.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=prediction_log._reset_after_fork)
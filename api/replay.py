@@ -0,0 +1,136 @@
+"""
+Replay of weather history through the full decision pipeline.
+
+replay() takes raw hourly weather rows (the training CSV, or any newer
+history in the same layout) and decides every hour the way the live system
+would: features from the model's fitted pipeline, the booster on the whole
+feature matrix at once, then the external and sensor adjustment rules
+(apply_adjustments_batch) as array operations. Nothing is recorded in the
+prediction log.
+
+The adjustments use these history columns when they are present:
+aqi, pedestrian_count, vehicle_count, ambient_light and motion. Missing
+inputs can be simulated the way the live system fills them in:
+'air_quality' estimates the AQI from humidity and visibility
+(_estimate_air_quality), 'traffic' uses the hour-of-day pattern with random
+variance (_generate_traffic_data), and 'sensors' draws the ThingSpeak
+fallback's random readings. Inputs that are neither present nor simulated
+skip their adjustment.
+"""
+import numpy as np
+import pandas as pd
+
+from .ml_model import apply_adjustments_batch, create_features
+
+
+ADJUSTMENT_COLUMNS = ('aqi', 'pedestrian_count', 'vehicle_count', 'ambient_light', 'motion')
+# The adjustment inputs each simulated group provides
+SIMULATED_COLUMNS = {
+    'air_quality': ('aqi',),
+    'traffic': ('pedestrian_count', 'vehicle_count'),
+    'sensors': ('ambient_light', 'motion'),
+}
+# Simulated by default: what the live system derives when its APIs give nothing
+DEFAULT_SIMULATE = ('air_quality', 'traffic')
+
+
+def simulated_conditions(hours, humidity, visibility, simulate=DEFAULT_SIMULATE, seed=None):
+    """
+    Arrays of simulated adjustment inputs for local hours of the day, keyed
+    like ADJUSTMENT_COLUMNS, for the input groups named in `simulate`.
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.asarray(hours)
+    n_rows = hours.shape[0]
+    conditions = {}
+
+    if 'air_quality' in simulate:
+        estimated = np.clip(100 - np.asarray(visibility) * 5 + np.asarray(humidity) * 0.5, 20, 150)
+        conditions['aqi'] = estimated.astype(np.int64)
+
+    if 'traffic' in simulate:
+        rush = ((hours >= 7) & (hours <= 9)) | ((hours >= 17) & (hours <= 19))
+        day = (hours >= 10) & (hours <= 16)
+        evening = (hours >= 20) & (hours <= 23)
+        pedestrians = np.select([rush, day, evening], [40, 25, 30], 5)
+        vehicles = np.select([rush, day, evening], [25, 15, 20], 3)
+        conditions['pedestrian_count'] = np.maximum(0, pedestrians + rng.integers(-10, 11, n_rows))
+        conditions['vehicle_count'] = np.maximum(0, vehicles + rng.integers(-5, 9, n_rows))
+
+    if 'sensors' in simulate:
+        conditions['ambient_light'] = rng.uniform(0, 100, n_rows)
+        conditions['motion'] = rng.integers(0, 2, n_rows)
+
+    return conditions
+
+
+def replay(system, history, simulate=DEFAULT_SIMULATE, seed=0):
+    """
+    Decide every hour of `history` with the trained `system`.
+
+    Returns a DataFrame with one row per hour, in the history's order: the
+    datetime, the booster's base_intensity, the adjustment inputs that were
+    applied, the decision (recommended_intensity, lights_should_be_on,
+    confidence) and the labelling rules' rule_lights_on for comparison.
+    """
+    if not system.is_trained:
+        raise ValueError("Model not trained yet!")
+
+    # With a fitted pipeline create_features already adds every model feature
+    df = create_features(history, system.feature_pipeline)
+    X = df[system.feature_columns].fillna(0).to_numpy(dtype=np.float32)
+    base_intensity = system.light_intensity_model.predict(X).astype(np.float64)
+
+    conditions = {name: history[name].to_numpy() for name in ADJUSTMENT_COLUMNS if name in history}
+    missing = [
+        group for group in simulate
+        if not all(name in conditions for name in SIMULATED_COLUMNS[group])
+    ]
+    if missing:
+        simulated = simulated_conditions(df['hour'].to_numpy(), df['humidity'].to_numpy(),
+                                         df['visibility'].to_numpy(), missing, seed)
+        conditions = {**simulated, **conditions}
+    decisions = apply_adjustments_batch(base_intensity, **conditions)
+
+    return pd.DataFrame({
+        'datetime': df['datetime'].to_numpy(),
+        'base_intensity': base_intensity,
+        **{name: conditions[name] for name in ADJUSTMENT_COLUMNS if name in conditions},
+        **decisions,
+        'rule_lights_on': system.create_streetlight_targets(df)['lights_on'].astype(bool),
+    }, index=history.index)
+
+
+def summarize(decisions, by=None):
+    """
+    Summary of a replay() frame: hours, hours with the lights on, mean
+    intensity overall and while on, full-power equivalent hours (the sum of
+    intensity / 100, a proxy for energy) and agreement with the labelling
+    rules' on/off. With `by` (e.g. 'month', 'hour' or a grouping Series),
+    a DataFrame with one row per group instead of a dict.
+    """
+    frame = decisions.assign(
+        on_intensity=decisions['recommended_intensity'].where(decisions['lights_should_be_on']),
+        full_power_hours=decisions['recommended_intensity'] / 100,
+        agrees=decisions['lights_should_be_on'] == decisions['rule_lights_on'],
+    )
+    if by is None:
+        keys = np.zeros(len(frame), dtype=np.int64)
+    elif isinstance(by, str) and by == 'month':
+        keys = frame['datetime'].dt.to_period('M')
+    elif isinstance(by, str) and by == 'hour':
+        keys = frame['datetime'].dt.hour
+    else:
+        keys = by
+    table = frame.groupby(keys).agg(
+        hours=('recommended_intensity', 'size'),
+        hours_on=('lights_should_be_on', 'sum'),
+        rule_hours_on=('rule_lights_on', 'sum'),
+        mean_intensity=('recommended_intensity', 'mean'),
+        mean_intensity_when_on=('on_intensity', 'mean'),
+        full_power_hours=('full_power_hours', 'sum'),
+        rule_agreement=('agrees', 'mean'),
+    )
+    if by is None:
+        return table.iloc[0].to_dict() if len(table) else {}
+    return table
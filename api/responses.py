@@ -0,0 +1,30 @@
+"""
+JSON responses for the API views.
+
+NumpyJSONEncoder extends Django's encoder (datetimes, decimals, UUIDs) with
+NumPy scalars and arrays, so model output is serialized in the same single
+pass as the rest of the payload instead of being converted beforehand. Its
+`default` hook is only called for types json can't encode itself, which
+keeps the C encoder on the fast path.
+"""
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse as DjangoJsonResponse
+
+
+class NumpyJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, np.generic):
+            # NumPy scalar (np.float32, np.int64, np.bool_, ...) -> Python scalar
+            return o.item()
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return super().default(o)
+
+
+class JsonResponse(DjangoJsonResponse):
+    """JsonResponse encoding NumPy values, with compact separators"""
+
+    def __init__(self, data, encoder=NumpyJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        json_dumps_params = {'separators': (',', ':'), **(json_dumps_params or {})}
+        super().__init__(data, encoder=encoder, safe=safe, json_dumps_params=json_dumps_params, **kwargs)
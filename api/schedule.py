@@ -0,0 +1,287 @@
+"""
+Day-ahead lighting schedule, predicted from the hourly forecast.
+
+A scheduler thread fetches the next SCHEDULE_HOURS hours of the Visual
+Crossing forecast for every served location once per
+SCHEDULE_REFRESH_INTERVAL, turns all of them into feature rows at once and
+predicts them with a single batched model call. The result is stored as a
+LightingSchedule, which /api/schedule/ serves without touching the model or
+any upstream API. Like the sensor sync, only one process refreshes a
+location per interval.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import solar
+from .features import WEATHER_COLUMNS
+from .ml_model import DEFAULT_LOCATION
+from .models import LightingSchedule, Streetlight
+from .locks import FileLock
+from .weather_cache import fetch_visual_crossing_timeline
+
+
+logger = logging.getLogger(__name__)
+
+FORECAST_ELEMENTS = (
+    'datetime,datetimeEpoch,tempmax,tempmin,temp,humidity,pressure,cloudcover,'
+    'visibility,solarradiation,windspeed,precipprob'
+)
+
+# Forecast keys read for each WEATHER_COLUMNS input, and the value used when
+# an hour leaves one out (the same defaults as the live request path; missing
+# solar radiation is estimated from the sun's position instead)
+FORECAST_KEYS = {
+    'tempmax': 'tempmax',
+    'tempmin': 'tempmin',
+    'temp': 'temp',
+    'humidity': 'humidity',
+    'sealevelpressure': 'pressure',
+    'cloudcover': 'cloudcover',
+    'visibility': 'visibility',
+    'solarradiation': 'solarradiation',
+    'windspeed': 'windspeed',
+    'precipprob': 'precipprob',
+}
+FORECAST_DEFAULTS = {
+    'tempmax': 25.0,
+    'tempmin': 15.0,
+    'temp': 20.0,
+    'humidity': 60.0,
+    'sealevelpressure': 1013.25,
+    'cloudcover': 50.0,
+    'visibility': 10.0,
+    'windspeed': 10.0,
+    'precipprob': 30.0,
+}
+
+
+def fetch_forecast(location, api_key=None):
+    """Visual Crossing hourly forecast for today through the day after tomorrow (UTC dates)"""
+    api_key = api_key if api_key is not None else settings.VISUAL_CROSSING_API_KEY
+    if not api_key:
+        raise ValueError("A Visual Crossing API key is required for the forecast")
+    today = datetime.now(dt_timezone.utc).date()
+    period = f'{today:%Y-%m-%d}/{today + timedelta(days=2):%Y-%m-%d}'
+    return fetch_visual_crossing_timeline(
+        location, period, api_key, include='days,hours', elements=FORECAST_ELEMENTS
+    )
+
+
+def forecast_hours(forecast, start_epoch, n_hours):
+    """
+    The first `n_hours` forecast hours at or after `start_epoch` as arrays.
+
+    Returns (epochs, local_times, weather, daylight): UTC epoch seconds, local
+    wall-clock datetime64 values, a WEATHER_COLUMNS -> array dict with gaps
+    filled from FORECAST_DEFAULTS, and each hour's daylight duration. Daylight
+    and missing solar radiation come from the site's solar geometry.
+    """
+    tzoffset = float(forecast.get('tzoffset') or 0)
+    hours, days = [], []
+    for day in forecast.get('days') or []:
+        for hour in day.get('hours') or []:
+            hours.append(hour)
+            days.append(day)
+    if not hours:
+        raise ValueError("The forecast has no hourly data")
+
+    local_times = np.array([f"{day['datetime']}T{hour['datetime']}" for day, hour in zip(days, hours)],
+                           dtype='datetime64[s]')
+    epochs = np.array([hour.get('datetimeEpoch') for hour in hours], dtype=np.float64)
+    missing = np.isnan(epochs)
+    epochs[missing] = local_times[missing].astype(np.int64) - tzoffset * 3600
+    epochs = epochs.astype(np.int64)
+
+    keep = np.flatnonzero(epochs >= start_epoch)[:n_hours]
+    if keep.size == 0:
+        raise ValueError("The forecast has no hours after the schedule start")
+
+    # Hour values first, then the day's (tempmax/tempmin are daily), then defaults
+    weather = {}
+    for name in WEATHER_COLUMNS:
+        key = FORECAST_KEYS[name]
+        weather[name] = np.array([hours[i].get(key, days[i].get(key)) for i in keep], dtype=np.float64)
+    latitude, longitude = solar.site_coordinates()
+    epochs, local_times = epochs[keep], local_times[keep]
+    for name, default in FORECAST_DEFAULTS.items():
+        values = weather[name]
+        values[np.isnan(values)] = default
+    radiation = weather['solarradiation']
+    missing = np.isnan(radiation)
+    if missing.any():
+        clear_sky = solar.clear_sky_irradiance(solar.solar_elevation(epochs[missing], latitude, longitude))
+        radiation[missing] = solar.cloud_adjusted_irradiance(clear_sky, weather['cloudcover'][missing])
+
+    daylight = solar.sun_times(local_times.astype('datetime64[D]'), latitude, longitude).daylight_hours
+    return epochs, local_times, weather, daylight
+
+
+def build_schedule(model_system, forecast, start_epoch, n_hours):
+    """
+    Predict every forecast hour from `start_epoch` on with one batched call.
+
+    Returns the list of per-hour dicts stored in LightingSchedule.hours. The
+    sensor, traffic and air-quality adjustments are left out: they depend on
+    live readings that a forecast cannot supply.
+    """
+    epochs, local_times, weather, daylight = forecast_hours(forecast, start_epoch, n_hours)
+    X = model_system.feature_pipeline.transform_hours(weather, local_times, daylight)
+    predictions = model_system.make_prediction_batch(X, record=False)
+
+    times = np.datetime_as_string(epochs.astype('datetime64[s]'), unit='s')
+    local = np.datetime_as_string(local_times, unit='s')
+    columns = zip(
+        times.tolist(), local.tolist(),
+        np.round(predictions['recommended_intensity'], 2).tolist(),
+        predictions['lights_should_be_on'].tolist(),
+        np.round(predictions['confidence'], 3).tolist(),
+        weather['temp'].tolist(), weather['cloudcover'].tolist(),
+        weather['precipprob'].tolist(), weather['solarradiation'].tolist(),
+    )
+    return [
+        {
+            'time': f'{time_utc}Z',
+            'local_time': local_time,
+            'recommended_intensity': intensity,
+            'lights_should_be_on': lights_on,
+            'confidence': confidence,
+            'temp': temp,
+            'cloudcover': cloudcover,
+            'precipprob': precipprob,
+            'solarradiation': solarradiation,
+        }
+        for time_utc, local_time, intensity, lights_on, confidence, temp, cloudcover, precipprob, solarradiation
+        in columns
+    ]
+
+
+def current_hours(schedule, now=None):
+    """The hours of `schedule` from the current hour on"""
+    now = now or timezone.now()
+    current = now.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:00:00Z')
+    # The times share one fixed-width format, so they compare as strings
+    return [hour for hour in schedule.hours if hour['time'] >= current]
+
+
+class LightingScheduler:
+    def __init__(self, hours=None, interval=None, retention_days=None):
+        self.hours = hours
+        self.interval = interval
+        self.retention_days = retention_days
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _config(self):
+        return (
+            self.hours if self.hours is not None else settings.SCHEDULE_HOURS,
+            self.interval if self.interval is not None else settings.SCHEDULE_REFRESH_INTERVAL,
+            self.retention_days if self.retention_days is not None else settings.SCHEDULE_RETENTION_DAYS,
+        )
+
+    def locations(self):
+        """Locations with a schedule: the default location and every active light's area"""
+        areas = Streetlight.objects.filter(active=True).values_list('area', flat=True).distinct()
+        return sorted({DEFAULT_LOCATION, *areas})
+
+    def latest(self, location):
+        return LightingSchedule.objects.filter(location=location).order_by('-generated_at').first()
+
+    def start(self):
+        """Start the scheduler thread if it is not already running"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='lighting-scheduler', daemon=True)
+                self._thread.start()
+
+    def refresh(self, location, force=False):
+        """
+        Build and store a new schedule for `location`.
+
+        Returns the new LightingSchedule, or None if the latest one is still
+        within the refresh interval or another process is building it.
+        """
+        n_hours, interval, retention_days = self._config()
+        now = timezone.now()
+        if not force:
+            latest = self.latest(location)
+            # A little slack so schedulers in step with each other still alternate
+            if latest is not None and latest.generated_at > now - timedelta(seconds=interval * 0.9):
+                return None
+
+        lock = FileLock(f'schedule:{location.lower()}')
+        if not lock.acquire():
+            return None
+        try:
+            # Imported here so importing this module does not load the model
+            from .model_service import get_model_system
+
+            model_system = get_model_system()
+            started = time.perf_counter()
+            forecast = fetch_forecast(location, model_system.visual_crossing_api_key)
+            fetched = time.perf_counter()
+            start_epoch = int(now.timestamp()) // 3600 * 3600
+            hours = build_schedule(model_system, forecast, start_epoch, n_hours)
+            schedule = LightingSchedule.objects.create(
+                location=location,
+                generated_at=now,
+                starts_at=datetime.fromtimestamp(start_epoch, dt_timezone.utc),
+                ends_at=datetime.fromisoformat(hours[-1]['time']),
+                hours=hours,
+            )
+            LightingSchedule.objects.filter(
+                location=location, generated_at__lt=now - timedelta(days=retention_days)
+            ).delete()
+        finally:
+            lock.release()
+
+        logger.info(
+            f"Built a {len(hours)}-hour lighting schedule for {location}",
+            extra={'location': location, 'fetch_ms': round((fetched - started) * 1e3, 1),
+                   'build_ms': round((time.perf_counter() - fetched) * 1e3, 1)}
+        )
+        return schedule
+
+    def ensure_schedule(self, location):
+        """
+        Start the scheduler thread and return the latest schedule for
+        `location`, building one now if it has none covering the current hour.
+        """
+        self.start()
+        schedule = self.latest(location)
+        if schedule is None or not current_hours(schedule):
+            schedule = self.refresh(location, force=True) or self.latest(location)
+            if schedule is None:
+                raise RuntimeError(f"No lighting schedule available for {location}")
+        return schedule
+
+    def _run(self):
+        while True:
+            try:
+                close_old_connections()
+                for location in self.locations():
+                    try:
+                        self.refresh(location)
+                    except Exception as e:
+                        logger.warning(f"Lighting schedule refresh failed for {location}: {e}")
+            except Exception as e:
+                logger.warning(f"Lighting scheduler failed: {e}")
+            # Check well within the interval so a schedule is never much older than it
+            time.sleep(max(1.0, self._config()[1] / 10))
+
+    def _reset_after_fork(self):
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+
+lighting_scheduler = LightingScheduler()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lighting_scheduler._reset_after_fork)
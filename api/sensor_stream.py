@@ -0,0 +1,250 @@
+"""
+Server-Sent Events fan-out of new sensor entries.
+
+One hub thread per process watches the local ThingSpeak mirror (kept up to
+date by sensor_sync, the only upstream poll) and pushes each new entry,
+serialized once, to every subscriber's bounded queue, so no subscriber
+polls upstream. Under ASGI a subscriber (astream) is a queue and a suspended
+coroutine, not a thread. Under WSGI a subscriber (stream) is a blocking
+generator, and the server holds a worker thread for the whole connection.
+
+A subscription starts at the hub's cursor when it registers: the hub pushes
+every later entry, and a resuming client's backlog is read up to that cursor,
+so no entry falls between the two.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import SensorEntry
+from .sensor_sync import entry_payload
+
+
+logger = logging.getLogger(__name__)
+
+# Sent first: clients reconnect after 5s if the stream drops
+STREAM_PREAMBLE = b'retry: 5000\n\n'
+HEARTBEAT = b': keepalive\n\n'
+
+
+def format_event(entry):
+    """SSE event bytes for a SensorEntry; the id lets clients resume via Last-Event-ID"""
+    data = json.dumps(entry_payload(entry), separators=(',', ':'))
+    return f'id: {entry.entry_id}\nevent: sensor\ndata: {data}\n\n'.encode()
+
+
+def entries_after(entry_id, limit):
+    """Mirrored entries newer than entry_id, oldest first"""
+    return list(
+        SensorEntry.objects
+        .filter(channel_id=settings.THINGSPEAK_CHANNEL_ID, entry_id__gt=entry_id)
+        .order_by('entry_id')[:limit]
+    )
+
+
+def entries_between(after_entry_id, upto_entry_id, limit):
+    """The newest `limit` mirrored entries in (after_entry_id, upto_entry_id], oldest first"""
+    entries = list(
+        SensorEntry.objects
+        .filter(
+            channel_id=settings.THINGSPEAK_CHANNEL_ID,
+            entry_id__gt=after_entry_id,
+            entry_id__lte=upto_entry_id,
+        )
+        .order_by('-entry_id')[:limit]
+    )
+    entries.reverse()
+    return entries
+
+
+def latest_entry_id():
+    return (
+        SensorEntry.objects
+        .filter(channel_id=settings.THINGSPEAK_CHANNEL_ID)
+        .order_by('-entry_id')
+        .values_list('entry_id', flat=True)
+        .first()
+    ) or 0
+
+
+class Subscription:
+    """
+    A subscriber's bounded queue of (entry_id, event bytes) batches. The hub
+    pushes the entries after `start_after`.
+    """
+
+    def __init__(self, maxsize, loop=None, start_after=0):
+        self.loop = loop
+        self.start_after = start_after
+        self._queue = asyncio.Queue(maxsize) if loop is not None else queue.Queue(maxsize)
+
+    def _put(self, batch):
+        # A subscriber that falls behind loses its oldest batches, never blocks the hub
+        while True:
+            try:
+                self._queue.put_nowait(batch)
+                return
+            except (asyncio.QueueFull, queue.Full):
+                try:
+                    self._queue.get_nowait()
+                except (asyncio.QueueEmpty, queue.Empty):
+                    pass
+
+    def push(self, batch):
+        """Called from the hub thread"""
+        if self.loop is None:
+            self._put(batch)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._put, batch)
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class SensorStreamHub:
+    def __init__(self, poll_interval=None, heartbeat_interval=None, queue_size=None):
+        self.poll_interval = poll_interval or settings.SENSOR_STREAM_POLL_INTERVAL
+        self.heartbeat_interval = heartbeat_interval or settings.SENSOR_STREAM_HEARTBEAT
+        self.queue_size = queue_size or settings.SENSOR_STREAM_QUEUE_SIZE
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._has_subscribers = threading.Event()
+        self._thread = None
+        self._last_entry_id = None
+        self.polls = 0
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, loop=None):
+        """Register a subscriber at the hub's cursor (queries the database)"""
+        with self._lock:
+            if self._last_entry_id is None:
+                # First subscriber: start from the current head
+                self._last_entry_id = latest_entry_id()
+            subscription = Subscription(self.queue_size, loop, start_after=self._last_entry_id)
+            self._subscribers.add(subscription)
+            self._has_subscribers.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sensor-stream-hub', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if not self._subscribers:
+                self._has_subscribers.clear()
+                # Whoever subscribes next starts from the head again
+                self._last_entry_id = None
+
+    def poll(self):
+        """Push entries that reached the mirror since the last poll; returns how many"""
+        self.polls += 1
+        cursor = self._last_entry_id
+        if cursor is None:
+            return 0
+
+        entries = entries_after(cursor, settings.SENSOR_LOGS_MAX_RESULTS)
+        if not entries:
+            return 0
+        batch = [(entry.entry_id, format_event(entry)) for entry in entries]
+        # Moving the cursor and taking the subscribers together means a
+        # subscriber registered from here on starts after this batch
+        with self._lock:
+            if self._last_entry_id != cursor:
+                # Every subscriber left meanwhile
+                return 0
+            self._last_entry_id = entries[-1].entry_id
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(batch)
+        return len(entries)
+
+    def _run(self):
+        while True:
+            self._has_subscribers.wait()
+            try:
+                close_old_connections()
+                self.poll()
+            except Exception as e:
+                logger.warning(f"Sensor stream poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def _backlog(self, since_entry_id, subscription):
+        # Up to where the hub's pushes to this subscription start
+        entries = entries_between(since_entry_id, subscription.start_after, settings.SENSOR_LOGS_MAX_RESULTS)
+        return [(entry.entry_id, format_event(entry)) for entry in entries]
+
+    async def astream(self, since_entry_id=None):
+        """Async SSE byte stream for an ASGI StreamingHttpResponse"""
+        subscription = await sync_to_async(self.subscribe)(asyncio.get_running_loop())
+        try:
+            yield STREAM_PREAMBLE
+            last_sent = subscription.start_after if since_entry_id is None else since_entry_id
+            if since_entry_id is not None:
+                for entry_id, event in await sync_to_async(self._backlog)(since_entry_id, subscription):
+                    last_sent = entry_id
+                    yield event
+            while True:
+                batch = await subscription.aget(self.heartbeat_interval)
+                if batch is None:
+                    yield HEARTBEAT
+                    continue
+                for entry_id, event in batch:
+                    if entry_id > last_sent:
+                        last_sent = entry_id
+                        yield event
+        finally:
+            self.unsubscribe(subscription)
+
+    def stream(self, since_entry_id=None):
+        """Blocking SSE byte stream for a WSGI StreamingHttpResponse"""
+        subscription = self.subscribe()
+        try:
+            yield STREAM_PREAMBLE
+            last_sent = subscription.start_after if since_entry_id is None else since_entry_id
+            if since_entry_id is not None:
+                for entry_id, event in self._backlog(since_entry_id, subscription):
+                    last_sent = entry_id
+                    yield event
+            while True:
+                batch = subscription.get(self.heartbeat_interval)
+                if batch is None:
+                    yield HEARTBEAT
+                    continue
+                for entry_id, event in batch:
+                    if entry_id > last_sent:
+                        last_sent = entry_id
+                        yield event
+        finally:
+            self.unsubscribe(subscription)
+
+    def _reset_after_fork(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._has_subscribers = threading.Event()
+        self._thread = None
+
+
+sensor_stream_hub = SensorStreamHub()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=sensor_stream_hub._reset_after_fork)
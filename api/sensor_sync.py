@@ -0,0 +1,197 @@
+"""
+Local incremental mirror of the ThingSpeak sensor feed.
+
+A sync thread polls the channel every THINGSPEAK_SYNC_INTERVAL seconds and
+appends entries newer than the last seen entry_id to SensorEntry. The poll is
+claimed through SensorSyncState, so however many worker processes run, only
+one of them polls ThingSpeak per interval. The sensor endpoints read the
+mirror instead of calling ThingSpeak on every request.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import upstream
+from .models import SensorEntry, SensorSyncState
+
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _number(value, cast):
+    if value is None or value == '':
+        return None
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_feed_entry(channel_id, entry):
+    """SensorEntry for one item of a feeds.json 'feeds' list"""
+    created_at = entry.get('created_at')
+    return SensorEntry(
+        channel_id=channel_id,
+        entry_id=int(entry['entry_id']),
+        created_at=parse_datetime(created_at) if created_at else None,
+        ambient_light=_number(entry.get('field1'), float),
+        motion=_number(entry.get('field2'), int),
+        light_control=_number(entry.get('field3'), int),
+    )
+
+
+def entry_payload(entry):
+    """Serializable form of a SensorEntry, matching the ThingSpeak proxy responses"""
+    return {
+        'entry_id': entry.entry_id,
+        'ambient_light_sensor': float(entry.ambient_light or 0),
+        'motion_sensor': int(entry.motion or 0),
+        'timestamp': entry.created_at.strftime(TIMESTAMP_FORMAT) if entry.created_at else '',
+    }
+
+
+def entry_payloads(queryset):
+    """
+    entry_payload for every entry of a SensorEntry queryset, read as tuples
+    rather than model instances. created_at is read as the database's UTC
+    text ('YYYY-MM-DD HH:MM:SS...') and sliced into the timestamp, skipping
+    a datetime parse and strftime per row.
+    """
+    rows = queryset.values_list('entry_id', 'ambient_light', 'motion', Cast('created_at', CharField()))
+    return [
+        {
+            'entry_id': entry_id,
+            'ambient_light_sensor': float(ambient_light or 0),
+            'motion_sensor': int(motion or 0),
+            'timestamp': f'{created_at[:10]}T{created_at[11:19]}Z' if created_at else '',
+        }
+        for entry_id, ambient_light, motion, created_at in rows
+    ]
+
+
+class ThingSpeakSensorSync:
+    def __init__(self, channel_id=None, read_api_key=None, interval=None):
+        self.channel_id = channel_id
+        self.read_api_key = read_api_key
+        self.interval = interval
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _config(self):
+        return (
+            self.channel_id if self.channel_id is not None else settings.THINGSPEAK_CHANNEL_ID,
+            self.read_api_key if self.read_api_key is not None else settings.THINGSPEAK_READ_API_KEY,
+            self.interval if self.interval is not None else settings.THINGSPEAK_SYNC_INTERVAL,
+        )
+
+    def start(self):
+        """Start the sync thread if it is not already running"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='thingspeak-sensor-sync', daemon=True)
+                self._thread.start()
+
+    def _claim(self, channel_id, interval, force):
+        """Claim this interval's poll; returns the channel's state or None"""
+        state, _ = SensorSyncState.objects.get_or_create(channel_id=channel_id)
+        now = timezone.now()
+        claim = SensorSyncState.objects.filter(pk=state.pk)
+        if not force:
+            # A little slack so pollers in step with each other still alternate
+            due = now - timedelta(seconds=interval * 0.9)
+            claim = claim.filter(Q(last_polled_at__isnull=True) | Q(last_polled_at__lte=due))
+        if not claim.update(last_polled_at=now):
+            return None
+        state.refresh_from_db()
+        return state
+
+    def sync(self, force=False):
+        """
+        Fetch entries newer than the last seen entry_id into the mirror.
+
+        Returns the number of new entries, or None if another process polled
+        within the interval. Upstream errors are recorded and re-raised.
+        """
+        channel_id, read_api_key, interval = self._config()
+        state = self._claim(channel_id, interval, force)
+        if state is None:
+            return None
+
+        params = {'api_key': read_api_key}
+        if state.last_entry_id:
+            # ThingSpeak can't filter on entry_id, so ask for everything since
+            # the last entry's time and drop what is already mirrored
+            last = SensorEntry.objects.filter(channel_id=channel_id, entry_id=state.last_entry_id).first()
+            params['results'] = settings.THINGSPEAK_SYNC_MAX_RESULTS
+            if last is not None and last.created_at is not None:
+                params['start'] = last.created_at.strftime('%Y-%m-%d %H:%M:%S')
+                params['timezone'] = 'Etc/UTC'
+        else:
+            params['results'] = settings.THINGSPEAK_SYNC_INITIAL_RESULTS
+
+        try:
+            response = upstream.get(f'{settings.THINGSPEAK_API_URL}/channels/{channel_id}/feeds.json', params=params)
+            response.raise_for_status()
+            feeds = response.json().get('feeds') or []
+            entries = [
+                parse_feed_entry(channel_id, entry)
+                for entry in feeds
+                if int(entry.get('entry_id') or 0) > state.last_entry_id
+            ]
+        except Exception as e:
+            SensorSyncState.objects.filter(pk=state.pk).update(last_error=str(e))
+            raise
+
+        if entries:
+            SensorEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            newest = max(entry.entry_id for entry in entries)
+            oldest = min(entry.entry_id for entry in entries)
+            if state.last_entry_id and oldest > state.last_entry_id + 1 and len(feeds) >= params['results']:
+                logger.warning(
+                    f"ThingSpeak channel {channel_id}: entries {state.last_entry_id + 1}-{oldest - 1} "
+                    f"were not mirrored (more than {params['results']} new entries)"
+                )
+            SensorSyncState.objects.filter(pk=state.pk, last_entry_id__lt=newest).update(last_entry_id=newest)
+
+        SensorSyncState.objects.filter(pk=state.pk).update(last_synced_at=timezone.now(), last_error='')
+        return len(entries)
+
+    def ensure_synced(self):
+        """
+        Start the sync thread and, if this channel has never been mirrored,
+        sync once now so the first request has data to serve.
+        """
+        self.start()
+        channel_id = self._config()[0]
+        if not SensorSyncState.objects.filter(channel_id=channel_id, last_synced_at__isnull=False).exists():
+            self.sync(force=True)
+
+    def _run(self):
+        while True:
+            try:
+                close_old_connections()
+                self.sync()
+            except Exception as e:
+                logger.warning(f"ThingSpeak sensor sync failed: {e}")
+            time.sleep(self._config()[2])
+
+    def _reset_after_fork(self):
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+
+sensor_sync = ThingSpeakSensorSync()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=sensor_sync._reset_after_fork)
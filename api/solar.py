@@ -0,0 +1,203 @@
+"""
+Solar geometry computed locally with NumPy.
+
+Sun position follows the NOAA solar calculator equations (Julian century
+based declination and equation of time); sunrise and sunset use the NOAA
+-0.833 degree horizon for refraction and the solar disc. Clear-sky
+irradiance is the Haurwitz model and cloud cover is applied with the
+Kasten-Czeplak factor. Every function takes arrays of UTC timestamps, so
+a year of hourly values is a handful of vectorized operations. Sunrise and
+sunset for single days are cached, which keeps the request path cheap.
+
+Times are UTC: datetime64 values, or epoch seconds. The site_* helpers
+work at the configured site (SITE_LATITUDE, SITE_LONGITUDE, SITE_TIMEZONE).
+"""
+import functools
+import math
+import time
+from datetime import datetime
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+
+JULIAN_DAY_AT_EPOCH = 2440587.5
+J2000 = 2451545.0
+# Zenith angle of the sun's upper limb at sunrise, refraction included
+SUNRISE_ZENITH = 90.833
+
+
+class SunTimes(NamedTuple):
+    sunrise: object  # epoch seconds
+    sunset: object
+    daylight_hours: object
+
+
+class SunConditions(NamedTuple):
+    elevation: float  # degrees
+    clear_sky_radiation: float  # W/m²
+    daylight_duration: float  # hours
+
+
+def epoch_seconds(times):
+    """Float epoch seconds for datetime64 values (naive = UTC) or numbers; NaT becomes NaN"""
+    values = np.asarray(times)
+    if np.issubdtype(values.dtype, np.datetime64):
+        nanoseconds = values.astype('datetime64[ns]')
+        seconds = nanoseconds.astype(np.int64) / 1e9
+        return np.where(np.isnat(nanoseconds), np.nan, seconds)
+    return values.astype(np.float64)
+
+
+def _sun_terms(epoch):
+    """Solar declination (radians) and equation of time (minutes) at `epoch`"""
+    t = (epoch / 86400.0 + JULIAN_DAY_AT_EPOCH - J2000) / 36525.0
+    mean_longitude = np.radians((280.46646 + t * (36000.76983 + t * 0.0003032)) % 360)
+    mean_anomaly = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    center = (
+        np.sin(mean_anomaly) * (1.914602 - t * (0.004817 + 0.000014 * t))
+        + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * t)
+        + np.sin(3 * mean_anomaly) * 0.000289
+    )
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_longitude = np.radians(np.degrees(mean_longitude) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60) / 60
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_longitude))
+    y = np.tan(obliquity / 2) ** 2
+    equation_of_time = 4 * np.degrees(
+        y * np.sin(2 * mean_longitude)
+        - 2 * eccentricity * np.sin(mean_anomaly)
+        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_longitude)
+        - 0.5 * y * y * np.sin(4 * mean_longitude)
+        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly)
+    )
+    return declination, equation_of_time
+
+
+def solar_elevation(times, latitude, longitude):
+    """Geometric solar elevation in degrees at each UTC time (east longitude positive)"""
+    epoch = epoch_seconds(times)
+    declination, equation_of_time = _sun_terms(epoch)
+    true_solar_minutes = (epoch % 86400) / 60 + equation_of_time + 4 * longitude
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    lat = np.radians(latitude)
+    cos_zenith = np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    return 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+
+
+def _day_terms(days, latitude, longitude):
+    """sun_times plus the declination and equation of time at solar noon, for days since 1970-01-01"""
+    # Sun terms at (roughly) the day's solar noon
+    noon_epoch = days * 86400.0 + (720 - 4 * longitude) * 60
+    declination, equation_of_time = _sun_terms(noon_epoch)
+    solar_noon = days * 86400.0 + (720 - 4 * longitude - equation_of_time) * 60
+
+    lat = np.radians(latitude)
+    cos_hour_angle = (
+        np.cos(np.radians(SUNRISE_ZENITH)) / (np.cos(lat) * np.cos(declination))
+        - np.tan(lat) * np.tan(declination)
+    )
+    hour_angle = np.degrees(np.arccos(np.clip(cos_hour_angle, -1, 1)))
+    half_day = hour_angle * 4 * 60
+    return solar_noon - half_day, solar_noon + half_day, hour_angle * 8 / 60, declination, equation_of_time
+
+
+def sun_times(dates, latitude, longitude):
+    """
+    Sunrise, sunset (epoch seconds) and daylight hours for each calendar date
+    (datetime64[D], or anything that converts to it). Polar night gives zero
+    daylight and midnight sun 24 hours, with sunrise and sunset at solar noon
+    or 12 hours either side of it.
+    """
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    return SunTimes(*_day_terms(days, latitude, longitude)[:3])
+
+
+def clear_sky_irradiance(elevation):
+    """Haurwitz clear-sky global horizontal irradiance (W/m²) for solar elevations in degrees"""
+    sin_elevation = np.sin(np.radians(np.asarray(elevation, dtype=np.float64)))
+    positive = np.maximum(sin_elevation, 1e-6)
+    return np.where(sin_elevation > 0, 1098.0 * positive * np.exp(-0.057 / positive), 0.0)
+
+
+def cloud_adjusted_irradiance(clear_sky, cloudcover):
+    """Kasten-Czeplak irradiance under `cloudcover` percent cloud"""
+    cover = np.clip(np.asarray(cloudcover, dtype=np.float64), 0, 100) / 100
+    return clear_sky * (1 - 0.75 * cover ** 3.4)
+
+
+@functools.lru_cache(maxsize=1024)
+def _daily_terms(day, latitude, longitude):
+    return tuple(float(value[0]) for value in _day_terms(np.array([day], dtype=np.int64), latitude, longitude))
+
+
+def daily_sun_times(day, latitude, longitude):
+    """sun_times for one day (days since 1970-01-01) as floats, cached"""
+    return SunTimes(*_daily_terms(day, latitude, longitude)[:3])
+
+
+def site_coordinates():
+    return settings.SITE_LATITUDE, settings.SITE_LONGITUDE
+
+
+def site_sun(when=None):
+    """
+    Solar elevation, clear-sky irradiance and the day's daylight hours at
+    the site at `when` (aware datetime or epoch seconds; default now).
+    """
+    if when is None:
+        epoch = time.time()
+    elif hasattr(when, 'timestamp'):
+        epoch = when.timestamp()
+    else:
+        epoch = float(when)
+    latitude, longitude = site_coordinates()
+    # One scalar evaluation with the day's cached sun terms; the declination
+    # moves by under 0.5 degrees a day, so this stays within a few tenths of
+    # a degree of solar_elevation
+    _, _, daylight, declination, equation_of_time = _daily_terms(int(epoch // 86400), latitude, longitude)
+    hour_angle = math.radians(((epoch % 86400) / 60 + equation_of_time + 4 * longitude) / 4 - 180)
+    lat = math.radians(latitude)
+    cos_zenith = math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.cos(hour_angle)
+    elevation = 90 - math.degrees(math.acos(min(1.0, max(-1.0, cos_zenith))))
+    sin_elevation = math.sin(math.radians(elevation))
+    clear_sky = 1098.0 * sin_elevation * math.exp(-0.057 / sin_elevation) if sin_elevation > 0 else 0.0
+    return SunConditions(elevation, clear_sky, daylight)
+
+
+def site_now():
+    """The current naive wall-clock time at the site, the clock the training data is in"""
+    return datetime.now(ZoneInfo(settings.SITE_TIMEZONE)).replace(tzinfo=None)
+
+
+def local_to_epoch(local_times, tz=None):
+    """Epoch seconds for naive local wall-clock times at the site (NaN where they do not exist)"""
+    times = pd.DatetimeIndex(pd.to_datetime(local_times, errors='coerce'))
+    if times.tz is None:
+        times = times.tz_localize(tz or settings.SITE_TIMEZONE, ambiguous='NaT', nonexistent='NaT')
+    return epoch_seconds(times.tz_convert('UTC').tz_localize(None).to_numpy())
+
+
+def site_solar_radiation(local_times, cloudcover):
+    """Estimated solar radiation (W/m²) at the site for naive local times and cloud cover percentages"""
+    latitude, longitude = site_coordinates()
+    elevation = solar_elevation(local_to_epoch(local_times), latitude, longitude)
+    return cloud_adjusted_irradiance(clear_sky_irradiance(elevation), cloudcover)
+
+
+def site_daylight_hours(local_times):
+    """Daylight hours at the site for the local date of each time, computed once per distinct date"""
+    latitude, longitude = site_coordinates()
+    dates = pd.DatetimeIndex(pd.to_datetime(local_times, errors='coerce')).tz_localize(None).to_numpy()
+    dates = dates.astype('datetime64[D]')
+    valid = ~np.isnat(dates)
+    daylight = np.full(dates.shape, np.nan)
+    unique_dates, inverse = np.unique(dates[valid], return_inverse=True)
+    daylight[valid] = sun_times(unique_dates, latitude, longitude).daylight_hours[inverse]
+    return daylight
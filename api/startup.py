@@ -0,0 +1,43 @@
+"""
+Background services of processes that serve requests.
+
+IntelligentStrLighting/wsgi.py and asgi.py call start_serving() once the
+application is loaded, so runserver's serving process and gunicorn/uvicorn
+workers start them, and migrate, tests, shells, celery workers and scripts
+that only call django.setup() start nothing. Workers forked from a preloaded
+parent (gunicorn --preload) warm the model up on their first request instead.
+
+The ThingSpeak write flusher starts when writes are outstanding, e.g. left
+pending or sending by a process that stopped.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError
+
+
+logger = logging.getLogger(__name__)
+
+
+def start_serving():
+    """
+    Warm the ML model up and keep it updated (if ML_WARMUP_ON_STARTUP), and
+    resume outstanding ThingSpeak writes.
+    """
+    from .write_queue import write_queue
+
+    try:
+        if write_queue.start_if_outstanding():
+            logger.info("Resuming outstanding ThingSpeak writes")
+    except DatabaseError as e:
+        # e.g. not migrated yet; the flusher starts with the next write instead
+        logger.warning(f"Could not check for outstanding ThingSpeak writes: {e}")
+
+    if settings.ML_WARMUP_ON_STARTUP:
+        from . import model_service
+        from .model_updates import model_updater
+
+        # Load the ML model in the background so the first request doesn't pay for it
+        model_service.start_warmup()
+        # Keeps the loaded model up to date with new training rows
+        model_updater.start()
@@ -1,3 +1,1763 @@
-from django.test import TestCase
+import asyncio
+import functools
+import gc
+import io
+import json
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import requests
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from benchmarks import suite
+
+from . import backtest, dataset, metrics, model_service, prediction_history, replay, schedule, solar, upstream, weather_cache
+from .features import FEATURE_COLUMNS, FEATURES_VERSION, WEATHER_COLUMNS, FeaturePipeline
+from .fleet import predict_fleet
+from .locks import FileLock
+from .log_handlers import BackgroundQueueHandler
+from .ml_model import DEFAULT_MODEL_PARAMS, StreetlightMLSystem, apply_adjustments_batch, create_features, fit_intensity_model, weather_inputs
+from .model_registry import artifact_key, latest_artifact, list_artifacts, load_or_train, new_version_dir, serving_model_params
+from .model_updates import ModelUpdater, passes_validation
+from .models import LightControlWrite, PredictionLog, PredictionRollup, SensorEntry, SensorSyncState, Streetlight
+from .prediction_log import PredictionLogBuffer
+from .responses import JsonResponse
+from .schedule import LightingScheduler, current_hours, forecast_hours
+from .sensor_stream import STREAM_PREAMBLE, SensorStreamHub
+from .sensor_sync import ThingSpeakSensorSync, entry_payload, entry_payloads
+from .startup import start_serving
+from .tree_predictor import TreeEnsemblePredictor
+from .write_queue import ThingSpeakWriteQueue, write_status
+
+# Two months of hourly rows keep training in the tests quick
+TRAINING_ROWS = 24 * 61
+
+
+def training_rows(rows=TRAINING_ROWS):
+    return pd.read_csv(settings.TRAINING_DATA_PATH, nrows=rows)
+
+
+def write_training_csv(directory, rows=TRAINING_ROWS):
+    path = os.path.join(directory, 'training.csv')
+    training_rows(rows).to_csv(path, index=False)
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def trained_system():
+    """One model trained on TRAINING_ROWS rows, shared by the tests that only read it"""
+    system = StreetlightMLSystem()
+    system.train_models(create_features(training_rows()))
+    return system
+
+
+def feature_matrix(system, df_raw):
+    df = create_features(df_raw, system.feature_pipeline)
+    return df[system.feature_columns].fillna(0).to_numpy(dtype=np.float32)
+
+
+class ModelArtifactTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='test-artifacts-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_artifact_key_covers_data_hyperparameters_and_features(self):
+        data_hash = 'ab' * 32
+        key = artifact_key(data_hash, DEFAULT_MODEL_PARAMS)
+
+        self.assertEqual(key, artifact_key(data_hash, dict(reversed(list(DEFAULT_MODEL_PARAMS.items())))))
+        self.assertTrue(key.startswith(data_hash[:16]))
+        self.assertTrue(key.endswith(f'-f{FEATURES_VERSION}'))
+        self.assertNotEqual(key, artifact_key('cd' * 32, DEFAULT_MODEL_PARAMS))
+        self.assertNotEqual(key, artifact_key(data_hash, {**DEFAULT_MODEL_PARAMS, 'max_depth': 4}))
+
+    def test_saved_model_loads_with_identical_predictions(self):
+        system = trained_system()
+        path = new_version_dir(self.directory, 'key')
+        metadata = system.save_model(path, data_hash='ab' * 32)
+        loaded = StreetlightMLSystem.load_model(path)
+
+        X = feature_matrix(system, training_rows(200))
+        np.testing.assert_array_equal(loaded.light_intensity_model.predict(X), system.light_intensity_model.predict(X))
+        self.assertEqual(loaded.feature_columns, system.feature_columns)
+        self.assertEqual(loaded.feature_pipeline.to_dict(), system.feature_pipeline.to_dict())
+        self.assertEqual(loaded.model_params, system.model_params)
+        self.assertEqual(loaded.trained_through, system.trained_through)
+        self.assertEqual(metadata['data_hash'], 'ab' * 32)
+        self.assertEqual(loaded.artifact_path, path)
+
+    def test_save_is_atomic_and_partial_artifacts_are_ignored(self):
+        system = trained_system()
+        key_dir = os.path.join(self.directory, 'key')
+        # Left by a writer that died: a temporary directory and an incomplete version
+        os.makedirs(os.path.join(key_dir, '.tmp-dead'))
+        os.makedirs(os.path.join(key_dir, '99990101T000000000000Z'))
+
+        path = new_version_dir(self.directory, 'key')
+        with mock.patch('api.ml_model.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                system.save_model(path)
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(latest_artifact(self.directory, 'key'))
+
+        system.save_model(path)
+        self.assertEqual(list_artifacts(self.directory, 'key'), [path])
+
+    def test_load_or_train_trains_once_per_data_and_hyperparameters(self):
+        csv_path = write_training_csv(self.directory)
+        model_dir = os.path.join(self.directory, 'models')
+        first = load_or_train(csv_path, model_dir)
+        self.assertIsNotNone(first.artifact_path)
+
+        with mock.patch('api.model_registry.train_system', side_effect=AssertionError('retrained')):
+            second = load_or_train(csv_path, model_dir)
+        self.assertEqual(second.artifact_path, first.artifact_path)
+
+        # Other hyperparameters are another artifact
+        third = load_or_train(csv_path, model_dir, model_params={**DEFAULT_MODEL_PARAMS, 'n_estimators': 20})
+        self.assertNotEqual(os.path.dirname(third.artifact_path), os.path.dirname(first.artifact_path))
+
+
+def event_id(event):
+    """Entry id of an SSE event, or None for a heartbeat"""
+    if not event.startswith(b'id: '):
+        return None
+    return int(event.split(b'\n', 1)[0][4:])
+
+
+class BatchPredictionTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.system = trained_system()
+        cls.X = feature_matrix(cls.system, training_rows(240))
+        rng = np.random.default_rng(0)
+        n_rows = len(cls.X)
+        # Values on both sides of every adjustment's thresholds
+        cls.adjustments = {
+            'aqi': rng.integers(20, 160, n_rows),
+            'pedestrian_count': rng.integers(0, 50, n_rows),
+            'vehicle_count': rng.integers(0, 30, n_rows),
+            'ambient_light': rng.uniform(0, 100, n_rows),
+            'motion': rng.integers(0, 2, n_rows),
+        }
+
+    def assert_matches_make_prediction(self, batch, external_data, sensor_data):
+        for i, row in enumerate(self.X):
+            single = self.system.make_prediction(list(row), external_data(i), sensor_data(i))
+            self.assertAlmostEqual(batch['recommended_intensity'][i], single['recommended_intensity'], places=4)
+            self.assertEqual(bool(batch['lights_should_be_on'][i]), single['lights_should_be_on'])
+            self.assertAlmostEqual(batch['confidence'][i], single['confidence'], places=6)
+
+    def test_batch_matches_make_prediction_row_by_row(self):
+        batch = self.system.make_prediction_batch(self.X, **self.adjustments)
+        adjustments = self.adjustments
+        self.assert_matches_make_prediction(
+            batch,
+            lambda i: {
+                'air_quality': {'aqi': adjustments['aqi'][i]},
+                'traffic_data': {
+                    'pedestrian_count': adjustments['pedestrian_count'][i],
+                    'vehicle_count': adjustments['vehicle_count'][i],
+                },
+            },
+            lambda i: {
+                'ambient_light_sensor': adjustments['ambient_light'][i],
+                'motion_sensor': adjustments['motion'][i],
+            },
+        )
+
+    def test_missing_inputs_skip_their_adjustments(self):
+        batch = self.system.make_prediction_batch(self.X)
+        self.assert_matches_make_prediction(batch, lambda i: None, lambda i: None)
+
+    def test_rejects_misshapen_input(self):
+        with self.assertRaises(ValueError):
+            self.system.make_prediction_batch(self.X[:, :-1])
+        with self.assertRaises(ValueError):
+            self.system.make_prediction_batch(self.X, aqi=[50])
+
+    def test_batch_endpoint(self):
+        body = {'features': self.X[:3].tolist(), 'motion': [0, 1, 0]}
+        with mock.patch('api.views.get_trained_model_system', return_value=self.system):
+            response = self.client.post('/api/predict/batch/', json.dumps(body), content_type='application/json')
+            invalid = self.client.post('/api/predict/batch/', json.dumps({'features': [[1.0, 2.0]]}),
+                                       content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['count'], 3)
+        self.assertGreaterEqual(payload['recommended_intensity'][1], 60)
+        self.assertEqual(invalid.status_code, 400)
+
+
+class FeaturePipelineTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pipeline = FeaturePipeline().fit(training_rows())
+        # Raw rows with their missing values filled, as the serving inputs are
+        cls.rows = create_features(training_rows(72), cls.pipeline)
+        cls.expected = cls.pipeline.transform(cls.rows)
+
+    def test_single_row_features_match_the_batch_transform(self):
+        buffer = np.zeros((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+        for i, row in enumerate(self.rows.itertuples(index=False)):
+            weather = {name: getattr(row, name) for name in WEATHER_COLUMNS}
+            when = pd.Timestamp(row.datetime).to_pydatetime()
+            self.pipeline.transform_one(weather, when, daylight_duration=self.expected[i, 14], out=buffer)
+            np.testing.assert_allclose(buffer[0], self.expected[i], rtol=1e-6)
+
+    def test_hourly_features_match_the_batch_transform(self):
+        weather = {name: self.rows[name].to_numpy() for name in WEATHER_COLUMNS}
+        times = pd.to_datetime(self.rows['datetime']).to_numpy()
+        features = self.pipeline.transform_hours(weather, times, daylight_duration=self.expected[:, 14])
+        np.testing.assert_allclose(features, self.expected, rtol=1e-6)
+
+    def test_stats_are_fitted_once_and_persist(self):
+        system = StreetlightMLSystem()
+        system.feature_pipeline = FeaturePipeline.from_dict(self.pipeline.to_dict())
+        # Serving rows are normalized with the training stats, not their own
+        processed = system.preprocess_weather_data(self.rows[['datetime', *WEATHER_COLUMNS]].copy())
+        self.assertEqual(system.feature_pipeline.stats, self.pipeline.stats)
+        np.testing.assert_allclose(
+            processed[FEATURE_COLUMNS].fillna(0).to_numpy(dtype=np.float32), self.expected, rtol=1e-6
+        )
+        with self.assertRaises(ValueError):
+            FeaturePipeline().transform(self.rows)
+
+
+class DatasetCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='test-dataset-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.csv_path = write_training_csv(self.directory, rows=500)
+        self.cache_dir = os.path.join(self.directory, 'cache')
+
+    def test_columns_match_the_csv(self):
+        frame = dataset.load_training_frame(self.csv_path, self.cache_dir)
+        expected = pd.read_csv(self.csv_path)
+
+        self.assertEqual(len(frame), len(expected))
+        for name in WEATHER_COLUMNS:
+            self.assertEqual(frame[name].dtype, np.float32)
+            np.testing.assert_allclose(frame[name], expected[name].astype(np.float32), equal_nan=True)
+        pd.testing.assert_series_equal(frame['datetime'], pd.to_datetime(expected['datetime']), check_names=False)
+
+    def test_columns_are_the_memmaps_not_copies(self):
+        dataset.ensure_dataset_cache(self.csv_path, self.cache_dir)
+        maps = []
+        real_load = np.load
+
+        def load(*args, **kwargs):
+            maps.append(real_load(*args, **kwargs))
+            return maps[-1]
+
+        with mock.patch('api.dataset.np.load', side_effect=load):
+            frame = dataset.load_training_frame(self.csv_path, self.cache_dir)
+
+        self.assertEqual(len(maps), len(frame.columns))
+        for name, mapped in zip(frame.columns, maps):
+            self.assertIsInstance(mapped, np.memmap)
+            self.assertTrue(np.shares_memory(frame[name].to_numpy(), mapped), name)
+
+    def test_cache_is_reused_until_the_csv_changes(self):
+        first = dataset.ensure_dataset_cache(self.csv_path, self.cache_dir)
+        with mock.patch('api.dataset.pd.read_csv') as read_csv, \
+                mock.patch('api.dataset.file_content_hash') as content_hash:
+            self.assertEqual(dataset.ensure_dataset_cache(self.csv_path, self.cache_dir), first)
+        read_csv.assert_not_called()
+        content_hash.assert_not_called()
+
+        write_training_csv(self.directory, rows=400)
+        second = dataset.ensure_dataset_cache(self.csv_path, self.cache_dir)
+        self.assertNotEqual(second, first)
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(len(dataset.load_training_frame(self.csv_path, self.cache_dir)), 400)
+
+
+class ModelServiceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            model_service, _model_system=None, _warmup_thread=None, _warmup_error=None,
+            _warmup_started_at=None, _warmup_seconds=None, _failed_at=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.system = object()
+
+    def warm_up(self):
+        model_service.start_warmup()
+        if model_service._warmup_thread is not None:
+            model_service._warmup_thread.join(timeout=10)
+
+    def test_requests_do_not_wait_for_the_warm_up(self):
+        loaded = threading.Event()
+
+        def load():
+            loaded.wait(timeout=10)
+            return self.system
+
+        with mock.patch.object(model_service, '_load', side_effect=load):
+            self.assertIsNone(model_service.get_model_system(block=False))
+            self.assertEqual(model_service.status()['status'], 'loading')
+            loaded.set()
+            model_service._warmup_thread.join(timeout=10)
+
+        self.assertIs(model_service.get_model_system(block=False), self.system)
+        status = model_service.status()
+        self.assertTrue(status['ready'])
+        self.assertIn('warmup_seconds', status)
+
+    def test_failed_loads_are_retried_only_after_the_interval(self):
+        with mock.patch.object(model_service, '_load', side_effect=OSError("no training data")) as load, \
+                self.assertLogs('api.model_service', 'ERROR'):
+            self.warm_up()
+            for _ in range(3):
+                self.assertIsNone(model_service.get_model_system(block=False))
+            # Blocking callers get the failure too, without loading again
+            for _ in range(3):
+                with self.assertRaisesRegex(OSError, "no training data"):
+                    model_service.get_model_system()
+        self.assertEqual(load.call_count, 1)
+        status = model_service.status()
+        self.assertEqual(status['status'], 'failed')
+        self.assertEqual(status['error'], "no training data")
+        self.assertGreater(status['retry_in_seconds'], 0)
+
+        with mock.patch.object(model_service, '_load', return_value=self.system), \
+                mock.patch.object(model_service, 'WARMUP_RETRY_INTERVAL', 0):
+            self.warm_up()
+        self.assertIs(model_service.get_model_system(), self.system)
+        self.assertEqual(model_service.status()['status'], 'ready')
+
+    def test_only_serving_processes_warm_up(self):
+        from .model_updates import model_updater
+        from .write_queue import write_queue
+
+        with mock.patch.object(model_service, 'start_warmup') as start_warmup, \
+                mock.patch.object(model_updater, 'start') as start_updater, \
+                mock.patch.object(write_queue, 'start_if_outstanding', return_value=False):
+            with override_settings(ML_WARMUP_ON_STARTUP=False):
+                start_serving()
+            start_warmup.assert_not_called()
+            start_updater.assert_not_called()
+
+            with override_settings(ML_WARMUP_ON_STARTUP=True):
+                start_serving()
+            start_warmup.assert_called_once_with()
+            start_updater.assert_called_once_with()
+
+    def test_forked_children_start_their_own_warm_up(self):
+        with mock.patch.object(model_service, '_load', return_value=self.system):
+            model_service._warmup_thread = mock.Mock(is_alive=mock.Mock(return_value=True))
+            model_service._reset_after_fork()
+            self.warm_up()
+        self.assertTrue(model_service.is_ready())
+
+
+class WeatherCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='test-weather-cache-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = override_settings(
+            CACHES={
+                **settings.CACHES,
+                settings.WEATHER_CACHE_ALIAS: {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': os.path.join(directory, 'weather'),
+                },
+            },
+            LOCK_DIR=os.path.join(directory, 'locks'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.calls = 0
+
+    def fetch(self, delay=0):
+        self.calls += 1
+        time.sleep(delay)
+        return {'call': self.calls}
+
+    def test_fresh_entries_are_served_from_the_cache(self):
+        self.assertEqual(weather_cache.get_or_fetch('key', self.fetch, ttl=60, stale_ttl=60), {'call': 1})
+        self.assertEqual(weather_cache.get_or_fetch('key', self.fetch, ttl=60, stale_ttl=60), {'call': 1})
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_entries_are_served_while_one_refresh_runs(self):
+        weather_cache.get_or_fetch('key', self.fetch, ttl=0, stale_ttl=60)
+        # Stale: served as is while a background thread refreshes it
+        self.assertEqual(weather_cache.get_or_fetch('key', lambda: self.fetch(0.2), ttl=0, stale_ttl=60), {'call': 1})
+        # The refresh holds the lock, so this one does not start another
+        self.assertEqual(weather_cache.get_or_fetch('key', self.fetch, ttl=0, stale_ttl=60), {'call': 1})
+        lock = FileLock('key')
+        self.assertTrue(lock.acquire(timeout=5))
+        lock.release()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(weather_cache.get_weather_cache().get('key')['data'], {'call': 2})
+
+    def test_concurrent_misses_fetch_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                weather_cache.get_or_fetch('key', lambda: self.fetch(0.2), ttl=60, stale_ttl=60)
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'call': 1}] * 5)
+
+    def test_failures_are_not_cached(self):
+        def failing():
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            weather_cache.get_or_fetch('key', failing, ttl=60, stale_ttl=60)
+        self.assertEqual(weather_cache.get_or_fetch('key', self.fetch, ttl=60, stale_ttl=60), {'call': 1})
+
+    def test_cache_key_depends_on_the_query_not_the_api_key(self):
+        key = weather_cache.cache_key('Harare,ZW', 'today', {'include': 'hours'})
+        self.assertEqual(key, weather_cache.cache_key('harare,zw', 'today', {'include': 'hours'}))
+        self.assertNotEqual(key, weather_cache.cache_key('Harare,ZW', 'today', {'include': 'days'}))
+
+        with mock.patch('api.weather_cache.upstream.get') as get:
+            get.return_value.json.return_value = {'days': []}
+            weather_cache.fetch_visual_crossing_timeline('Harare,ZW', api_key='first')
+            weather_cache.fetch_visual_crossing_timeline('Harare,ZW', api_key='second')
+        self.assertEqual(get.call_count, 1)
+
+    def test_file_lock_is_exclusive_until_released(self):
+        first, second = FileLock('name'), FileLock('name')
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire(timeout=0.1))
+        with self.assertRaises(TimeoutError):
+            with second:
+                pass
+        first.release()
+        with second:
+            self.assertTrue(second.held)
+        self.assertFalse(second.held)
+
+
+class PredictLightTests(SimpleTestCase):
+    external = {
+        'current_weather': {'temperature': 18.0, 'humidity': 70, 'cloudcover': 80, 'visibility': 6,
+                            'wind_speed': 8},
+        'air_quality': {'aqi': 60},
+        'traffic_data': {'pedestrian_count': 10, 'vehicle_count': 5},
+    }
+    sensor = {'ambient_light_sensor': 15.0, 'motion_sensor': 1}
+
+    def setUp(self):
+        self.system = trained_system()
+        self.calls = []
+
+    async def fetch_external(self, *args):
+        self.calls.append(('weather', time.perf_counter()))
+        await asyncio.sleep(0.2)
+        return self.external
+
+    async def fetch_sensor(self, *args):
+        self.calls.append(('sensor', time.perf_counter()))
+        await asyncio.sleep(0.2)
+        return self.sensor
+
+    def predict(self, system):
+        with mock.patch.object(model_service, 'get_model_system', return_value=system), \
+                mock.patch.object(StreetlightMLSystem, 'aget_external_api_data', self.fetch_external), \
+                mock.patch.object(StreetlightMLSystem, 'asimulate_iot_sensor_data', self.fetch_sensor):
+            return self.client.get('/api/predict/')
+
+    def test_weather_and_sensors_are_fetched_concurrently(self):
+        response = self.predict(self.system)
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['prediction_source'], 'model')
+        # The second fetch starts before the first one's 0.2 s are up
+        (_, first), (_, second) = self.calls
+        self.assertLess(abs(second - first), 0.1)
+        timings = dict(stage.split(';dur=') for stage in response['Server-Timing'].split(', '))
+        self.assertGreaterEqual(float(timings['visual_crossing']), 1e3 * 0.19)
+        self.assertGreaterEqual(float(timings['thingspeak']), 1e3 * 0.19)
+
+        row = [payload['debug_info']['input_features'][name] for name in self.system.feature_columns]
+        expected = self.system.make_prediction(row, self.external, self.sensor)
+        self.assertAlmostEqual(payload['recommended_intensity'], expected['recommended_intensity'], places=4)
+
+    def test_rules_answer_while_the_model_loads(self):
+        response = self.predict(None)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['prediction_source'], 'rules')
+
+
+class UpstreamSessionTests(SimpleTestCase):
+    def setUp(self):
+        upstream.close_sessions()
+        self.addCleanup(upstream.close_sessions)
+
+    def test_one_session_per_host(self):
+        session = upstream.get_session('https://api.thingspeak.com/channels/1/feeds.json')
+        self.assertIs(upstream.get_session('https://api.thingspeak.com/update'), session)
+        self.assertIsNot(upstream.get_session('https://weather.visualcrossing.com/x'), session)
+
+        upstream.close_sessions()
+        self.assertIsNot(upstream.get_session('https://api.thingspeak.com/update'), session)
+
+    def test_concurrent_first_calls_share_the_session(self):
+        sessions = []
+        barrier = threading.Barrier(8)
+
+        def get():
+            barrier.wait()
+            sessions.append(upstream.get_session('https://api.thingspeak.com/update'))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(session) for session in sessions}), 1)
+
+    def test_only_idempotent_requests_are_retried(self):
+        adapter = upstream.get_session('https://api.thingspeak.com/').get_adapter('https://api.thingspeak.com/')
+        retry = adapter.max_retries
+        self.assertEqual(retry.total, settings.UPSTREAM_MAX_RETRIES)
+        self.assertFalse(retry.read)
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertEqual(adapter._pool_maxsize, settings.UPSTREAM_POOL_MAXSIZE)
+
+    def test_requests_get_the_default_timeout(self):
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=200)
+        with mock.patch('api.upstream.get_session', return_value=session):
+            upstream.get('https://api.thingspeak.com/x', params={'results': 1})
+            upstream.post('https://api.thingspeak.com/update', data={}, timeout=2)
+        self.assertEqual(session.request.call_args_list, [
+            mock.call('GET', 'https://api.thingspeak.com/x', params={'results': 1}, timeout=settings.UPSTREAM_TIMEOUT),
+            mock.call('POST', 'https://api.thingspeak.com/update', data={}, timeout=2),
+        ])
+
+
+class WriteQueueTests(TestCase):
+    def setUp(self):
+        self.queue = ThingSpeakWriteQueue(channel_id=1, write_api_key='key', interval=15, max_attempts=2)
+        # The test flushes itself instead of the flusher thread
+        patcher = mock.patch.object(self.queue, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('api.write_queue.upstream.post')
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.respond(200, '7')
+
+    def respond(self, status_code, text):
+        self.post.return_value = mock.Mock(status_code=status_code, text=text)
+
+    def test_rapid_toggles_are_coalesced_into_one_write(self):
+        writes = [self.queue.enqueue(lights_on) for lights_on in (1, 0, 1)]
+        self.queue.flush()
+
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual(self.post.call_args.kwargs['data']['field3'], 1)
+        latest = LightControlWrite.objects.get(id=writes[-1].id)
+        self.assertEqual((latest.status, latest.thingspeak_entry_id), (LightControlWrite.STATUS_SENT, 7))
+        for write in writes[:-1]:
+            write.refresh_from_db()
+            self.assertEqual(write.status, LightControlWrite.STATUS_SUPERSEDED)
+            status = write_status(write)
+            self.assertTrue(status['delivered'])
+            self.assertEqual(status['coalesced_into'], str(latest.ticket))
+
+    def test_writes_wait_for_the_channel_rate_limit(self):
+        self.queue.enqueue(1)
+        self.assertEqual(self.queue.flush(), 0)
+        self.queue.enqueue(0)
+
+        wait = self.queue.flush()
+        self.assertGreater(wait, 14)
+        self.assertEqual(self.post.call_count, 1)
+
+        self.queue.interval = 0
+        self.queue.flush()
+        self.assertEqual(self.post.call_count, 2)
+        self.assertIsNone(self.queue.flush())
+
+    def test_rejected_writes_are_retried_then_failed(self):
+        self.queue.interval = 0
+        write = self.queue.enqueue(1)
+        self.respond(200, '0')
+
+        self.queue.flush()
+        write.refresh_from_db()
+        self.assertEqual((write.status, write.attempts), (LightControlWrite.STATUS_PENDING, 1))
+        self.queue.flush()
+        write.refresh_from_db()
+        self.assertEqual((write.status, write.attempts), (LightControlWrite.STATUS_FAILED, 2))
+        self.assertIn('rate limited', write.error)
+
+    def test_writes_left_sending_by_a_dead_process_are_recovered(self):
+        self.queue.interval = 0
+        claimed_at = timezone.now() - timedelta(hours=1)
+        orphan = LightControlWrite.objects.create(
+            channel_id=1, lights_on=1, status=LightControlWrite.STATUS_SENDING, claimed_at=claimed_at
+        )
+        in_flight = LightControlWrite.objects.create(
+            channel_id=2, lights_on=1, status=LightControlWrite.STATUS_SENDING, claimed_at=timezone.now()
+        )
+        self.assertTrue(self.queue.start_if_outstanding())
+
+        self.queue.flush()
+        orphan.refresh_from_db()
+        self.assertEqual(orphan.status, LightControlWrite.STATUS_SENT)
+        self.assertEqual(self.post.call_count, 1)
+
+        # A newer request replaces a stale write instead of being undone by it
+        stale = LightControlWrite.objects.create(
+            channel_id=1, lights_on=1, status=LightControlWrite.STATUS_SENDING, claimed_at=claimed_at
+        )
+        newer = self.queue.enqueue(0)
+        self.queue.flush()
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.coalesced_into_id), (LightControlWrite.STATUS_SUPERSEDED, newer.id))
+        self.assertEqual(self.post.call_args.kwargs['data']['field3'], 0)
+
+        # Another channel's fresh claim is left to its process
+        in_flight.refresh_from_db()
+        self.assertEqual(in_flight.status, LightControlWrite.STATUS_SENDING)
+
+    def test_update_endpoint_returns_a_ticket(self):
+        with mock.patch('api.views.write_queue', self.queue):
+            response = self.client.post('/api/update_light_control/', json.dumps({'lights_on': 1}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+            status = self.client.get(response.json()['status_url']).json()
+
+        self.assertEqual(status['status'], LightControlWrite.STATUS_PENDING)
+        self.assertFalse(status['delivered'])
+
+
+class PredictionLogTests(TestCase):
+    def setUp(self):
+        self.buffer = PredictionLogBuffer(batch_size=3, flush_interval=60, max_buffer=5)
+        # The test flushes itself instead of the flusher thread
+        patcher = mock.patch.object(self.buffer, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recording_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            self.buffer.record(70.0, True, 0.4)
+            self.buffer.record_prediction({'recommended_intensity': 20.0, 'lights_should_be_on': True,
+                                           'confidence': 0.6})
+        self.assertEqual(len(self.buffer), 2)
+        self.assertFalse(PredictionLog.objects.exists())
+
+    def test_flush_writes_rows_and_their_rollups(self):
+        now = timezone.now()
+        self.buffer.record(70.0, True, 0.4, timestamp=now)
+        self.buffer.record_batch({
+            'recommended_intensity': np.array([10.0, 90.0]),
+            'lights_should_be_on': np.array([False, True]),
+            'confidence': np.array([0.8, 0.8]),
+        })
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(sorted(PredictionLog.objects.values_list('intensity', flat=True)), [10.0, 70.0, 90.0])
+        rollups = PredictionRollup.objects.all()
+        self.assertEqual(sum(rollup.count for rollup in rollups), 3)
+        self.assertEqual(sum(rollup.lights_on_count for rollup in rollups), 2)
+        self.assertEqual(min(rollup.intensity_min for rollup in rollups), 10.0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_a_full_batch_wakes_the_flusher(self):
+        self.buffer.record(50.0, True, 0.0)
+        self.buffer.record(50.0, True, 0.0)
+        self.assertFalse(self.buffer._wakeup.is_set())
+        self.buffer.record(50.0, True, 0.0)
+        self.assertTrue(self.buffer._wakeup.is_set())
+
+    def test_oldest_rows_are_dropped_when_the_buffer_is_full(self):
+        for intensity in range(7):
+            self.buffer.record(float(intensity), True, 0.5)
+        self.assertEqual(len(self.buffer), 5)
+        self.buffer.flush()
+        self.assertEqual(sorted(PredictionLog.objects.values_list('intensity', flat=True)), [2.0, 3.0, 4.0, 5.0, 6.0])
+
+    def test_failed_writes_are_logged_and_dropped(self):
+        self.buffer.record(50.0, True, 0.5)
+        with mock.patch('api.prediction_log.record_rollups', side_effect=DatabaseError("disk full")), \
+                self.assertLogs('api.prediction_log', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        # Rolled back together with the rollups
+        self.assertFalse(PredictionLog.objects.exists())
+
+
+class PredictionHistoryTests(TestCase):
+    start = datetime(2026, 3, 1, 22, 0, tzinfo=dt_timezone.utc)
+
+    def log(self, rows):
+        """Write (timestamp, intensity, lights_on, confidence) rows like the prediction log buffer"""
+        PredictionLog.objects.bulk_create(
+            PredictionLog(timestamp=ts, intensity=intensity, lights_on=lights_on, confidence=confidence)
+            for ts, intensity, lights_on, confidence in rows
+        )
+        prediction_history.record_rollups(rows)
+
+    def random_rows(self, count, seed=0):
+        rng = np.random.default_rng(seed)
+        offsets = np.sort(rng.integers(0, 3 * 86400, count))
+        intensity = rng.uniform(0, 100, count).round(2)
+        return [
+            (self.start + timedelta(seconds=int(offset)), float(value), bool(value > 40), float(value % 1))
+            for offset, value in zip(offsets, intensity)
+        ]
+
+    def history(self, **params):
+        response = self.client.get('/api/predictions/history/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def pages(self, **params):
+        payload = self.history(**params)
+        results = payload['results']
+        while payload['next_cursor']:
+            self.assertLess(len(results), 5000, "Paging does not advance")
+            payload = self.history(**params, cursor=payload['next_cursor'])
+            results += payload['results']
+        return results
+
+    def expected_buckets(self, rows, freq):
+        frame = pd.DataFrame(rows, columns=['timestamp', 'intensity', 'lights_on', 'confidence'])
+        grouped = frame.groupby(frame['timestamp'].dt.floor(freq))
+        return pd.DataFrame({
+            'count': grouped.size(),
+            'avg_intensity': grouped['intensity'].mean(),
+            'min_intensity': grouped['intensity'].min(),
+            'max_intensity': grouped['intensity'].max(),
+            'lights_on_fraction': grouped['lights_on'].mean(),
+            'avg_confidence': grouped['confidence'].mean(),
+        })
+
+    def test_raw_pages_cover_equal_timestamps_exactly_once(self):
+        rows = [(self.start + timedelta(seconds=second), 50.0, True, 0.9) for second in (0, 1, 1, 1, 1, 2, 3)]
+        self.log(rows)
+        expected = list(PredictionLog.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+
+        for limit in (1, 2, 3, 7):
+            results = self.pages(start=self.start.isoformat(), end=(self.start + timedelta(minutes=1)).isoformat(),
+                                 limit=limit)
+            self.assertEqual([row['id'] for row in results], expected, f"limit={limit}")
+
+    def test_buckets_match_the_raw_predictions(self):
+        rows = self.random_rows(2000)
+        # Two batches, so rollups written by the first are added to by the second
+        self.log(rows[::2])
+        self.log(rows[1::2])
+        end = self.start + timedelta(days=3)
+
+        for bucket, freq in (('5m', '5min'), ('1h', 'h'), ('1d', 'D')):
+            with self.subTest(bucket=bucket):
+                results = self.pages(bucket=bucket, start=self.start.isoformat(), end=end.isoformat(), limit=7)
+                expected = self.expected_buckets(rows, freq)
+                self.assertEqual([row['bucket_start'] for row in results],
+                                 [when.isoformat() for when in expected.index])
+                actual = pd.DataFrame(results).drop(columns='bucket_start')
+                pd.testing.assert_frame_equal(actual, expected.reset_index(drop=True), check_dtype=False)
+
+    def test_merged_rollups_match_the_upserted_ones(self):
+        rows = self.random_rows(500, seed=1)
+        self.log(rows[:250])
+        self.log(rows[250:])
+        upserted = pd.DataFrame(PredictionRollup.objects.order_by('bucket_start').values()).drop(columns='id')
+
+        PredictionRollup.objects.all().delete()
+        with mock.patch.dict(prediction_history._UPSERT_FUNCTIONS, clear=True), \
+                mock.patch.object(prediction_history, '_upsert_rollups') as upsert:
+            prediction_history.record_rollups(rows[:250])
+            prediction_history.record_rollups(rows[250:])
+        upsert.assert_not_called()
+        merged = pd.DataFrame(PredictionRollup.objects.order_by('bucket_start').values()).drop(columns='id')
+
+        pd.testing.assert_frame_equal(merged, upserted)
+
+    def test_invalid_parameters_are_rejected(self):
+        start = self.start.isoformat()
+        for params in (
+            {'bucket': '2h'},
+            {'limit': 0},
+            {'limit': prediction_history.MAX_LIMIT + 1},
+            {'start': 'yesterday'},
+            {'start': start, 'end': start},
+            {'cursor': 'not-a-cursor'},
+            # Bucket cursors have no id, so they can't page raw rows
+            {'cursor': prediction_history.encode_cursor({'t': start})},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/predictions/history/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+
+
+class SensorSyncTests(TestCase):
+    def setUp(self):
+        self.sync = ThingSpeakSensorSync(channel_id=1, read_api_key='key', interval=60)
+        patcher = mock.patch('api.sensor_sync.upstream.get')
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def feed(self, *entry_ids):
+        feeds = [
+            {'entry_id': entry_id, 'created_at': f'2026-10-01T10:{entry_id:02d}:00Z',
+             'field1': str(entry_id * 1.5), 'field2': str(entry_id % 2), 'field3': ''}
+            for entry_id in entry_ids
+        ]
+        self.get.return_value = mock.Mock(json=mock.Mock(return_value={'feeds': feeds}),
+                                          raise_for_status=mock.Mock())
+
+    def mirrored(self):
+        return list(SensorEntry.objects.filter(channel_id=1).order_by('entry_id').values_list('entry_id', flat=True))
+
+    def test_only_new_entries_are_mirrored(self):
+        self.feed(1, 2, 3)
+        self.assertEqual(self.sync.sync(), 3)
+        self.assertEqual(self.get.call_args.kwargs['params']['results'], settings.THINGSPEAK_SYNC_INITIAL_RESULTS)
+
+        # ThingSpeak returns entries from the last one's time on, including it
+        self.feed(3, 4)
+        self.assertEqual(self.sync.sync(force=True), 1)
+        params = self.get.call_args.kwargs['params']
+        self.assertEqual(params['start'], '2026-10-01 10:03:00')
+        self.assertEqual(params['results'], settings.THINGSPEAK_SYNC_MAX_RESULTS)
+        self.assertEqual(self.mirrored(), [1, 2, 3, 4])
+        entry = SensorEntry.objects.get(channel_id=1, entry_id=4)
+        self.assertEqual((entry.ambient_light, entry.motion, entry.light_control), (6.0, 0, None))
+
+    def test_one_poll_per_interval_across_syncers(self):
+        self.feed(1)
+        self.assertEqual(self.sync.sync(), 1)
+        other_process = ThingSpeakSensorSync(channel_id=1, read_api_key='key', interval=60)
+        self.assertIsNone(other_process.sync())
+        self.assertEqual(self.get.call_count, 1)
+
+        SensorSyncState.objects.filter(channel_id=1).update(last_polled_at=timezone.now() - timedelta(seconds=60))
+        self.feed(1, 2)
+        self.assertEqual(other_process.sync(), 1)
+
+    def test_upstream_errors_are_recorded(self):
+        self.get.side_effect = ConnectionError("unreachable")
+        with self.assertRaises(ConnectionError):
+            self.sync.sync()
+        self.assertEqual(SensorSyncState.objects.get(channel_id=1).last_error, "unreachable")
+
+        self.get.side_effect = None
+        self.feed(1)
+        self.sync.sync(force=True)
+        self.assertEqual(SensorSyncState.objects.get(channel_id=1).last_error, '')
+
+    def test_skipped_entries_are_logged(self):
+        self.feed(1)
+        self.sync.sync()
+        with override_settings(THINGSPEAK_SYNC_MAX_RESULTS=2), self.assertLogs('api.sensor_sync', 'WARNING') as logs:
+            self.feed(5, 6)
+            self.sync.sync(force=True)
+        self.assertIn('entries 2-4 were not mirrored', logs.output[0])
+
+    def test_payloads_read_as_tuples_match_the_model_payloads(self):
+        self.feed(1, 2, 3)
+        self.sync.sync()
+        entries = SensorEntry.objects.filter(channel_id=1).order_by('entry_id')
+        self.assertEqual(entry_payloads(entries), [entry_payload(entry) for entry in entries])
+
+    def test_endpoints_serve_the_mirror(self):
+        channel_id = settings.THINGSPEAK_CHANNEL_ID
+        SensorSyncState.objects.create(channel_id=channel_id, last_entry_id=3, last_polled_at=timezone.now(),
+                                       last_synced_at=timezone.now())
+        SensorEntry.objects.bulk_create(
+            SensorEntry(channel_id=channel_id, entry_id=entry_id, ambient_light=10.0 * entry_id, motion=1,
+                        created_at=timezone.now())
+            for entry_id in (1, 2, 3)
+        )
+        with mock.patch('api.sensor_sync.sensor_sync.start'):
+            latest = self.client.get('/api/get_sensor_data_from_thingspeak/').json()
+            unchanged = self.client.get('/api/get_sensor_data_from_thingspeak/?since_entry_id=3').json()
+            logs = self.client.get('/api/sensor-logs/live/?results=2').json()
+            delta = self.client.get('/api/sensor-logs/live/?since_entry_id=3').json()
+
+        self.get.assert_not_called()
+        self.assertEqual((latest['entry_id'], latest['ambient_light_sensor']), (3, 30.0))
+        self.assertEqual(unchanged, {'status': 'no_new_data', 'entry_id': 3})
+        self.assertEqual([log['entry_id'] for log in logs['live_logs']], [3, 2])
+        self.assertEqual((delta['live_logs'], delta['last_entry_id']), ([], 3))
+
+
+class SensorStreamHubTests(TestCase):
+    def setUp(self):
+        # The test drives the hub's polls itself instead of its thread
+        patcher = mock.patch.object(SensorStreamHub, '_run', lambda hub: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hub = SensorStreamHub(poll_interval=60, heartbeat_interval=0.01, queue_size=3)
+        self.next_entry_id = 1
+
+    def publish(self, count=1):
+        """Mirror `count` new entries; returns their ids"""
+        ids = list(range(self.next_entry_id, self.next_entry_id + count))
+        SensorEntry.objects.bulk_create([
+            SensorEntry(channel_id=settings.THINGSPEAK_CHANNEL_ID, entry_id=entry_id,
+                        created_at=timezone.now(), ambient_light=40.0, motion=1)
+            for entry_id in ids
+        ])
+        self.next_entry_id += count
+        return ids
+
+    def connect(self, since_entry_id=None):
+        stream = self.hub.stream(since_entry_id)
+        self.assertEqual(next(stream), STREAM_PREAMBLE)
+        self.addCleanup(stream.close)
+        return stream
+
+    def received(self, stream, count):
+        """Entry ids of the next `count` events, skipping heartbeats"""
+        ids = []
+        for _ in range(count + 10):
+            entry_id = event_id(next(stream))
+            if entry_id is not None:
+                ids.append(entry_id)
+            if len(ids) == count:
+                return ids
+        self.fail(f"Received {ids}, expected {count} events")
+
+    def test_idle_subscribers_receive_every_entry_in_steady_memory(self):
+        self.publish(2)
+        # Build the lazily created state (format_event, querysets) once first
+        self.received(self.connect(since_entry_id=0), 2)
+
+        subscribers = 1000
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        streams = [self.connect() for _ in range(subscribers)]
+        gc.collect()
+        connected = tracemalloc.get_traced_memory()[0]
+
+        for _ in range(2):
+            ids = self.publish(3)
+            self.hub.poll()
+            for stream in streams:
+                self.assertEqual(self.received(stream, 3), ids)
+        gc.collect()
+        published = tracemalloc.get_traced_memory()[0]
+
+        self.assertEqual(len(self.hub), subscribers + 1)
+        # A subscriber is a queue and a suspended generator. These are the WSGI
+        # generators driven in one thread, so this bounds memory, not threads
+        self.assertLess((connected - before) / subscribers, 8 * 1024)
+        # Batches are serialized once and shared, then dropped once read
+        self.assertLess(published - connected, 256 * 1024)
+
+        for stream in streams:
+            stream.close()
+        self.assertEqual(len(self.hub), 1)
+
+    def test_last_event_id_resumes_after_the_given_entry(self):
+        self.publish(4)
+        stream = self.connect(since_entry_id=1)
+        self.assertEqual(self.received(stream, 3), [2, 3, 4])
+
+        ids = self.publish(2)
+        self.hub.poll()
+        self.assertEqual(self.received(stream, 2), ids)
+
+    def test_view_reads_last_event_id_and_since_entry_id(self):
+        self.publish(3)
+        with mock.patch('api.views.sensor_stream_hub', self.hub), \
+                mock.patch('api.views.sensor_sync.ensure_synced'):
+            for headers, query in (({'HTTP_LAST_EVENT_ID': '1'}, ''), ({}, '?since_entry_id=1')):
+                response = self.client.get(f'/api/sensor-logs/stream/{query}', **headers)
+                self.assertEqual(response['Content-Type'], 'text/event-stream')
+                stream = iter(response.streaming_content)
+                self.assertEqual(next(stream), STREAM_PREAMBLE)
+                self.assertEqual(self.received(stream, 2), [2, 3])
+                response.close()
+
+            response = self.client.get('/api/sensor-logs/stream/?since_entry_id=x')
+            self.assertEqual(response.status_code, 400)
+
+    def test_entries_mirrored_before_the_first_poll_are_not_missed(self):
+        self.publish(3)
+        live = self.connect()
+        resumed = self.connect(since_entry_id=1)
+        # Mirrored after both subscribed, before the hub polled
+        ids = self.publish(2)
+        self.hub.poll()
+
+        self.assertEqual(self.received(live, 2), ids)
+        self.assertEqual(self.received(resumed, 4), [2, 3, *ids])
+
+    def test_backlog_stops_where_the_hub_pushes_start(self):
+        live = self.connect()
+        first = self.publish(2)
+        # Subscribes after the entries are mirrored but before the poll that pushes them
+        resumed = self.connect(since_entry_id=0)
+        self.hub.poll()
+        second = self.publish(1)
+        self.hub.poll()
+
+        self.assertEqual(self.received(live, 3), first + second)
+        self.assertEqual(self.received(resumed, 3), first + second)
+
+    def test_slow_subscriber_loses_its_oldest_batches(self):
+        slow = self.connect()
+        fast = self.connect()
+        published = []
+        for _ in range(5):
+            published += self.publish(1)
+            self.hub.poll()
+            self.assertEqual(self.received(fast, 1), published[-1:])
+
+        # queue_size=3: the two oldest batches were dropped
+        self.assertEqual(self.received(slow, 3), published[2:])
+        self.assertIsNone(event_id(next(slow)))
+
+
+class FleetPredictionTests(TestCase):
+    now = datetime(2026, 6, 1, 19, 0)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lights = [
+            Streetlight.objects.create(name=f'Light {number}', channel_id=100 + number, area=area)
+            for number, area in enumerate(['Harare,Zimbabwe', 'Bulawayo,Zimbabwe', 'Harare,Zimbabwe'])
+        ]
+
+    def setUp(self):
+        self.system = trained_system()
+        self.sun = solar.site_sun(datetime(2026, 6, 1, 17, 0, tzinfo=dt_timezone.utc))
+        for target, value in (('api.fleet.site_now', self.now), ('api.fleet.site_sun', self.sun)):
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.system, 'get_external_api_data', side_effect=self.external)
+        self.get_external_api_data = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def external(self, area):
+        bulawayo = area.startswith('Bulawayo')
+        return {
+            'current_weather': {'temperature': 12.0 if bulawayo else 18.0, 'humidity': 70, 'cloudcover': 90,
+                                'visibility': 6, 'wind_speed': 8},
+            'air_quality': {'aqi': 120 if bulawayo else 40},
+            'traffic_data': {'pedestrian_count': 30, 'vehicle_count': 10},
+        }
+
+    def sensor(self, light):
+        if light.channel_id == 102:
+            raise ValueError('No data available from ThingSpeak')
+        return {'entry_id': 1, 'ambient_light_sensor': 10.0 * (light.channel_id - 99), 'motion_sensor': 1,
+                'timestamp': ''}
+
+    def test_fleet_matches_make_prediction_per_light(self):
+        with mock.patch('api.fleet.fetch_light_sensor', side_effect=self.sensor), \
+                self.assertLogs('api.fleet', 'WARNING'):
+            results, timings = predict_fleet(self.system, self.lights, max_workers=2)
+
+        # One weather lookup per area
+        self.assertEqual(sorted(call.args[0] for call in self.get_external_api_data.call_args_list),
+                         ['Bulawayo,Zimbabwe', 'Harare,Zimbabwe'])
+        self.assertEqual((timings['lights'], timings['areas']), (3, 2))
+        for light, result in zip(self.lights, results):
+            external = self.external(light.area)
+            row = self.system.feature_pipeline.transform_one(
+                weather_inputs(external['current_weather'], self.sun), self.now, self.sun.daylight_duration,
+                out=np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+            )[0]
+            sensor = None if result['sensor_error'] else self.sensor(light)
+            single = self.system.make_prediction(list(row), external, sensor)
+            self.assertEqual(result['id'], light.id)
+            self.assertAlmostEqual(result['recommended_intensity'], single['recommended_intensity'], places=4)
+            self.assertEqual(result['lights_should_be_on'], single['lights_should_be_on'])
+        self.assertEqual(results[2]['sensor_error'], 'No data available from ThingSpeak')
+        self.assertIsNone(results[2]['sensor'])
+
+    def test_endpoint_filters_active_lights_by_area(self):
+        Streetlight.objects.filter(channel_id=100).update(active=False)
+        with mock.patch('api.fleet.fetch_light_sensor', side_effect=self.sensor), \
+                mock.patch('api.views.get_trained_model_system', return_value=self.system):
+            payload = self.client.get('/api/fleet/predict/', {'area': 'Bulawayo,Zimbabwe'}).json()
+            missing = self.client.get('/api/fleet/predict/', {'area': 'Mutare,Zimbabwe'})
+
+        self.assertEqual([light['channel_id'] for light in payload['lights']], [101])
+        self.assertEqual(missing.status_code, 404)
+
+
+class TreeEnsemblePredictorTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.system = trained_system()
+        cls.model = cls.system.light_intensity_model
+        cls.predictor = TreeEnsemblePredictor.from_booster(cls.model)
+        cls.X = feature_matrix(cls.system, training_rows(24 * 14))
+
+    def test_predictions_match_the_booster_bit_for_bit(self):
+        np.testing.assert_array_equal(self.predictor.predict(self.X), self.model.predict(self.X))
+
+    def test_missing_values_follow_the_default_branch(self):
+        import xgboost as xgb
+
+        # Trained with missing values, so splits learn both default directions
+        rng = np.random.default_rng(0)
+        X = rng.random((2000, 4)).astype(np.float32)
+        y = 10 * X[:, 0] + 5 * X[:, 1] - 3 * X[:, 2]
+        X[(rng.random(X.shape) < 0.2) & (y[:, None] > 6)] = np.nan
+        model = xgb.XGBRegressor(n_estimators=40, max_depth=4, random_state=0).fit(X, y)
+        predictor = TreeEnsemblePredictor.from_booster(model)
+        splits = predictor.thresholds < np.inf
+        self.assertTrue(predictor.default_left[splits].any())
+        self.assertFalse(predictor.default_left[splits].all())
+
+        X_test = rng.random((500, 4)).astype(np.float32)
+        X_test[rng.random(X_test.shape) < 0.3] = np.nan
+        X_test[0] = np.nan
+        np.testing.assert_array_equal(predictor.predict(X_test), model.predict(X_test))
+        # And the serving model on rows with missing features
+        X_serving = self.X.copy()
+        X_serving[rng.random(X_serving.shape) < 0.3] = np.nan
+        np.testing.assert_array_equal(self.predictor.predict(X_serving), self.model.predict(X_serving))
+
+    def test_serving_uses_it_for_single_rows(self):
+        self.assertIsInstance(self.system.single_row_predictor, TreeEnsemblePredictor)
+        row = self.X[:1]
+        self.assertEqual(self.system.single_row_predictor.predict_one(row[0]), self.model.predict(row)[0])
+
+    def test_unsupported_models_are_rejected(self):
+        import xgboost as xgb
+
+        rng = np.random.default_rng(0)
+        X = rng.random((50, 3))
+        classifier = xgb.XGBClassifier(n_estimators=2, max_depth=2).fit(X, X[:, 0] > 0.5)
+        with self.assertRaisesRegex(ValueError, 'Unsupported objective'):
+            TreeEnsemblePredictor.from_booster(classifier)
+
+
+class BenchmarkSuiteTests(SimpleTestCase):
+    def test_measure_reports_timings_and_allocations(self):
+        calls = []
+        result = suite.measure(lambda: calls.append(bytearray(256 * 1024)), iterations=5)
+
+        # A warm-up call, the timed ones and the traced one
+        self.assertEqual(len(calls), 7)
+        self.assertEqual(result['iterations'], 5)
+        self.assertLessEqual(result['min_ms'], result['median_ms'])
+        self.assertLessEqual(result['median_ms'], result['p95_ms'])
+        self.assertGreaterEqual(result['alloc_peak_kb'], 256)
+
+    def test_compare_flags_metrics_past_the_threshold(self):
+        baseline = {'cases': {
+            'make_prediction': {'median_ms': 1.0, 'alloc_peak_kb': 100.0, 'peak_rss_mb': 200.0},
+            'train_models': {'median_ms': 500.0, 'alloc_peak_kb': 0, 'peak_rss_mb': 300.0},
+        }}
+        results = {
+            'make_prediction': {'median_ms': 1.3, 'alloc_peak_kb': 105.0, 'peak_rss_mb': 200.0},
+            'train_models': {'median_ms': 450.0, 'alloc_peak_kb': 50.0, 'peak_rss_mb': 400.0},
+            'predict_light': {'median_ms': 5.0, 'alloc_peak_kb': 1.0, 'peak_rss_mb': 1.0},
+        }
+        with mock.patch('builtins.print'):
+            regressions = suite.compare(results, baseline, threshold=0.1)
+        # A zero baseline can't regress, and new cases have no baseline
+        self.assertEqual(regressions, [('make_prediction', 'median_ms'), ('train_models', 'peak_rss_mb')])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', ('view',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, view='a')
+
+        self.assertEqual(histogram.count(view='a'), 4)
+        self.assertEqual(histogram.render().splitlines(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a",le="0.1"} 2',
+            'test_seconds_bucket{view="a",le="1.0"} 3',
+            'test_seconds_bucket{view="a",le="+Inf"} 4',
+            'test_seconds_sum{view="a"} 2.65',
+            'test_seconds_count{view="a"} 4',
+        ])
+
+    def test_counter_labels_are_checked_and_escaped(self):
+        counter = metrics.Counter('test_errors', 'Test.', ('error',))
+        counter.inc(error='say "hi"\n')
+        counter.inc(2, error='say "hi"\n')
+        self.assertEqual(counter.render().splitlines()[-1], 'test_errors_total{error="say \\"hi\\"\\n"} 3')
+        with self.assertRaises(ValueError):
+            counter.inc(kind='timeout')
+
+    def test_timed_views_record_stages_and_server_timing(self):
+        @metrics.timed_view('test_view')
+        def view(request):
+            with request.stage_timer.stage('work'):
+                pass
+            return HttpResponse()
+
+        @metrics.timed_view('test_async_view')
+        async def async_view(request):
+            await request.stage_timer.timed('fetch', asyncio.sleep(0))
+            return HttpResponse()
+
+        before = metrics.STAGE_SECONDS.count(view='test_view', stage='work')
+        response = view(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'^work;dur=\d+\.\d\d, total;dur=\d+\.\d\d$')
+        self.assertEqual(metrics.STAGE_SECONDS.count(view='test_view', stage='work'), before + 1)
+
+        response = async_to_sync(async_view)(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'^fetch;dur=\d+\.\d\d, total;dur=\d+\.\d\d$')
+
+    def test_upstream_failures_are_counted(self):
+        url = f'{settings.THINGSPEAK_API_URL}/channels/1/feeds.json'
+        timeouts = metrics.UPSTREAM_ERRORS.value(upstream='thingspeak', error='timeout')
+        server_errors = metrics.UPSTREAM_ERRORS.value(upstream='thingspeak', error='http_5xx')
+        calls = metrics.UPSTREAM_SECONDS.count(upstream='thingspeak')
+        session = mock.Mock()
+        with mock.patch('api.upstream.get_session', return_value=session):
+            session.request.side_effect = requests.exceptions.Timeout()
+            with self.assertRaises(requests.exceptions.Timeout):
+                upstream.get(url)
+            session.request.side_effect = None
+            session.request.return_value = mock.Mock(status_code=503)
+            upstream.get(url)
+
+        self.assertEqual(metrics.UPSTREAM_ERRORS.value(upstream='thingspeak', error='timeout'), timeouts + 1)
+        self.assertEqual(metrics.UPSTREAM_ERRORS.value(upstream='thingspeak', error='http_5xx'), server_errors + 1)
+        self.assertEqual(metrics.UPSTREAM_SECONDS.count(upstream='thingspeak'), calls + 2)
+
+    def test_metrics_endpoint(self):
+        metrics.STAGE_SECONDS.observe(0.01, view='test_endpoint', stage='total')
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn('streetlight_stage_duration_seconds_count{view="test_endpoint",stage="total"}',
+                      response.content.decode())
+
+
+class LogHandlerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='test-logs-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'app.log')
+        self.handler = BackgroundQueueHandler(filename=self.path, console='off', queue_size=100)
+        self.addCleanup(self.handler.close)
+        self.logger = logging.getLogger('api.tests.log_handlers')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def records(self):
+        self.handler.stop()
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_records_are_written_as_json_lines(self):
+        self.logger.info("Model %s loaded", 'v2', extra={'seconds': 1.5, 'path': 'models/x'})
+        try:
+            raise ValueError("bad row")
+        except ValueError:
+            self.logger.exception("Prediction failed")
+
+        loaded, failed = self.records()
+        self.assertEqual(
+            {key: loaded[key] for key in ('level', 'logger', 'message', 'seconds', 'path')},
+            {'level': 'INFO', 'logger': 'api.tests.log_handlers', 'message': 'Model v2 loaded', 'seconds': 1.5,
+             'path': 'models/x'},
+        )
+        self.assertEqual(failed['level'], 'ERROR')
+        self.assertIn('ValueError: bad row', failed['exc'])
+
+    def test_messages_are_resolved_when_logged(self):
+        rows = [1, 2]
+        self.logger.info("Rows: %s", rows)
+        rows.append(3)
+        self.assertEqual(self.records()[0]['message'], 'Rows: [1, 2]')
+
+    def test_records_are_dropped_when_the_queue_is_full(self):
+        # Nothing drains the queue while the listener is stopped
+        self.handler.stop()
+        for number in range(105):
+            self.logger.info("Record %d", number)
+        self.assertEqual(self.handler.dropped, 5)
+
+        self.handler.start()
+        self.assertEqual(len(self.records()), 100)
+
+
+class JsonResponseTests(SimpleTestCase):
+    def test_numpy_values_are_encoded_as_python_ones(self):
+        payload = {
+            'intensity': np.float32(42.5),
+            'count': np.int64(3),
+            'on': np.bool_(True),
+            'row': np.array([[1.5, 2.0]], dtype=np.float32),
+            'at': datetime(2026, 10, 1, 12, 0, tzinfo=dt_timezone.utc),
+        }
+        response = JsonResponse(payload)
+        self.assertEqual(response.content, b'{"intensity":42.5,"count":3,"on":true,"row":[[1.5,2.0]],'
+                                           b'"at":"2026-10-01T12:00:00Z"}')
+
+    def test_batch_endpoint_output_round_trips(self):
+        system = trained_system()
+        X = feature_matrix(system, training_rows(24))
+        predictions = system.make_prediction_batch(X, record=False)
+        decoded = json.loads(JsonResponse({'predictions': predictions}).content)['predictions']
+        np.testing.assert_array_equal(decoded['recommended_intensity'], predictions['recommended_intensity'])
+        self.assertEqual(decoded['lights_should_be_on'], predictions['lights_should_be_on'].tolist())
+
+    def test_unknown_types_still_fail(self):
+        with self.assertRaises(TypeError):
+            JsonResponse({'value': object()})
+
+
+def hourly_forecast(first_day, days=3, tzoffset=2.0):
+    """A Visual Crossing hourly forecast from local midnight of `first_day`; some values left out"""
+    forecast = {'tzoffset': tzoffset, 'days': []}
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        hours = []
+        for hour in range(24):
+            epoch = int(datetime(day.year, day.month, day.day, hour, tzinfo=dt_timezone.utc).timestamp()
+                        - tzoffset * 3600)
+            values = {'datetime': f'{hour:02d}:00:00', 'datetimeEpoch': epoch, 'temp': 15.0 + hour / 2,
+                      'humidity': 50.0 + hour, 'pressure': 1015.0, 'cloudcover': (hour * 7) % 100,
+                      'visibility': 8.0, 'windspeed': 12.0, 'precipprob': 10.0}
+            if hour % 2:
+                values['solarradiation'] = 100.0
+            if hour == 5:
+                del values['humidity']
+            hours.append(values)
+        forecast['days'].append({'datetime': f'{day:%Y-%m-%d}', 'tempmax': 28.0, 'tempmin': 12.0, 'hours': hours})
+    return forecast
+
+
+class LightingScheduleTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='test-schedule-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = override_settings(LOCK_DIR=directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.system = trained_system()
+
+    def test_forecast_hours_fill_gaps(self):
+        forecast = hourly_forecast(datetime(2026, 6, 1))
+        start = forecast['days'][0]['hours'][3]['datetimeEpoch']
+
+        epochs, local_times, weather, daylight = forecast_hours(forecast, start, 30)
+
+        self.assertEqual(len(epochs), 30)
+        self.assertEqual(str(local_times[0]), '2026-06-01T03:00:00')
+        np.testing.assert_array_equal(np.diff(epochs), 3600)
+        # Daily values for what the hours leave out, then the defaults
+        np.testing.assert_array_equal(weather['tempmax'], 28.0)
+        self.assertEqual(weather['humidity'][2], schedule.FORECAST_DEFAULTS['humidity'])
+        # Missing radiation is estimated: none at night, some by day
+        self.assertEqual(weather['solarradiation'][1], 0.0)  # 04:00
+        self.assertGreater(weather['solarradiation'][9], 0.0)  # 12:00
+        self.assertEqual(weather['solarradiation'][10], 100.0)  # 13:00, from the forecast
+        self.assertEqual(daylight.shape, (30,))
+
+    def test_schedule_matches_make_prediction_per_hour(self):
+        forecast = hourly_forecast(datetime(2026, 6, 1))
+        start = forecast['days'][0]['hours'][0]['datetimeEpoch']
+        hours = schedule.build_schedule(self.system, forecast, start, 36)
+        _, local_times, weather, daylight = forecast_hours(forecast, start, 36)
+
+        self.assertEqual(len(hours), 36)
+        self.assertEqual(hours[0]['time'], '2026-05-31T22:00:00Z')
+        self.assertEqual(hours[0]['local_time'], '2026-06-01T00:00:00')
+        for i, hour in enumerate(hours):
+            row = self.system.feature_pipeline.transform_one(
+                {name: values[i] for name, values in weather.items()}, local_times[i].astype(datetime), daylight[i],
+                out=np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+            )[0]
+            single = self.system.make_prediction(list(row))
+            self.assertAlmostEqual(hour['recommended_intensity'], single['recommended_intensity'], places=2)
+            self.assertEqual(hour['lights_should_be_on'], single['lights_should_be_on'])
+
+    def test_schedules_are_built_once_per_interval_and_served(self):
+        scheduler = LightingScheduler(hours=36, interval=3600, retention_days=7)
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        with mock.patch('api.schedule.fetch_forecast', return_value=hourly_forecast(today - timedelta(days=1))) \
+                as fetch, mock.patch('api.model_service.get_model_system', return_value=self.system), \
+                mock.patch.object(scheduler, 'start'):
+            built = scheduler.refresh('Harare,Zimbabwe')
+            self.assertIsNone(scheduler.refresh('Harare,Zimbabwe'))
+            self.assertEqual(scheduler.ensure_schedule('Harare,Zimbabwe'), built)
+        fetch.assert_called_once()
+        self.assertEqual(len(built.hours), 36)
+        self.assertEqual(built.starts_at, built.generated_at.replace(minute=0, second=0, microsecond=0))
+
+        later = built.generated_at + timedelta(hours=2)
+        self.assertEqual(current_hours(built, later)[0]['time'], later.strftime('%Y-%m-%dT%H:00:00Z'))
+        self.assertEqual(len(current_hours(built, later)), 34)
+
+        with mock.patch('api.views.lighting_scheduler', scheduler), mock.patch.object(scheduler, 'start'):
+            response = self.client.get('/api/schedule/')
+            missing = self.client.get('/api/schedule/', {'location': 'Mutare,Zimbabwe'})
+        self.assertEqual(response.json()['hours'], current_hours(built))
+        self.assertRegex(response['Cache-Control'], r'^max-age=\d+$')
+        self.assertEqual(missing.status_code, 404)
+
+
+class SolarTests(SimpleTestCase):
+    # Published sunrise and sunset on the local clock, to the minute
+    REFERENCE_TIMES = [
+        # date, latitude, longitude, time zone, sunrise, sunset
+        ('2024-06-21', 51.5074, -0.1278, 'Europe/London', '04:43', '21:21'),
+        ('2024-12-21', 51.5074, -0.1278, 'Europe/London', '08:04', '15:53'),
+        ('2024-06-21', -17.8252, 31.0335, 'Africa/Harare', '06:26', '17:30'),
+        ('2024-12-21', -17.8252, 31.0335, 'Africa/Harare', '05:18', '18:30'),
+    ]
+
+    def test_sun_times_match_published_times(self):
+        for date, latitude, longitude, tz, sunrise, sunset in self.REFERENCE_TIMES:
+            with self.subTest(date=date, tz=tz):
+                times = solar.sun_times(np.array([date]), latitude, longitude)
+                self.assertIsInstance(times, solar.SunTimes)
+                for epoch, expected in ((times.sunrise[0], sunrise), (times.sunset[0], sunset)):
+                    local = pd.Timestamp(epoch, unit='s', tz='UTC').tz_convert(tz).tz_localize(None)
+                    minutes = (local - pd.Timestamp(f'{date} {expected}')).total_seconds() / 60
+                    self.assertLessEqual(abs(minutes), 1, f"{local} vs {expected}")
+                self.assertAlmostEqual(times.daylight_hours[0], (times.sunset[0] - times.sunrise[0]) / 3600)
+
+    def test_sun_is_on_the_horizon_at_sunrise_and_sunset(self):
+        dates = np.arange('2024-01-01', '2025-01-01', dtype='datetime64[D]')
+        times = solar.sun_times(dates, -17.8252, 31.0335)
+        for epochs in (times.sunrise, times.sunset):
+            elevation = solar.solar_elevation(epochs, -17.8252, 31.0335)
+            # Sunrise and sunset use the sun terms at solar noon: within a tenth of a degree
+            np.testing.assert_allclose(elevation, 90 - solar.SUNRISE_ZENITH, atol=0.1)
+
+    def test_polar_day_and_night(self):
+        times = solar.sun_times(np.array(['2024-06-21', '2024-12-21']), 70.0, 0.0)
+        np.testing.assert_array_equal(times.daylight_hours, [24.0, 0.0])
+        self.assertEqual(times.sunset[0] - times.sunrise[0], 86400)
+        self.assertEqual(times.sunset[1], times.sunrise[1])
+
+    def test_daily_sun_times_match_the_vectorized_ones(self):
+        dates = np.array(['2024-03-20', '2024-09-22'], dtype='datetime64[D]')
+        times = solar.sun_times(dates, -17.8252, 31.0335)
+        for index, day in enumerate(dates.astype(np.int64)):
+            self.assertEqual(solar.daily_sun_times(int(day), -17.8252, 31.0335),
+                             tuple(float(column[index]) for column in times))
+
+
+class ModelUpdateTests(SimpleTestCase):
+    NEW_ROWS = 24 * 7
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The training CSV is not in time order; updates take the rows after the model's newest
+        rows = training_rows(None)
+        rows = rows.iloc[np.argsort(pd.to_datetime(rows['datetime']).to_numpy(), kind='stable')]
+        cls.rows = rows.head(TRAINING_ROWS + cls.NEW_ROWS).reset_index(drop=True)
+        cls.system = StreetlightMLSystem()
+        cls.system.train_models(create_features(cls.rows.head(TRAINING_ROWS)))
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='test-model-updates-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        csv_path = os.path.join(directory, 'training.csv')
+        self.rows.to_csv(csv_path, index=False)
+        overrides = override_settings(
+            TRAINING_DATA_PATH=csv_path,
+            DATASET_CACHE_DIR=os.path.join(directory, 'dataset'),
+            ML_MODEL_DIR=os.path.join(directory, 'models'),
+            LOCK_DIR=os.path.join(directory, 'locks'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        for name, value in (('get_model_system', self.system), ('swap_model_system', None)):
+            patcher = mock.patch(f'api.model_service.{name}', return_value=value)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def updater(self, **options):
+        return ModelUpdater(**{'rounds': 5, 'min_rows': 24, 'max_trees': 10000, 'mae_tolerance': 0.1,
+                               'mae_epsilon': 0.001, **options})
+
+    def test_gate_allows_a_relative_rise_plus_epsilon(self):
+        def report(before, after):
+            return {'train_rows': 100, 'holdout': {'mae_before': before, 'mae_after': after}}
+
+        self.assertTrue(passes_validation(report(2.0, 2.2), 0.1, 0))
+        self.assertFalse(passes_validation(report(2.0, 2.21), 0.1, 0))
+        # A near-zero MAE is not failed by noise
+        self.assertTrue(passes_validation(report(0.0001, 0.0009), 0.1, 0.001))
+        self.assertFalse(passes_validation(report(0.0001, 0.002), 0.1, 0.001))
+
+        both = report(2.0, 1.0)
+        both['reference'] = {'mae_before': 1.0, 'mae_after': 1.5}
+        self.assertFalse(passes_validation(both, 0.1, 0.001))
+
+    def test_update_boosts_a_copy_on_the_new_rows(self):
+        trees = self.system.light_intensity_model.get_booster().num_boosted_rounds()
+        new_rows = self.rows.iloc[TRAINING_ROWS:]
+
+        updated, report = self.system.update_model(new_rows, rounds=5, reference_rows=self.rows.head(500))
+
+        self.assertEqual(self.system.light_intensity_model.get_booster().num_boosted_rounds(), trees)
+        self.assertEqual(report['trees'], trees + 5)
+        self.assertEqual(report['train_rows'] + report['holdout']['rows'], self.NEW_ROWS)
+        self.assertEqual(report['reference']['rows'], 500)
+        self.assertGreater(pd.Timestamp(updated.trained_through), pd.Timestamp(self.system.trained_through))
+        X = feature_matrix(self.system, new_rows)
+        self.assertFalse(np.array_equal(updated.light_intensity_model.predict(X),
+                                        self.system.light_intensity_model.predict(X)))
+
+    def test_rejected_updates_are_not_retried(self):
+        rejected = {'holdout': {'rows': 30, 'mae_before': 1.0, 'mae_after': 2.0}}
+        with mock.patch.object(self.system, 'update_model', return_value=(None, rejected)) as update_model, \
+                self.assertLogs('api.model_updates', 'WARNING'):
+            self.assertEqual(self.updater().run_once()['status'], 'rejected')
+            # Neither this process nor another one sharing LOCK_DIR tries again
+            self.assertIsNone(self.updater().run_once())
+        update_model.assert_called_once()
+        self.swap_model_system.assert_not_called()
+        self.assertFalse(os.path.exists(settings.ML_MODEL_DIR))
+
+    def test_accepted_updates_are_saved_and_loaded_by_other_processes(self):
+        report = self.updater(mae_tolerance=10).run_once()
+
+        self.assertEqual(report['status'], 'updated')
+        self.assertEqual(report['path'], latest_artifact(settings.ML_MODEL_DIR, artifact_key(
+            dataset.source_hash(settings.TRAINING_DATA_PATH, settings.DATASET_CACHE_DIR), self.system.model_params)))
+        candidate = self.swap_model_system.call_args.args[0]
+        self.assertEqual(candidate.artifact_path, report['path'])
+
+        # A process still serving the old model loads the artifact instead of updating again
+        with mock.patch.object(self.system, 'update_model') as update_model:
+            self.assertEqual(self.updater().run_once(), {'status': 'loaded', 'path': report['path']})
+        update_model.assert_not_called()
+        self.assertEqual(self.swap_model_system.call_args.args[0].artifact_path, report['path'])
+
+    def test_too_few_new_rows_are_skipped(self):
+        with mock.patch.object(self.system, 'update_model') as update_model:
+            self.assertEqual(self.updater(min_rows=self.NEW_ROWS + 1).run_once(),
+                             {'status': 'skipped', 'new_rows': self.NEW_ROWS})
+        update_model.assert_not_called()
+
+
+class TrainModelTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='test-train-model-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.csv_path = write_training_csv(self.directory)
+
+    def test_early_stopping_holds_out_the_newest_rows(self):
+        import xgboost as xgb
+
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.random((500, 3)), columns=['a', 'b', 'c'])
+        y = pd.Series(X['a'] * 10 + rng.normal(0, 0.1, 500))
+        params = {**DEFAULT_MODEL_PARAMS, 'n_estimators': 500, 'early_stopping_rounds': 5}
+        real_fit = xgb.XGBRegressor.fit
+
+        with mock.patch.object(xgb.XGBRegressor, 'fit', autospec=True, side_effect=real_fit) as fit:
+            model = fit_intensity_model(X, y, params)
+
+        _, X_fit, y_fit = fit.call_args.args
+        [(X_eval, y_eval)] = fit.call_args.kwargs['eval_set']
+        self.assertEqual(list(X_fit.index), list(range(450)))
+        self.assertEqual(list(X_eval.index), list(range(450, 500)))
+        self.assertEqual(list(y_eval.index), list(range(450, 500)))
+        # Boosting stopped early, and the trees after the best iteration are dropped
+        fitted = fit.call_args.args[0]
+        self.assertLess(fitted.get_booster().num_boosted_rounds(), 500)
+        self.assertEqual(model.get_booster().num_boosted_rounds(), fitted.best_iteration + 1)
+
+    def test_command_saves_the_artifact_servers_look_up(self):
+        stdout = io.StringIO()
+        call_command('train_model', '--data', self.csv_path, '--model-dir', self.directory, '--n-estimators', '40',
+                     '--n-jobs', '1', stdout=stdout)
+
+        params = {**serving_model_params(), 'n_estimators': 40}
+        path = latest_artifact(self.directory, artifact_key(dataset.file_content_hash(self.csv_path), params))
+        self.assertIsNotNone(path)
+        output = stdout.getvalue()
+        self.assertIn(f"Saved model artifact {path}", output)
+        self.assertIn('Test split MAE', output)
+        self.assertIn('ML_MODEL_PARAMS=\'{"n_estimators": 40}\'', output)
+        self.assertIsNotNone(StreetlightMLSystem.load_model(path).light_intensity_model)
+
+    def test_no_save_writes_nothing(self):
+        stdout = io.StringIO()
+        call_command('train_model', '--data', self.csv_path, '--model-dir', self.directory, '--n-estimators', '10',
+                     '--no-save', stdout=stdout)
+        self.assertEqual(os.listdir(self.directory), ['training.csv'])
+        self.assertNotIn('Saved', stdout.getvalue())
+
+    def test_missing_data_is_an_error(self):
+        with self.assertRaisesRegex(CommandError, 'Training data not found'):
+            call_command('train_model', '--data', os.path.join(self.directory, 'missing.csv'))
+
+
+class BacktestTests(SimpleTestCase):
+    def test_folds_train_on_the_past_and_score_the_next_horizon(self):
+        times = np.arange('2024-01-01T00', '2024-01-11T00', dtype='datetime64[h]')
+        # A missing day: no fold is scored on zero rows
+        times = times[(times < np.datetime64('2024-01-06T00')) | (times >= np.datetime64('2024-01-07T00'))]
+
+        folds = backtest.rolling_origin_folds(times, initial_days=3, horizon_days=1)
+
+        # Origins on the 4th to the 10th; the 6th has no hours
+        self.assertEqual(folds, [(72, 96), (96, 120), (120, 144), (144, 168), (168, 192), (192, 216)])
+        for fold in folds:
+            origin = times[fold.train_end].astype('datetime64[D]')
+            self.assertTrue((times[:fold.train_end] < origin).all())
+            self.assertTrue((times[fold.train_end:fold.test_end] < origin + np.timedelta64(1, 'D')).all())
+        self.assertEqual(backtest.rolling_origin_folds(times[:48], initial_days=3), [])
+        self.assertEqual(backtest.rolling_origin_folds(times[:0]), [])
+
+    def test_score_table_matches_sklearn(self):
+        from sklearn.metrics import mean_absolute_error, r2_score
+
+        rng = np.random.default_rng(0)
+        actual = rng.uniform(0, 100, 60)
+        actual[40:] = 0  # a group whose intensity does not vary
+        scored = pd.DataFrame({
+            'actual': actual,
+            'predicted': actual + rng.normal(0, 5, 60),
+            'label': actual > 50,
+            'decision': rng.random(60) > 0.5,
+        })
+        groups = np.repeat([0, 1, 2], 20)
+
+        table = backtest.score_table(scored, groups)
+
+        self.assertEqual(table['rows'].tolist(), [20, 20, 20])
+        for group in (0, 1, 2):
+            rows = scored[groups == group]
+            self.assertAlmostEqual(table.loc[group, 'mae'], mean_absolute_error(rows['actual'], rows['predicted']))
+            self.assertAlmostEqual(table.loc[group, 'on_off_accuracy'], (rows['label'] == rows['decision']).mean())
+            if group < 2:
+                self.assertAlmostEqual(table.loc[group, 'r2'], r2_score(rows['actual'], rows['predicted']))
+        self.assertTrue(np.isnan(table.loc[2, 'r2']))
+
+    def test_backtest_scores_every_hour_after_the_first_origin(self):
+        rows = training_rows(None)
+        times = pd.to_datetime(rows['datetime'])
+        rows = rows[times < pd.Timestamp('2024-04-01')]
+        params = {**DEFAULT_MODEL_PARAMS, 'n_estimators': 20}
+
+        report = backtest.run_backtest(rows, params, initial_days=60, horizon_days=15, workers=1)
+
+        # Origins on March 1st, 16th and 31st; each fold starts at the first hour the data has after its origin
+        times = times[times < pd.Timestamp('2024-04-01')].sort_values()
+        origins = pd.to_datetime(['2024-03-01', '2024-03-16', '2024-03-31'])
+        self.assertEqual([fold['test_from'] for fold in report['folds']],
+                         [times[times >= origin].iloc[0].isoformat() for origin in origins])
+        self.assertEqual([fold['test_rows'] for fold in report['folds']],
+                         [((times >= start) & (times < start + pd.Timedelta(days=15))).sum() for start in origins])
+        self.assertEqual(report['overall']['rows'], (times >= origins[0]).sum())
+        self.assertEqual(report['by_hour']['rows'].sum(), report['overall']['rows'])
+        train_rows = [fold['train_rows'] for fold in report['folds']]
+        self.assertEqual(train_rows, sorted(train_rows))
+        self.assertLess(report['overall']['mae'], 20)
+
+
+class ReplayTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.system = trained_system()
+        cls.history = training_rows(240)
+
+    def test_replay_matches_make_prediction_row_by_row(self):
+        decisions = replay.replay(self.system, self.history, simulate=tuple(replay.SIMULATED_COLUMNS), seed=3)
+        X = feature_matrix(self.system, self.history)
+
+        self.assertEqual(len(decisions), len(self.history))
+        for i, (row, decision) in enumerate(zip(X, decisions.itertuples())):
+            single = self.system.make_prediction(
+                list(row),
+                {
+                    'air_quality': {'aqi': decision.aqi},
+                    'traffic_data': {'pedestrian_count': decision.pedestrian_count,
+                                     'vehicle_count': decision.vehicle_count},
+                },
+                {'ambient_light_sensor': decision.ambient_light, 'motion_sensor': decision.motion},
+            )
+            self.assertAlmostEqual(decision.recommended_intensity, single['recommended_intensity'], places=4, msg=i)
+            self.assertEqual(bool(decision.lights_should_be_on), single['lights_should_be_on'], i)
+            self.assertAlmostEqual(decision.confidence, single['confidence'], places=6, msg=i)
+
+    def test_history_columns_are_used_instead_of_simulated_ones(self):
+        history = self.history.assign(aqi=np.arange(len(self.history)) % 200)
+        decisions = replay.replay(self.system, history, simulate=('air_quality',))
+        np.testing.assert_array_equal(decisions['aqi'], history['aqi'])
+        self.assertNotIn('pedestrian_count', decisions)
+        np.testing.assert_array_equal(decisions['recommended_intensity'],
+                                      apply_adjustments_batch(decisions['base_intensity'], aqi=history['aqi'])
+                                      ['recommended_intensity'])
+
+    def test_simulation_is_reproducible_with_a_seed(self):
+        first = replay.replay(self.system, self.history, seed=1)
+        pd.testing.assert_frame_equal(replay.replay(self.system, self.history, seed=1), first)
+        self.assertFalse(replay.replay(self.system, self.history, seed=2)['pedestrian_count'].equals(
+            first['pedestrian_count']))
+
+    def test_summaries_add_up(self):
+        decisions = replay.replay(self.system, self.history)
+        summary = replay.summarize(decisions)
+        by_hour = replay.summarize(decisions, 'hour')
+
+        self.assertEqual(summary['hours'], len(decisions))
+        self.assertEqual(summary['hours_on'], decisions['lights_should_be_on'].sum())
+        self.assertAlmostEqual(summary['full_power_hours'], decisions['recommended_intensity'].sum() / 100)
+        self.assertEqual(by_hour['hours'].sum(), summary['hours'])
+        self.assertEqual(by_hour['hours_on'].sum(), summary['hours_on'])
+        self.assertAlmostEqual(by_hour['full_power_hours'].sum(), summary['full_power_hours'])
+        on = decisions['lights_should_be_on']
+        self.assertAlmostEqual(summary['mean_intensity_when_on'], decisions['recommended_intensity'][on].mean())
+        self.assertAlmostEqual(summary['rule_agreement'], (on == decisions['rule_lights_on']).mean())
+
+    def test_untrained_systems_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'not trained'):
+            replay.replay(StreetlightMLSystem(), self.history)
+
+    def test_command_writes_the_hourly_decisions(self):
+        directory = tempfile.mkdtemp(prefix='test-replay-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        output = os.path.join(directory, 'decisions.csv')
+        stdout = io.StringIO()
+        with mock.patch('api.model_service.get_model_system', return_value=self.system):
+            call_command('replay', '--data', write_training_csv(directory, 240), '--by', 'hour',
+                         '--output', output, stdout=stdout)
+
+        self.assertEqual(len(pd.read_csv(output)), 240)
+        self.assertIn('240 hours: lights on', stdout.getvalue())
@@ -0,0 +1,119 @@
+"""
+Single-row evaluator for the trained XGBoost regressor.
+
+XGBRegressor.predict builds a DMatrix on every call, which for one row costs
+far more than walking the trees. TreeEnsemblePredictor exports the booster's
+trees into flat NumPy arrays once and evaluates a row by advancing every tree
+one level per step, then sums the leaves in float32 in tree order exactly as
+XGBoost does, so its output matches predict() bit for bit.
+"""
+import json
+
+import numpy as np
+
+
+# Objectives whose prediction is the raw margin (identity link)
+IDENTITY_OBJECTIVES = {'reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror', 'reg:quantileerror'}
+
+
+def _parse_base_score(value):
+    # Stored as e.g. '8.506109E1', or '[8.506109E1]' by models with vector base scores
+    return np.float32(float(str(value).strip('[]')))
+
+
+class TreeEnsemblePredictor:
+    def __init__(self, features, thresholds, children, default_left, leaf_values, roots, depth, base_score):
+        self.features = features
+        self.thresholds = thresholds
+        self.children = children
+        self.default_left = default_left
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.depth = depth
+        self.base_score = base_score
+
+    @classmethod
+    def from_booster(cls, booster):
+        """Export an xgboost Booster (or XGBRegressor) of numerical-split regression trees"""
+        if hasattr(booster, 'get_booster'):
+            booster = booster.get_booster()
+        model = json.loads(booster.save_raw('json'))
+        learner = model['learner']
+
+        objective = learner['objective']['name']
+        if objective not in IDENTITY_OBJECTIVES:
+            raise ValueError(f"Unsupported objective for TreeEnsemblePredictor: {objective}")
+        if int(learner['learner_model_param'].get('num_target', 1)) > 1:
+            raise ValueError("Multi-target models are not supported")
+        booster_model = learner['gradient_booster']
+        if booster_model['name'] != 'gbtree':
+            raise ValueError(f"Unsupported booster: {booster_model['name']}")
+        trees = booster_model['model']['trees']
+
+        sizes = [len(tree['left_children']) for tree in trees]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        total = int(sum(sizes))
+
+        features = np.zeros(total, dtype=np.intp)
+        thresholds = np.zeros(total, dtype=np.float32)
+        # children[2 * node] is taken when x < threshold, children[2 * node + 1] otherwise
+        children = np.zeros(2 * total, dtype=np.intp)
+        default_left = np.zeros(total, dtype=bool)
+        leaf_values = np.zeros(total, dtype=np.float32)
+        depth = 0
+
+        for tree, offset, size in zip(trees, offsets, sizes):
+            if any(tree.get('split_type', [])):
+                raise ValueError("Categorical splits are not supported")
+            left = np.asarray(tree['left_children'], dtype=np.intp)
+            right = np.asarray(tree['right_children'], dtype=np.intp)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            is_leaf = left == -1
+            nodes = np.arange(size, dtype=np.intp)
+            # Leaves point at themselves so every tree can take `depth` steps
+            left = np.where(is_leaf, nodes, left) + offset
+            right = np.where(is_leaf, nodes, right) + offset
+
+            span = slice(offset, offset + size)
+            features[span] = np.where(is_leaf, 0, tree['split_indices'])
+            thresholds[span] = np.where(is_leaf, np.inf, conditions)
+            children[2 * offset:2 * (offset + size):2] = left
+            children[2 * offset + 1:2 * (offset + size):2] = right
+            default_left[span] = np.asarray(tree['default_left'], dtype=bool)
+            leaf_values[span] = np.where(is_leaf, conditions, 0)
+
+            node_depth = np.zeros(size, dtype=np.intp)
+            for node in range(size):
+                if not is_leaf[node]:
+                    node_depth[tree['left_children'][node]] = node_depth[node] + 1
+                    node_depth[tree['right_children'][node]] = node_depth[node] + 1
+            depth = max(depth, int(node_depth.max()))
+
+        return cls(
+            features, thresholds, children, default_left, leaf_values, offsets, depth,
+            _parse_base_score(learner['learner_model_param']['base_score'])
+        )
+
+    def predict_one(self, row):
+        """Prediction for one feature row (any array-like of length num_feature) as float32"""
+        x = np.asarray(row, dtype=np.float32).reshape(-1)
+        node = self.roots
+        if np.isnan(x).any():
+            for _ in range(self.depth):
+                value = x[self.features[node]]
+                go_right = np.where(np.isnan(value), ~self.default_left[node], value >= self.thresholds[node])
+                node = self.children[2 * node + go_right]
+        else:
+            for _ in range(self.depth):
+                node = self.children[2 * node + (x[self.features[node]] >= self.thresholds[node])]
+
+        # XGBoost starts from the base score and adds each tree's leaf in float32
+        total = np.empty(len(node) + 1, dtype=np.float32)
+        total[0] = self.base_score
+        np.take(self.leaf_values, node, out=total[1:])
+        return np.cumsum(total)[-1]
+
+    def predict(self, X):
+        """Row-by-row predictions for an N x num_feature array, for checking against XGBoost"""
+        X = np.asarray(X, dtype=np.float32)
+        return np.array([self.predict_one(row) for row in X], dtype=np.float32)
@@ -0,0 +1,113 @@
+"""
+Shared HTTP client for upstream APIs (ThingSpeak, Visual Crossing, OpenWeather).
+
+Each upstream host gets one pooled keep-alive `requests.Session`, so repeated
+calls reuse warm TCP/TLS connections instead of handshaking every time. Every
+call is timed and failures are counted in api.metrics.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=settings.UPSTREAM_MAX_RETRIES,
+        connect=settings.UPSTREAM_MAX_RETRIES,
+        status=settings.UPSTREAM_MAX_RETRIES,
+        # Never retry read timeouts: the caller already waited the full timeout
+        read=False,
+        backoff_factor=settings.UPSTREAM_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # Only idempotent methods are retried, so ThingSpeak writes are sent once
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.UPSTREAM_POOL_MAXSIZE,
+        pool_block=False,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url):
+    """Return the pooled session for the host of `url`, creating it on first use"""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _build_session()
+    return session
+
+
+def close_sessions():
+    """Close all pooled sessions and drop them from the pool"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def upstream_name(url):
+    """Metrics label for the API behind `url`: thingspeak, visual_crossing, openweather or the host"""
+    host = urlsplit(url).netloc
+    for name, setting in (
+        ('thingspeak', 'THINGSPEAK_API_URL'),
+        ('visual_crossing', 'VISUAL_CROSSING_API_URL'),
+        ('openweather', 'OPENWEATHER_API_URL'),
+    ):
+        if urlsplit(getattr(settings, setting, '')).netloc == host:
+            return name
+    return host
+
+
+def _error_kind(exc):
+    if isinstance(exc, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return 'connection'
+    return 'other'
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', settings.UPSTREAM_TIMEOUT)
+    name = upstream_name(url)
+    started = time.perf_counter()
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        UPSTREAM_ERRORS.inc(upstream=name, error=_error_kind(e))
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=name)
+    if response.status_code >= 400:
+        UPSTREAM_ERRORS.inc(upstream=name, error=f'http_{response.status_code // 100}xx')
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -1,12 +1,20 @@
 from django.urls import path
-from .views import predict_light, fetch_weather_data,get_sensor_data_from_thingspeak, update_light_control, get_live_sensor_logs_from_thingspeak
+from .views import model_ready, metrics_view, predict_light, predict_light_batch, fleet_predict, lighting_schedule, fetch_weather_data,get_sensor_data_from_thingspeak, update_light_control, light_control_status, prediction_history, stream_live_sensor_logs, get_live_sensor_logs_from_thingspeak
 
 urlpatterns = [
+    path('ready/', model_ready, name='model_ready'),
+    path('metrics/', metrics_view, name='metrics'),
     path('predict/', predict_light),
+    path('predict/batch/', predict_light_batch, name='predict_light_batch'),
+    path('fleet/predict/', fleet_predict, name='fleet_predict'),
+    path('schedule/', lighting_schedule, name='lighting_schedule'),
     path('fetch_weather_data/', fetch_weather_data, name='fetch_weather_data'),
     path('get_sensor_data_from_thingspeak/', get_sensor_data_from_thingspeak, name='get_sensor_data_from_thingspeak'),
     path('update_light_control/', update_light_control, name='update_light_control'),
+    path('update_light_control/<uuid:ticket>/', light_control_status, name='light_control_status'),
+    path('predictions/history/', prediction_history, name='prediction_history'),
     path('sensor-logs/live/', get_live_sensor_logs_from_thingspeak, name='live_sensor_logs'),
+    path('sensor-logs/stream/', stream_live_sensor_logs, name='live_sensor_logs_stream'),
 ]
 
 
@@ -1,166 +1,128 @@
+import asyncio
 import pandas as pd
-import numpy as np
-from datetime import datetime 
-from django.http import JsonResponse
+from datetime import datetime, timedelta
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 import json
-from .ml_model import StreetlightMLSystem , create_features
+from .ml_model import StreetlightMLSystem , rule_based_prediction, weather_inputs, DEFAULT_LOCATION
+from .features import FeaturePipeline, FALLBACK_NORMALIZATION_STATS
+from . import model_service
+from .weather_cache import fetch_visual_crossing_timeline
+from .models import LightControlWrite, SensorEntry, Streetlight
+from .write_queue import write_queue, write_status
+from .prediction_history import query_history
+from .sensor_sync import sensor_sync, entry_payload, entry_payloads
+from .sensor_stream import sensor_stream_hub
+from .fleet import predict_fleet
+from .schedule import lighting_scheduler, current_hours
+from . import metrics
+from . import solar
+from .metrics import timed_view
+from .responses import JsonResponse
 import requests
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 import random
 from django.conf import settings
+from django.urls import reverse
 import logging
 
 
+logger = logging.getLogger(__name__)
 
-# Global variable to hold the trained model system
-_model_system = None
 VISUAL_CROSSING_API_KEY = settings.VISUAL_CROSSING_API_KEY
 OPENWEATHER_API_KEY = settings.OPENWEATHER_API_KEY 
 
 
 def get_trained_model_system():
     """
-    Loads and returns the trained StreetlightMLSystem instance.
-    Trains it if it hasn't been trained yet.
+    Returns the trained StreetlightMLSystem instance, waiting for it to load
+    if the startup warm-up has not finished yet.
     """
-    global _model_system
-    if _model_system is None:
-        print("Loading and training ML system for the first time...")
-        try:
-            _model_system = StreetlightMLSystem()
-            df_raw = pd.read_csv("./harareweather2.csv")
-            df = create_features(df_raw) 
-            _model_system.train_models(df)
-            print("ML system loaded and trained successfully.")
-        except FileNotFoundError:
-            print("Error: 'harareweather.csv' file not found! Make sure it's in the 'api' directory.")
-           
-            raise 
-        except Exception as e:
-            print(f"Error training ML system: {e}")
-            raise
+    try:
+        return model_service.get_model_system()
+    except FileNotFoundError:
+        logger.error(f"Training data '{settings.TRAINING_DATA_PATH}' not found")
+        raise 
+    except Exception as e:
+        logger.exception(f"Error loading ML system: {e}")
+        raise
 
-    return _model_system
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def model_ready(request):
+    """Readiness probe for the load balancer: 200 once the model is loaded, 503 before"""
+    status = model_service.status()
+    if status['status'] == 'idle':
+        # Warm-up was not started at startup (e.g. ML_WARMUP_ON_STARTUP=false)
+        model_service.start_warmup()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
 
 
 @csrf_exempt
-def predict_light(request):
+@timed_view('predict_light')
+async def predict_light(request):
+    timer = request.stage_timer
     if request.method == 'GET':
         try:
-            # Initialize system with API keys
-            model_system = StreetlightMLSystem(
-                visual_crossing_api_key=VISUAL_CROSSING_API_KEY,
-                openweather_api_key=OPENWEATHER_API_KEY
-            )
-            
-            # Train the model if not already trained
-            if not model_system.is_trained:
-                model_system = get_trained_model_system()
+            # Use the trained system if it is loaded; while it is still warming
+            # up, answer with the rule-based fallback instead of waiting
+            model_system = model_service.get_model_system(block=False)
+            use_fallback = model_system is None
+            if use_fallback:
+                model_system = StreetlightMLSystem(
+                    visual_crossing_api_key=VISUAL_CROSSING_API_KEY,
+                    openweather_api_key=OPENWEATHER_API_KEY
+                )
+                model_system.feature_pipeline = FeaturePipeline(FALLBACK_NORMALIZATION_STATS)
 
-            # Fetch REAL external data from APIs
-            print("Fetching real-time data from APIs...")
-            external_data = model_system.get_external_api_data()
-            sensor_data = model_system.simulate_iot_sensor_data()
+            # Fetch REAL external data from APIs, both sources concurrently
+            external_data, sensor_data = await asyncio.gather(
+                timer.timed('visual_crossing', model_system.aget_external_api_data()),
+                timer.timed('thingspeak', model_system.asimulate_iot_sensor_data())
+            )
 
             # Use real weather data for prediction features
             current_weather = external_data['current_weather']
             
-            # Calculate proper composite features
-            tempmax = current_weather['temperature'] + 5
-            tempmin = current_weather['temperature'] - 5
-            temp = current_weather['temperature']
-            humidity = current_weather['humidity']
-            sealevelpressure = 1013.25
-            cloudcover = current_weather['cloudcover']
-            visibility = current_weather['visibility']
-            solarradiation = 200  # You might want to get this from API or estimate based on time
-            windspeed = current_weather['wind_speed']
-            precipprob = 30  # Default or get from API
-            
-            # Time features
-            now = datetime.now()
-            hour = now.hour
-            day_of_year = now.timetuple().tm_yday
-            month = now.month
-            is_weekend = 1 if now.weekday() >= 5 else 0
-            daylight_duration = 12  # Could be calculated more accurately
-            
-            # Calculate composite features properly
-            # Natural light index (similar to training data calculation)
-            natural_light_index = (
-                solarradiation * (100 - cloudcover) / 100 * 
-                visibility / max(visibility, 1)  # Using current visibility as reference
-            )
-            
-            # Weather severity (similar to training data calculation)
-            weather_severity = (
-                windspeed / max(windspeed, 1) * 0.3 +  # Normalize by current windspeed
-                precipprob / 100 * 0.4 +
-                cloudcover / 100 * 0.3
-            )
-            
-            # Create feature array in the EXACT order expected by the model
-            weather_features = [
-                tempmax,            # 0: tempmax
-                tempmin,            # 1: tempmin  
-                temp,               # 2: temp
-                humidity,           # 3: humidity
-                sealevelpressure,   # 4: sealevelpressure
-                cloudcover,         # 5: cloudcover
-                visibility,         # 6: visibility
-                solarradiation,     # 7: solarradiation
-                windspeed,          # 8: windspeed
-                precipprob,         # 9: precipprob
-                hour,               # 10: hour
-                day_of_year,        # 11: day_of_year
-                month,              # 12: month
-                is_weekend,         # 13: is_weekend
-                daylight_duration,  # 14: daylight_duration
-                natural_light_index, # 15: natural_light_index
-                weather_severity    # 16: weather_severity
-            ]
+            with timer.stage('features'):
+                # Raw weather inputs; composite features are normalized with the
+                # stats fitted at training time so they match the training features
+                # Solar radiation and daylight come from the local solar geometry
+                sun = solar.site_sun()
+                weather = weather_inputs(current_weather, sun)
+                now = solar.site_now()
 
-            # Make prediction with properly formatted features
-            prediction = model_system.make_prediction(
-                weather_features,
-                external_data=external_data,
-                sensor_data=sensor_data
-            )
+                # Build the feature row (in the EXACT order expected by the model)
+                # straight into this thread's preallocated float32 buffer
+                weather_features = model_system.feature_pipeline.transform_one(weather, now, sun.daylight_duration)
+                input_features = dict(zip(model_system.feature_columns, weather_features[0].tolist()))
 
-            # Convert NumPy types to Python native types
-            def convert_numpy_types(obj):
-                if isinstance(obj, dict):
-                    return {key: convert_numpy_types(value) for key, value in obj.items()}
-                elif isinstance(obj, (np.int_, np.intc, np.intp, np.int8, np.int16, np.int32, np.int64,
-                                    np.uint8, np.uint16, np.uint32, np.uint64)):
-                    return int(obj)
-                elif isinstance(obj, (np.float64, np.float16, np.float32, np.float64)):
-                    return float(obj)
-                elif isinstance(obj, np.bool_):
-                    return bool(obj)
-                elif isinstance(obj, np.ndarray):
-                    return obj.tolist()
+            # Make prediction with properly formatted features
+            with timer.stage('predict'):
+                if use_fallback:
+                    prediction = rule_based_prediction(
+                        weather_features,
+                        FALLBACK_NORMALIZATION_STATS['natural_light_index_q95'],
+                        external_data=external_data,
+                        sensor_data=sensor_data
+                    )
                 else:
-                    return obj
+                    prediction = model_system.make_prediction(
+                        weather_features,
+                        external_data=external_data,
+                        sensor_data=sensor_data
+                    )
 
-            safe_result = convert_numpy_types(prediction)
+            # NumPy values in the prediction are encoded by JsonResponse itself
+            result = dict(prediction)
+            result['prediction_source'] = 'rules' if use_fallback else 'model'
             
             # Add debugging info
-            safe_result['debug_info'] = {
-                'input_features': {
-                    'tempmax': tempmax,
-                    'tempmin': tempmin,
-                    'temp': temp,
-                    'humidity': humidity,
-                    'cloudcover': cloudcover,
-                    'visibility': visibility,
-                    'windspeed': windspeed,
-                    'hour': hour,
-                    'natural_light_index': natural_light_index,
-                    'weather_severity': weather_severity
-                },
+            result['debug_info'] = {
+                'input_features': input_features,
                 'data_sources': {
                     'weather_api': 'Visual Crossing',
                     'current_conditions': current_weather,
@@ -169,11 +131,11 @@ def predict_light(request):
                 'timestamp': datetime.now().isoformat()
             }
             
-            return JsonResponse(safe_result)
+            with timer.stage('json_encode'):
+                return JsonResponse(result)
 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Prediction failed: {e}")
             return JsonResponse({'error': str(e)}, status=500)
 
     return JsonResponse({'error': 'Only GET requests are allowed'}, status=405)
@@ -182,150 +144,267 @@ def predict_light(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+def metrics_view(request):
+    """Stage latency histograms and upstream error counters for Prometheus to scrape"""
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def fleet_predict(request):
+    """
+    Predict for every active streetlight (or those in ?area=) with one
+    batched model call, fetching their feeds concurrently.
+    """
+    lights = Streetlight.objects.filter(active=True).order_by('id')
+    if request.GET.get('area'):
+        lights = lights.filter(area=request.GET['area'])
+    lights = list(lights)
+    if not lights:
+        return JsonResponse({'error': 'No active streetlights registered'}, status=404)
+
+    try:
+        model_system = get_trained_model_system()
+        results, timings = predict_fleet(model_system, lights)
+    except Exception as e:
+        logger.exception(f"Fleet prediction failed: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    response = JsonResponse({
+        'count': len(results),
+        'lights': results,
+        'timings': timings,
+        'timestamp': datetime.now().isoformat()
+    })
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@timed_view('schedule')
+def lighting_schedule(request):
+    """
+    The precomputed day-ahead lighting plan for ?location= (default Harare):
+    one prediction per forecast hour from the current hour on.
+    """
+    timer = request.stage_timer
+    location = request.GET.get('location', DEFAULT_LOCATION)
+    if location not in lighting_scheduler.locations():
+        return JsonResponse({'error': f'No schedule is kept for {location}'}, status=404)
+
+    try:
+        with timer.stage('load'):
+            schedule = lighting_scheduler.ensure_schedule(location)
+    except Exception as e:
+        logger.exception(f"Lighting schedule unavailable for {location}: {e}")
+        return JsonResponse({'error': f'Schedule unavailable: {e}'}, status=503)
+
+    with timer.stage('json_encode'):
+        response = JsonResponse({
+            'location': schedule.location,
+            'generated_at': schedule.generated_at,
+            'hours': current_hours(schedule),
+        })
+    # Clients can keep the plan until the next refresh is due
+    next_refresh = schedule.generated_at + timedelta(seconds=settings.SCHEDULE_REFRESH_INTERVAL)
+    response['Cache-Control'] = f'max-age={max(0, int((next_refresh - timezone.now()).total_seconds()))}'
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+# Optional per-row columns accepted by the batch endpoint
+BATCH_ADJUSTMENT_FIELDS = ['aqi', 'pedestrian_count', 'vehicle_count', 'ambient_light', 'motion']
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def predict_light_batch(request):
+    """
+    Predict for many rows with one model call.
+
+    Expects a JSON body with `features` (a list of 17-element rows in model
+    feature order) and optional per-row lists for `aqi`, `pedestrian_count`,
+    `vehicle_count`, `ambient_light` and `motion`.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON in request body'}, status=400)
+
+    features = data.get('features') if isinstance(data, dict) else None
+    if not features:
+        return JsonResponse({'error': "'features' must be a non-empty list of rows"}, status=400)
+
+    adjustments = {field: data.get(field) for field in BATCH_ADJUSTMENT_FIELDS}
+
+    try:
+        model_system = get_trained_model_system()
+        predictions = model_system.make_prediction_batch(features, **adjustments)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'error': f'Invalid batch input: {e}'}, status=400)
+    except Exception as e:
+        logger.exception(f"Batch prediction failed: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    return JsonResponse({
+        'count': len(features),
+        'recommended_intensity': predictions['recommended_intensity'],
+        'lights_should_be_on': predictions['lights_should_be_on'],
+        'confidence': predictions['confidence'],
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@timed_view('sensor_data')
 def get_sensor_data_from_thingspeak(request):
-    myChannelID = settings.THINGSPEAK_CHANNEL_ID
-    myWriteAPIKey = settings.THINGSPEAK_WRITE_API_KEY
-    myReadAPIKey = settings.THINGSPEAK_READ_API_KEY
-    
-    url = f"https://api.thingspeak.com/channels/{myChannelID}/feeds.json?results=1&api_key={myReadAPIKey}"
-    
+    """
+    Latest sensor reading, served from the local ThingSpeak mirror. With
+    ?since_entry_id=N, reports no_new_data unless a newer entry exists.
+    """
+    timer = request.stage_timer
     try:
-        print(f"Fetching data from: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status() 
-        
-        json_data = response.json()
-        print(f"ThingSpeak response: {json_data}")
-        
-        if 'feeds' not in json_data or not json_data['feeds']:
+        since_entry_id = int(request.GET.get('since_entry_id', 0))
+    except ValueError:
+        return JsonResponse({'error': 'since_entry_id must be an integer'}, status=400)
+
+    try:
+        with timer.stage('thingspeak_sync'):
+            sensor_sync.ensure_synced()
+        with timer.stage('db_query'):
+            latest = (
+                SensorEntry.objects
+                .filter(channel_id=settings.THINGSPEAK_CHANNEL_ID)
+                .order_by('-entry_id')
+                .first()
+            )
+        if latest is None:
             return JsonResponse({'error': 'No data available from ThingSpeak'}, status=404)
-        
-        data = json_data['feeds'][0]
-        
-        # Validate that required fields exist
-        if 'field1' not in data or 'field2' not in data:
-            return JsonResponse({'error': 'Missing required sensor data fields'}, status=400)
-        
-        # Handle None values
-        ambient_light = data['field1']
-        motion_sensor = data['field2']
-        
-        if ambient_light is None:
-            ambient_light = 0
-        if motion_sensor is None:
-            motion_sensor = 0
-            
-        return JsonResponse({
-            'ambient_light_sensor': float(ambient_light),
-            'motion_sensor': int(motion_sensor),
-            'timestamp': data.get('created_at', ''),
-            'status': 'success'
-        })
-        
+
+        if latest.entry_id <= since_entry_id:
+            return JsonResponse({'status': 'no_new_data', 'entry_id': latest.entry_id})
+
+        with timer.stage('json_encode'):
+            return JsonResponse({**entry_payload(latest), 'status': 'success'})
+
     except requests.exceptions.Timeout:
-        print("Request to ThingSpeak timed out")
+        logger.warning("Request to ThingSpeak timed out")
         return JsonResponse({'error': 'Request to ThingSpeak timed out'}, status=500)
     except requests.exceptions.ConnectionError:
-        print("Connection error to ThingSpeak")
+        logger.warning("Connection error to ThingSpeak")
         return JsonResponse({'error': 'Unable to connect to ThingSpeak'}, status=500)
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP error: {e}")
+        logger.warning(f"ThingSpeak HTTP error: {e}")
         return JsonResponse({'error': f'ThingSpeak API error: {e}'}, status=500)
-    except KeyError as e:
-        print(f"KeyError: {e}")
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Invalid ThingSpeak data: {e}")
         return JsonResponse({'error': f'Invalid response format from ThingSpeak: {e}'}, status=500)
-    except ValueError as e:
-        print(f"ValueError: {e}")
-        return JsonResponse({'error': f'Invalid data format: {e}'}, status=500)
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        logger.exception(f"Unexpected error: {e}")
         return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
-    
-    
-    
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
+@timed_view('live_sensor_logs')
 def get_live_sensor_logs_from_thingspeak(request):
-    myChannelID = settings.THINGSPEAK_CHANNEL_ID
-    myWriteAPIKey = settings.THINGSPEAK_WRITE_API_KEY
-    myReadAPIKey = settings.THINGSPEAK_READ_API_KEY
-    
-    # Get recent entries (default 20 for live logs)
-    results = request.GET.get('results', 20)
-   
-    url = f"https://api.thingspeak.com/channels/{myChannelID}/feeds.json?results={results}&api_key={myReadAPIKey}"
-    
+    """
+    Recent sensor entries, latest first, served from the local ThingSpeak
+    mirror. ?results= (default 20) is capped at SENSOR_LOGS_MAX_RESULTS;
+    ?since_entry_id=N returns only entries newer than N.
+    """
+    timer = request.stage_timer
     try:
-        print(f"Fetching live logs from: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        json_data = response.json()
-        print(f"ThingSpeak response: {len(json_data.get('feeds', []))} live entries")
-        
-        # Check if feeds exist and have data
-        if 'feeds' not in json_data or not json_data['feeds']:
+        results = int(request.GET.get('results', 20))
+        since_entry_id = int(request.GET.get('since_entry_id', 0))
+    except ValueError:
+        return JsonResponse({'error': 'results and since_entry_id must be integers'}, status=400)
+    results = max(1, min(results, settings.SENSOR_LOGS_MAX_RESULTS))
+
+    try:
+        with timer.stage('thingspeak_sync'):
+            sensor_sync.ensure_synced()
+        with timer.stage('db_query'):
+            live_logs = entry_payloads(
+                SensorEntry.objects
+                .filter(channel_id=settings.THINGSPEAK_CHANNEL_ID, entry_id__gt=since_entry_id)
+                .order_by('-entry_id')[:results]
+            )
+
+        # A delta fetch with nothing new is not an error
+        if not live_logs and not since_entry_id:
             return JsonResponse({'error': 'No live data available from ThingSpeak'}, status=404)
-        
-        # Process live log entries - REVERSE ORDER to get latest first
-        live_logs = []
-        for entry in reversed(json_data['feeds']):  
-            # Handle None values
-            ambient_light = entry.get('field1')
-            motion_sensor = entry.get('field2')
-            
-            if ambient_light is None:
-                ambient_light = 0
-            if motion_sensor is None:
-                motion_sensor = 0
-            
-            live_entry = {
-                'entry_id': entry.get('entry_id', 0),
-                'ambient_light_sensor': float(ambient_light),
-                'motion_sensor': int(motion_sensor),
-                'timestamp': entry.get('created_at', ''),
-            }
-            live_logs.append(live_entry)
-        
-        return JsonResponse({
-            'status': 'success',
-            'live_logs': live_logs,
-            'total_entries': len(live_logs),
-            'last_updated': live_logs[0]['timestamp'] if live_logs else None
-        })
-        
+
+        with timer.stage('json_encode'):
+            return JsonResponse({
+                'status': 'success',
+                'live_logs': live_logs,
+                'total_entries': len(live_logs),
+                'last_entry_id': live_logs[0]['entry_id'] if live_logs else since_entry_id,
+                'last_updated': live_logs[0]['timestamp'] if live_logs else None
+            })
+
     except requests.exceptions.Timeout:
-        print("Request to ThingSpeak timed out")
+        logger.warning("Request to ThingSpeak timed out")
         return JsonResponse({'error': 'Request to ThingSpeak timed out'}, status=500)
     except requests.exceptions.ConnectionError:
-        print("Connection error to ThingSpeak")
+        logger.warning("Connection error to ThingSpeak")
         return JsonResponse({'error': 'Unable to connect to ThingSpeak'}, status=500)
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP error: {e}")
+        logger.warning(f"ThingSpeak HTTP error: {e}")
         return JsonResponse({'error': f'ThingSpeak API error: {e}'}, status=500)
-    except KeyError as e:
-        print(f"KeyError: {e}")
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Invalid ThingSpeak data: {e}")
         return JsonResponse({'error': f'Invalid response format from ThingSpeak: {e}'}, status=500)
-    except ValueError as e:
-        print(f"ValueError: {e}")
-        return JsonResponse({'error': f'Invalid data format: {e}'}, status=500)
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        logger.exception(f"Unexpected error: {e}")
         return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def stream_live_sensor_logs(request):
+    """
+    Server-Sent Events stream of new sensor entries. Entries newer than the
+    Last-Event-ID header (or ?since_entry_id=) are sent first on connect.
+    """
+    since_entry_id = request.headers.get('Last-Event-ID') or request.GET.get('since_entry_id')
+    try:
+        since_entry_id = int(since_entry_id) if since_entry_id else None
+    except ValueError:
+        return JsonResponse({'error': 'since_entry_id must be an integer'}, status=400)
+
+    try:
+        sensor_sync.ensure_synced()
+    except Exception as e:
+        # The stream can still start; entries flow once a later sync succeeds
+        logger.warning(f"ThingSpeak sync failed before streaming: {e}")
+
+    # Under ASGI the stream is a coroutine per client; under WSGI it holds a worker thread
+    if isinstance(request, ASGIRequest):
+        events = sensor_stream_hub.astream(since_entry_id)
+    else:
+        events = sensor_stream_hub.stream(since_entry_id)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def fetch_weather_data(request):
     location = request.GET.get('location', 'Harare,ZW')
     api_key = VISUAL_CROSSING_API_KEY
     
-    url = f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{location}/today?unitGroup=metric&key={api_key}&include=hours"
-    
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        # Served from the shared weather cache when fresh
+        data = fetch_visual_crossing_timeline(location, 'today', api_key, include='hours')
         
         # Get current hour from timezone-aware datetime
         now_hour = timezone.now().hour
@@ -333,8 +412,8 @@ def fetch_weather_data(request):
         # Find the current hour's data from the API
         current_hour_data = None
         for hour_data in data['days'][0]['hours']:
-            hour_time = datetime.strptime(hour_data['datetime'], '%H:%M:%S').hour
-            if hour_time == now_hour:
+            # 'HH:MM:SS'; the hour is the first two digits
+            if int(hour_data['datetime'][:2]) == now_hour:
                 current_hour_data = hour_data
                 break
         
@@ -400,19 +479,16 @@ def fetch_weather_data(request):
             "motion": 0,
         }, status=200)
 
-logger = logging.getLogger(__name__)
-
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
+@timed_view('update_light_control')
 def update_light_control(request):
     """
-    Handle light control updates from React frontend and send to ThingSpeak
-    """
-    THINGSPEAK_WRITE_API_KEY = settings.THINGSPEAK_WRITE_API_KEY
-    THINGSPEAK_CHANNEL_ID = settings.THINGSPEAK_CHANNEL_ID
-    THINGSPEAK_WRITE_URL = f'https://api.thingspeak.com/update'
+    Handle light control updates from React frontend.
 
-    
+    The desired state is queued for ThingSpeak and the request returns 202
+    with a ticket at once; poll `light_control_status` to see when it landed.
+    """
     # Handle CORS preflight request
     if request.method == 'OPTIONS':
         response = JsonResponse({'status': 'ok'})
@@ -421,9 +497,11 @@ def update_light_control(request):
         response["Access-Control-Allow-Headers"] = "Content-Type, Accept"
         return response
     
+    timer = request.stage_timer
     try:
         # Parse JSON data from request
-        data = json.loads(request.body)
+        with timer.stage('parse'):
+            data = json.loads(request.body)
         lights_on = data.get('lights_on', 0)
         
         logger.info(f"Received light control request: lights_on={lights_on}")
@@ -435,77 +513,21 @@ def update_light_control(request):
                 'status': 'error'
             }, status=400)
         
+        # Queue the user_override field (field3); rapid toggles are coalesced
+        with timer.stage('enqueue'):
+            write = write_queue.enqueue(lights_on)
+        ticket = str(write.ticket)
         
-        # Send the user_override field
-        thingspeak_data = {
-            'api_key': THINGSPEAK_WRITE_API_KEY,
-            'field3': lights_on  
-        }
-        
-
-        # Send data to ThingSpeak
-        try:
-            response = requests.post(
-                THINGSPEAK_WRITE_URL,
-                data=thingspeak_data,
-                timeout=10  # 10 second timeout
-            )
-            
-            if response.status_code == 200:
-                entry_id = response.text.strip()
-                if entry_id != '0':  # ThingSpeak returns 0 if write fails
-                    logger.info(f"Successfully updated ThingSpeak. Entry ID: {entry_id}")
-                    
-                    # Prepare success response
-                    response_data = {
-                        'status': 'success',
-                        'message': 'Light control updated successfully',
-                        'lights_on': lights_on,
-                        'user_override': lights_on,  
-                        'thingspeak_entry_id': entry_id,
-                        'timestamp': None
-                    }
-                    
-                    # Add timestamp if available
-                    try:
-                        import datetime
-                        response_data['timestamp'] = datetime.datetime.now().isoformat()
-                    except:
-                        pass
-                    
-                    json_response = JsonResponse(response_data)
-                    
-                else:
-                    logger.error("ThingSpeak write failed - returned 0")
-                    json_response = JsonResponse({
-                        'error': 'ThingSpeak write failed',
-                        'status': 'error',
-                        'details': 'ThingSpeak API returned 0 (write failed). Check API key and rate limits.'
-                    }, status=500)
-                    
-            else:
-                logger.error(f"ThingSpeak API error: {response.status_code} - {response.text}")
-                json_response = JsonResponse({
-                    'error': 'ThingSpeak API error',
-                    'status': 'error',
-                    'details': f'HTTP {response.status_code}: {response.text}'
-                }, status=500)
-                
-        except requests.exceptions.Timeout:
-            logger.error("ThingSpeak request timed out")
+        with timer.stage('json_encode'):
             json_response = JsonResponse({
-                'error': 'ThingSpeak request timed out',
-                'status': 'error',
-                'details': 'Request to ThingSpeak API timed out after 10 seconds'
-            }, status=504)
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"ThingSpeak request failed: {str(e)}")
-            json_response = JsonResponse({
-                'error': 'Failed to connect to ThingSpeak',
-                'status': 'error',
-                'details': str(e)
-            }, status=503)
+                'status': 'queued',
+                'message': 'Light control update queued for ThingSpeak',
+                'lights_on': lights_on,
+                'user_override': lights_on,
+                'ticket': ticket,
+                'status_url': reverse('light_control_status', args=[ticket]),
+                'timestamp': write.created_at.isoformat()
+            }, status=202)
         
     except json.JSONDecodeError:
         logger.error("Invalid JSON in request body")
@@ -527,4 +549,36 @@ def update_light_control(request):
     json_response["Access-Control-Allow-Methods"] = "POST, OPTIONS"
     json_response["Access-Control-Allow-Headers"] = "Content-Type, Accept"
     
-    return json_response
\ No newline at end of file
+    return json_response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def light_control_status(request, ticket):
+    """Report whether a queued light control update has landed on ThingSpeak"""
+    try:
+        write = LightControlWrite.objects.select_related('coalesced_into').get(ticket=ticket)
+    except LightControlWrite.DoesNotExist:
+        return JsonResponse({'error': 'Unknown ticket', 'status': 'error'}, status=404)
+
+    response = JsonResponse(write_status(write))
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def prediction_history(request):
+    """
+    Logged predictions over time, either raw or downsampled with
+    ?bucket=5m|1h|1d. Optional ?start=&end= (ISO 8601, default: a recent
+    window), ?limit= and the ?cursor= returned as next_cursor.
+    """
+    try:
+        payload = query_history(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'status': 'error'}, status=400)
+
+    response = JsonResponse(payload)
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import upstream
+from .locks import FileLock
+
+
+logger = logging.getLogger(__name__)
+
+VISUAL_CROSSING_TIMELINE_PATH = "/VisualCrossingWebServices/rest/services/timeline/{location}/{period}"
+
+# How long a process waits for another process's in-flight fetch on a cold miss
+MISS_WAIT_TIMEOUT = 10
+
+
+def get_weather_cache():
+    return caches[settings.WEATHER_CACHE_ALIAS]
+
+
+def cache_key(location, period, params):
+    """Cache key for a timeline query: location plus the query shape, never the API key"""
+    shape = json.dumps({'location': location.lower(), 'period': period, 'params': params}, sort_keys=True)
+    return 'visualcrossing:' + hashlib.sha256(shape.encode()).hexdigest()
+
+
+def _store(cache, key, data, ttl, stale_ttl):
+    cache.set(key, {'fetched_at': time.time(), 'data': data}, timeout=ttl + stale_ttl)
+    return data
+
+
+def _refresh(lock, cache, key, fetch, ttl, stale_ttl):
+    try:
+        _store(cache, key, fetch(), ttl, stale_ttl)
+    except Exception as e:
+        logger.warning(f"Background weather refresh failed for {key}: {e}")
+    finally:
+        lock.release()
+
+
+def _refresh_in_background(cache, key, fetch, ttl, stale_ttl):
+    # Only one process refreshes a stale entry; the rest keep serving it
+    lock = FileLock(key)
+    if lock.acquire():
+        threading.Thread(target=_refresh, args=(lock, cache, key, fetch, ttl, stale_ttl), daemon=True).start()
+
+
+def get_or_fetch(key, fetch, ttl=None, stale_ttl=None):
+    """
+    Return cached data for `key`, calling `fetch()` only when needed.
+
+    Entries younger than `ttl` are served as is. Entries up to `stale_ttl`
+    past that are still served, while one background thread refreshes them.
+    On a miss, a single process fetches (under the key's FileLock) and the
+    others wait for the lock, then use its result; after MISS_WAIT_TIMEOUT
+    they raise TimeoutError rather than fetch as well. `fetch` must raise on
+    failure so errors are never cached.
+    """
+    cache = get_weather_cache()
+    ttl = settings.WEATHER_CACHE_TTL if ttl is None else ttl
+    stale_ttl = settings.WEATHER_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+
+    entry = cache.get(key)
+    if entry is not None:
+        age = time.time() - entry['fetched_at']
+        if age < ttl:
+            return entry['data']
+        if age < ttl + stale_ttl:
+            _refresh_in_background(cache, key, fetch, ttl, stale_ttl)
+            return entry['data']
+
+    lock = FileLock(key)
+    if not lock.acquire(timeout=MISS_WAIT_TIMEOUT):
+        raise TimeoutError(f"Timed out waiting for another process to fetch {key}")
+    try:
+        # Whoever held the lock before us may have just fetched it
+        entry = cache.get(key)
+        if entry is not None and time.time() - entry['fetched_at'] < ttl:
+            return entry['data']
+        return _store(cache, key, fetch(), ttl, stale_ttl)
+    finally:
+        lock.release()
+
+
+def fetch_visual_crossing_timeline(location, period='today', api_key=None, **params):
+    """
+    Fetch a Visual Crossing timeline response through the shared weather cache.
+
+    Extra keyword arguments become query parameters and are part of the cache
+    key, so differently shaped queries for the same location are cached apart.
+    """
+    params = {'unitGroup': 'metric', **params}
+    url = settings.VISUAL_CROSSING_API_URL + VISUAL_CROSSING_TIMELINE_PATH.format(location=location, period=period)
+
+    def fetch():
+        response = upstream.get(url, params={**params, 'key': api_key})
+        response.raise_for_status()
+        return response.json()
+
+    return get_or_fetch(cache_key(location, period, params), fetch)
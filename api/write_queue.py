@@ -0,0 +1,266 @@
+"""
+Background write queue for ThingSpeak light-control updates.
+
+Requests are recorded as LightControlWrite rows and acknowledged at once.
+A flusher thread sends only the latest pending state per channel, marking
+older pending requests as superseded, and never writes faster than the
+channel's allowed rate. Because tickets live in the database, any worker
+process can report on any ticket.
+
+A write left 'sending' by a process that died mid-send is requeued once its
+claim is STALE_CLAIM_INTERVALS write intervals old, unless a newer request
+has replaced it. Serving processes start the flusher at startup when writes
+are outstanding (start_if_outstanding, called from api.startup).
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import upstream
+from .models import LightControlWrite
+
+
+logger = logging.getLogger(__name__)
+
+# A 'sending' claim this many write intervals old (and at least this many
+# upstream timeouts, so a slow send in progress is not taken over) was left
+# by a process that died
+STALE_CLAIM_INTERVALS = 4
+
+
+class ThingSpeakWriteQueue:
+    def __init__(self, channel_id=None, write_api_key=None, interval=None, max_attempts=None):
+        self.channel_id = channel_id
+        self.write_api_key = write_api_key
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._last_attempt = 0.0
+
+    def _config(self):
+        return (
+            self.channel_id if self.channel_id is not None else settings.THINGSPEAK_CHANNEL_ID,
+            self.write_api_key if self.write_api_key is not None else settings.THINGSPEAK_WRITE_API_KEY,
+            self.interval if self.interval is not None else settings.THINGSPEAK_WRITE_INTERVAL,
+            self.max_attempts if self.max_attempts is not None else settings.THINGSPEAK_WRITE_MAX_ATTEMPTS,
+        )
+
+    def start(self):
+        """Start the flusher thread if it is not already running"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='thingspeak-write-queue', daemon=True)
+                self._thread.start()
+
+    def start_if_outstanding(self):
+        """Start the flusher if writes are pending or claimed; returns whether it was started"""
+        channel_id = self._config()[0]
+        outstanding = LightControlWrite.objects.filter(
+            channel_id=channel_id,
+            status__in=[LightControlWrite.STATUS_PENDING, LightControlWrite.STATUS_SENDING],
+        ).exists()
+        if outstanding:
+            self.start()
+        return outstanding
+
+    def enqueue(self, lights_on):
+        """Record a desired light state and wake the flusher; returns the LightControlWrite"""
+        channel_id = self._config()[0]
+        write = LightControlWrite.objects.create(channel_id=channel_id, lights_on=lights_on)
+        self.start()
+        self._wakeup.set()
+        return write
+
+    def seconds_until_next_write(self):
+        """Seconds to wait before the channel accepts another write"""
+        channel_id, _, interval, _ = self._config()
+        last_sent = (
+            LightControlWrite.objects
+            .filter(channel_id=channel_id, sent_at__isnull=False)
+            .order_by('-sent_at')
+            .values_list('sent_at', flat=True)
+            .first()
+        )
+        last_write = self._last_attempt
+        if last_sent is not None:
+            last_write = max(last_write, last_sent.timestamp())
+        return max(0.0, last_write + interval - time.time())
+
+    def _stale_after(self, interval):
+        return max(STALE_CLAIM_INTERVALS * interval, STALE_CLAIM_INTERVALS * settings.UPSTREAM_TIMEOUT)
+
+    def _requeue_stale(self, channel_id, stale_after):
+        """
+        Return writes whose 'sending' claim is older than `stale_after` seconds
+        to pending, or supersede them if a newer request exists. Returns the
+        number of writes recovered.
+        """
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        recovered = 0
+        with transaction.atomic():
+            stale = (
+                LightControlWrite.objects
+                .filter(channel_id=channel_id, status=LightControlWrite.STATUS_SENDING)
+                .filter(Q(claimed_at__lt=cutoff) | Q(claimed_at__isnull=True))
+                .order_by('id')
+            )
+            for write in stale:
+                newest = (
+                    LightControlWrite.objects
+                    .filter(channel_id=channel_id, id__gt=write.id)
+                    .order_by('-id')
+                    .first()
+                )
+                fields = {'status': LightControlWrite.STATUS_PENDING, 'claimed_at': None}
+                if newest is not None:
+                    # Sending it now could undo the newer state
+                    fields = {'status': LightControlWrite.STATUS_SUPERSEDED, 'coalesced_into': newest}
+                recovered += (
+                    LightControlWrite.objects
+                    .filter(id=write.id, status=LightControlWrite.STATUS_SENDING)
+                    .update(**fields)
+                )
+                logger.warning(
+                    f"ThingSpeak write {write.ticket} was left sending since {write.claimed_at}, "
+                    f"{'superseded by ' + str(newest.ticket) if newest is not None else 'requeued'}"
+                )
+        return recovered
+
+    def _claim_latest(self, channel_id):
+        """Claim the newest pending write and supersede the older ones"""
+        with transaction.atomic():
+            latest = (
+                LightControlWrite.objects
+                .filter(channel_id=channel_id, status=LightControlWrite.STATUS_PENDING)
+                .order_by('-id')
+                .first()
+            )
+            if latest is None:
+                return None
+
+            claimed = (
+                LightControlWrite.objects
+                .filter(id=latest.id, status=LightControlWrite.STATUS_PENDING)
+                .update(status=LightControlWrite.STATUS_SENDING, claimed_at=timezone.now())
+            )
+            if not claimed:
+                # Another process got there first
+                return None
+
+            LightControlWrite.objects.filter(
+                channel_id=channel_id,
+                status=LightControlWrite.STATUS_PENDING,
+                id__lt=latest.id,
+            ).update(status=LightControlWrite.STATUS_SUPERSEDED, coalesced_into=latest)
+
+        latest.status = LightControlWrite.STATUS_SENDING
+        return latest
+
+    def flush(self):
+        """
+        Send the latest pending write if the rate limit allows.
+
+        Returns the number of seconds until the flusher should run again, or
+        None if nothing is pending or being sent.
+        """
+        channel_id, write_api_key, interval, max_attempts = self._config()
+        stale_after = self._stale_after(interval)
+        self._requeue_stale(channel_id, stale_after)
+
+        if not LightControlWrite.objects.filter(channel_id=channel_id, status=LightControlWrite.STATUS_PENDING).exists():
+            if LightControlWrite.objects.filter(channel_id=channel_id, status=LightControlWrite.STATUS_SENDING).exists():
+                # Another process is sending; recover its write if it dies
+                return stale_after
+            return None
+
+        wait = self.seconds_until_next_write()
+        if wait > 0:
+            return wait
+
+        write = self._claim_latest(channel_id)
+        if write is None:
+            return interval
+
+        self._last_attempt = time.time()
+        write.attempts += 1
+        try:
+            response = upstream.post(
+                f'{settings.THINGSPEAK_API_URL}/update',
+                data={'api_key': write_api_key, 'field3': write.lights_on}
+            )
+            entry_id = response.text.strip()
+            if response.status_code == 200 and entry_id != '0':
+                write.status = LightControlWrite.STATUS_SENT
+                write.thingspeak_entry_id = int(entry_id)
+                write.sent_at = timezone.now()
+                write.error = ''
+                logger.info(f"ThingSpeak write {write.ticket} landed as entry {entry_id}")
+            elif response.status_code == 200:
+                write.error = 'ThingSpeak API returned 0 (write rejected, likely rate limited)'
+            else:
+                write.error = f'HTTP {response.status_code}: {response.text}'
+        except (requests.exceptions.RequestException, ValueError) as e:
+            write.error = str(e)
+
+        if write.status != LightControlWrite.STATUS_SENT:
+            if write.attempts >= max_attempts:
+                write.status = LightControlWrite.STATUS_FAILED
+                logger.error(f"ThingSpeak write {write.ticket} failed after {write.attempts} attempts: {write.error}")
+            else:
+                write.status = LightControlWrite.STATUS_PENDING
+                logger.warning(f"ThingSpeak write {write.ticket} attempt {write.attempts} failed, will retry: {write.error}")
+
+        write.save(update_fields=['status', 'thingspeak_entry_id', 'sent_at', 'error', 'attempts'])
+        return interval if write.status == LightControlWrite.STATUS_PENDING else 0
+
+    def _run(self):
+        timeout = 0
+        while True:
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                timeout = self.flush()
+            except Exception as e:
+                logger.exception(f"ThingSpeak write queue error: {e}")
+                timeout = self._config()[2]
+
+
+def resolve_write(write):
+    """Follow coalesced_into links to the write that carried this request's state"""
+    seen = set()
+    while write.coalesced_into_id is not None and write.id not in seen:
+        seen.add(write.id)
+        write = write.coalesced_into
+    return write
+
+
+def write_status(write):
+    """Serializable status for a ticket, including the write that actually landed"""
+    effective = resolve_write(write)
+    return {
+        'ticket': str(write.ticket),
+        'lights_on': write.lights_on,
+        'status': write.status,
+        'attempts': write.attempts,
+        'error': write.error or None,
+        'created_at': write.created_at.isoformat(),
+        'coalesced_into': str(effective.ticket) if effective.id != write.id else None,
+        'delivered': effective.status == LightControlWrite.STATUS_SENT,
+        'delivered_status': effective.status,
+        'delivered_lights_on': effective.lights_on,
+        'thingspeak_entry_id': effective.thingspeak_entry_id,
+        'sent_at': effective.sent_at.isoformat() if effective.sent_at else None,
+    }
+
+
+write_queue = ThingSpeakWriteQueue()
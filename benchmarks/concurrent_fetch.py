@@ -0,0 +1,79 @@
+"""
+Compare sequential and concurrent upstream fetching for /api/predict/.
+
+Starts local stand-ins for Visual Crossing and ThingSpeak with fixed delays
+and times the two fetchers run one after another against the async
+`predict_light` view, which gathers them concurrently.
+
+    python -m benchmarks.concurrent_fetch [--weather-delay 0.2] [--sensor-delay 0.3]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from .standins import StandinServer, setup_django
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:32s} median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--weather-delay', type=float, default=0.2, help='Visual Crossing stand-in latency (s)')
+    parser.add_argument('--sensor-delay', type=float, default=0.3, help='ThingSpeak stand-in latency (s)')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with StandinServer(delay=args.weather_delay) as weather, StandinServer(delay=args.sensor_delay) as thingspeak:
+        setup_django(
+            VISUAL_CROSSING_API_URL=weather.url,
+            THINGSPEAK_API_URL=thingspeak.url,
+            VISUAL_CROSSING_API_KEY='benchmark',
+        )
+        from django.test import AsyncClient
+        from api.views import get_trained_model_system
+
+        system = get_trained_model_system()
+
+        def sequential():
+            system.get_external_api_data()
+            system.simulate_iot_sensor_data()
+
+        def concurrent():
+            async def both():
+                await asyncio.gather(system.aget_external_api_data(), system.asimulate_iot_sensor_data())
+            asyncio.run(both())
+
+        client = AsyncClient()
+
+        def view():
+            response = asyncio.run(client.get('/api/predict/'))
+            assert response.status_code == 200, response.content
+
+        print(f"Stand-in latency: weather {args.weather_delay * 1000:.0f} ms, "
+              f"sensors {args.sensor_delay * 1000:.0f} ms\n")
+        sequential_samples = timed(sequential, args.repeat)
+        concurrent_samples = timed(concurrent, args.repeat)
+        view_samples = timed(view, args.repeat)
+
+    report('sequential fetchers', sequential_samples)
+    report('concurrent fetchers (gather)', concurrent_samples)
+    report('async predict_light view', view_samples)
+    saved = statistics.median(sequential_samples) - statistics.median(concurrent_samples)
+    print(f"\nConcurrent fetching saves {saved * 1000:.1f} ms per request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Time fleet predictions at different fetch concurrency limits.
+
+Registers --lights streetlights spread over --areas areas in a temporary
+database, points ThingSpeak and Visual Crossing at a stand-in with a fixed
+delay, and times predict_fleet per concurrency limit against predicting the
+lights one by one (a weather lookup, a feed fetch and a model call per light).
+
+    python -m benchmarks.fleet_predict [--lights 200] [--areas 4] [--delay 0.05]
+"""
+import argparse
+import time
+
+from .standins import StandinServer, setup_django, use_temporary_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lights', type=int, default=200)
+    parser.add_argument('--areas', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.05, help='stand-in upstream latency in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 10, 32])
+    args = parser.parse_args()
+
+    with StandinServer(delay=args.delay) as server:
+        setup_django(
+            ML_WARMUP_ON_STARTUP='false',
+            PREDICTION_LOG_ENABLED='false',
+            THINGSPEAK_API_URL=server.url,
+            VISUAL_CROSSING_API_URL=server.url,
+            VISUAL_CROSSING_API_KEY='benchmark',
+            UPSTREAM_POOL_MAXSIZE=str(max(args.concurrency)),
+        )
+        use_temporary_database()
+
+        from api.fleet import fetch_light_sensor, predict_fleet
+        from api.features import FEATURE_COLUMNS
+        from api.ml_model import weather_inputs
+        from api.model_service import get_model_system
+        from api.models import Streetlight
+
+        Streetlight.objects.bulk_create([
+            Streetlight(name=f'Pole {i}', channel_id=1000 + i, read_api_key='key', area=f'Area {i % args.areas}')
+            for i in range(args.lights)
+        ])
+        lights = list(Streetlight.objects.order_by('id'))
+        system = get_model_system()
+
+        def one_by_one():
+            from datetime import datetime
+            import numpy as np
+            for light in lights:
+                external = system.get_external_api_data(light.area)
+                sensor = fetch_light_sensor(light)
+                row = system.feature_pipeline.transform_one(
+                    weather_inputs(external['current_weather']), datetime.now(),
+                    out=np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+                )
+                system.make_prediction(row, external_data=external, sensor_data=sensor)
+
+        print(f"{args.lights} lights in {args.areas} areas, upstream delay {args.delay * 1e3:.0f} ms\n")
+        before = server.request_count
+        start = time.perf_counter()
+        one_by_one()
+        print(f"{'one by one':18s} {time.perf_counter() - start:7.2f}s   {server.request_count - before:4d} upstream calls")
+
+        for concurrency in args.concurrency:
+            before = server.request_count
+            start = time.perf_counter()
+            results, timings = predict_fleet(system, lights, max_workers=concurrency)
+            elapsed = time.perf_counter() - start
+            assert len(results) == args.lights and not any(r['sensor_error'] for r in results)
+            print(f"{'concurrency ' + str(concurrency):18s} {elapsed:7.2f}s   {server.request_count - before:4d} upstream calls   "
+                  f"(fetch {timings['fetch_seconds']:.2f}s, batched predict {timings['predict_seconds'] * 1e3:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare JSON response building before and after the NumPy-aware encoder.
+
+Two 1,000-entry payloads:
+- sensor logs: 1,000 SensorEntry rows read from a temporary database. Before:
+  model instances -> entry_payload -> Django's JsonResponse. After: tuples ->
+  entry_payloads -> api.responses.JsonResponse.
+- predictions: 1,000 make_prediction-style dicts holding NumPy scalars.
+  Before: the recursive convert_numpy_types walk that predict_light used,
+  then Django's JsonResponse. After: api.responses.JsonResponse directly.
+
+    python -m benchmarks.json_encoding [--entries 1000] [--repeat 50]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from .standins import setup_django, use_temporary_database
+
+
+def convert_numpy_types(obj):
+    # The per-request conversion predict_light used before the shared encoder
+    if isinstance(obj, dict):
+        return {key: convert_numpy_types(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy_types(value) for value in obj]
+    elif isinstance(obj, (np.int_, np.intc, np.intp, np.int8, np.int16, np.int32, np.int64,
+                          np.uint8, np.uint16, np.uint32, np.uint64)):
+        return int(obj)
+    elif isinstance(obj, (np.float64, np.float16, np.float32, np.float64)):
+        return float(obj)
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    else:
+        return obj
+
+
+def best_ms(fn, repeat):
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django(ML_WARMUP_ON_STARTUP='false', THINGSPEAK_CHANNEL_ID='1')
+    use_temporary_database()
+
+    from django.http import JsonResponse as DjangoJsonResponse
+    from django.utils import timezone
+    from api.models import SensorEntry
+    from api.responses import JsonResponse
+    from api.sensor_sync import entry_payload, entry_payloads
+
+    now = timezone.now()
+    SensorEntry.objects.bulk_create([
+        SensorEntry(channel_id=1, entry_id=i, created_at=now, ambient_light=float(i % 100), motion=i % 2)
+        for i in range(1, args.entries + 1)
+    ])
+
+    def latest_entries():
+        # A fresh queryset per call, so no run is served from the result cache
+        return SensorEntry.objects.filter(channel_id=1).order_by('-entry_id')[:args.entries]
+
+    def sensor_logs_before():
+        live_logs = [entry_payload(entry) for entry in list(latest_entries())]
+        return DjangoJsonResponse({'status': 'success', 'live_logs': live_logs, 'total_entries': len(live_logs)})
+
+    def sensor_logs_after():
+        live_logs = entry_payloads(latest_entries())
+        return JsonResponse({'status': 'success', 'live_logs': live_logs, 'total_entries': len(live_logs)})
+
+    rng = np.random.default_rng(0)
+    intensity = rng.uniform(0, 100, args.entries).astype(np.float32)
+    predictions = [
+        {
+            'recommended_intensity': intensity[i],
+            'lights_should_be_on': intensity[i] > 15,
+            'confidence': np.float32(min(1.0, abs(intensity[i] - 50) / 50)),
+            'entry_id': np.int64(i),
+        }
+        for i in range(args.entries)
+    ]
+
+    def predictions_before():
+        return DjangoJsonResponse({'predictions': convert_numpy_types(predictions)})
+
+    def predictions_after():
+        return JsonResponse({'predictions': predictions})
+
+    assert json.loads(sensor_logs_before().content) == json.loads(sensor_logs_after().content)
+    assert json.loads(predictions_before().content) == json.loads(predictions_after().content)
+
+    print(f"{args.entries}-entry payloads, best of {args.repeat}\n")
+    for name, before, after in (
+        ('sensor logs', sensor_logs_before, sensor_logs_after),
+        ('predictions (NumPy)', predictions_before, predictions_after),
+    ):
+        before_ms, after_ms = best_ms(before, args.repeat), best_ms(after, args.repeat)
+        before_kb, after_kb = len(before().content) / 1024, len(after().content) / 1024
+        print(f"{name:20s} before {before_ms:7.2f} ms ({before_kb:6.1f} KB)   "
+              f"after {after_ms:7.2f} ms ({after_kb:6.1f} KB)   {before_ms / after_ms:4.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Per-request cost of the log output on the /api/predict/ path, before and after
+moving it to the background queue handler.
+
+"Before" replays what a predict request used to emit: eight print() lines,
+including the raw ThingSpeak JSON. They go to a line-buffered file standing in
+for an unbuffered container stdout. The same eight records are also timed
+through a synchronous FileHandler + StreamHandler, as the old LOGGING did.
+"After" times the records a request now emits (debug records, filtered at
+INFO and kept at DEBUG) and the same eight records through
+BackgroundQueueHandler. A NullHandler run gives the floor: the cost of
+creating those records at all. Every variant runs on --threads concurrent request
+threads, so contention on the file and stream locks shows up. Each request
+first waits --io-wait seconds, standing in for the upstream calls. Only the
+time spent emitting the log output is counted.
+
+    python -m benchmarks.logging_overhead [--threads 8] [--requests 500] [--io-wait 0.002]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from .standins import ROOT_DIR, thingspeak_feed
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+from api.log_handlers import BackgroundQueueHandler
+
+
+THINGSPEAK_URL = 'https://api.thingspeak.com/channels/0/feeds.json?results=1&api_key=KEY'
+THINGSPEAK_RESPONSE = thingspeak_feed(1)
+CURRENT_WEATHER = {'temperature': 21.0, 'humidity': 55.0, 'cloudcover': 35.0, 'visibility': 10.0, 'wind_speed': 9.0}
+
+LEGACY_LINES = [
+    lambda: "Fetching real-time data from APIs...",
+    lambda: "Fetching weather data for Harare,Zimbabwe...",
+    lambda: "✓ Weather data fetched successfully",
+    lambda: f"  Temperature: {CURRENT_WEATHER['temperature']}°C",
+    lambda: f"  Humidity: {CURRENT_WEATHER['humidity']}%",
+    lambda: f"  Cloud Cover: {CURRENT_WEATHER['cloudcover']}%",
+    lambda: f"Fetching data from: {THINGSPEAK_URL}",
+    lambda: f"ThingSpeak response: {THINGSPEAK_RESPONSE}",
+]
+
+
+def legacy_prints(logger):
+    for line in LEGACY_LINES:
+        print(line())
+
+
+def legacy_records(logger):
+    for line in LEGACY_LINES:
+        logger.info(line())
+
+
+def current_request(logger):
+    # What ml_model now logs for a successful predict request
+    logger.debug("Weather data fetched", extra={'location': 'Harare,Zimbabwe', **CURRENT_WEATHER})
+    entry = THINGSPEAK_RESPONSE['feeds'][0]
+    logger.debug("ThingSpeak reading", extra={
+        'entry_id': entry['entry_id'], 'ambient_light': entry['field1'], 'motion': entry['field2']
+    })
+
+
+def run_threads(emit, logger, threads, requests, io_wait):
+    """Mean seconds per request spent in `emit` on the request threads"""
+    per_thread = [0.0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        for _ in range(requests):
+            time.sleep(io_wait)
+            started = time.perf_counter()
+            emit(logger)
+            per_thread[index] += time.perf_counter() - started
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return sum(per_thread) / (threads * requests)
+
+
+@contextlib.contextmanager
+def configured_logger(handlers, level):
+    logger = logging.getLogger('benchmark.request')
+    logger.handlers = handlers
+    logger.setLevel(level)
+    logger.propagate = False
+    try:
+        yield logger
+    finally:
+        for handler in handlers:
+            handler.close()
+        logger.handlers = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='requests per thread')
+    parser.add_argument('--io-wait', type=float, default=0.002, help='seconds each request waits on upstream calls')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-logging-')
+    # Line-buffered, like a container's unbuffered stdout
+    stdout_file = open(os.path.join(workdir, 'stdout.log'), 'w', buffering=1, encoding='utf-8')
+
+    def sync_handlers():
+        file_handler = logging.FileHandler(os.path.join(workdir, 'sync.log'), encoding='utf-8')
+        stream_handler = logging.StreamHandler(stdout_file)
+        return [file_handler, stream_handler]
+
+    def queue_handler():
+        return [BackgroundQueueHandler(
+            filename=os.path.join(workdir, 'queue.log'), console='off', queue_size=10 ** 6
+        )]
+
+    results = []
+    real_stdout = sys.stdout
+    sys.stdout = stdout_file
+    try:
+        with configured_logger([], logging.INFO) as logger:
+            results.append(('before: 8 prints', run_threads(legacy_prints, logger, args.threads, args.requests, args.io_wait)))
+        with configured_logger(sync_handlers(), logging.INFO) as logger:
+            results.append(('before: 8 sync records', run_threads(legacy_records, logger, args.threads, args.requests, args.io_wait)))
+        for level in (logging.INFO, logging.DEBUG):
+            handlers = queue_handler()
+            with configured_logger(handlers, level) as logger:
+                seconds = run_threads(current_request, logger, args.threads, args.requests, args.io_wait)
+                results.append((f'after: request at {logging.getLevelName(level)}', seconds))
+        handlers = queue_handler()
+        with configured_logger(handlers, logging.INFO) as logger:
+            seconds = run_threads(legacy_records, logger, args.threads, args.requests, args.io_wait)
+            results.append(('after: 8 queued records', seconds))
+            dropped = handlers[0].dropped
+        # Floor: creating the 8 records with nothing written
+        with configured_logger([logging.NullHandler()], logging.INFO) as logger:
+            seconds = run_threads(legacy_records, logger, args.threads, args.requests, args.io_wait)
+            results.append(('floor: 8 records, no output', seconds))
+    finally:
+        sys.stdout = real_stdout
+        stdout_file.close()
+
+    print(f"{args.threads} request threads x {args.requests} requests\n")
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"{name:28s} {seconds * 1e6:9.1f} us/request   {baseline / seconds:8.1f}x")
+    print(f"\nqueued records dropped: {dropped}")
+    with open(os.path.join(workdir, 'queue.log'), encoding='utf-8') as f:
+        print(f"sample JSON line: {json.dumps(json.loads(f.readline()))[:160]}...")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Incremental model updates against full retrains.
+
+The training CSV is cut at --cutoff and the model trained on the rows
+before it. The remaining rows are then appended one --chunk-hours block
+at a time. Each block is handled twice: by a full retrain on everything so
+far, and by the updater (update_model on the new rows only, behind the
+validation gate), while --threads request threads keep predicting through
+model_service. The report gives seconds per block, held-out and reference
+MAE, the booster size, and the predictions served during the swaps.
+
+    python -m benchmarks.model_update [--cutoff 2024-11-01] [--chunk-hours 168] [--threads 4]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from .standins import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cutoff', default='2024-11-01')
+    parser.add_argument('--chunk-hours', type=int, default=168)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    workdir = tempfile.mkdtemp(prefix='bench-model-update-')
+    csv_path = os.path.join(workdir, 'training.csv')
+    setup_django(
+        ML_WARMUP_ON_STARTUP='false',
+        PREDICTION_LOG_ENABLED='false',
+        TRAINING_DATA_PATH=csv_path,
+        ML_MODEL_DIR=os.path.join(workdir, 'models'),
+        DATASET_CACHE_DIR=os.path.join(workdir, 'dataset'),
+        LOCK_DIR=os.path.join(workdir, 'locks'),
+    )
+    from django.conf import settings
+    from api import model_service
+    from api.ml_model import weather_inputs
+    from api.model_registry import train_system
+    from api.model_updates import ModelUpdater
+
+    full = pd.read_csv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'harareweather2.csv'))
+    times = pd.to_datetime(full['datetime'])
+    base = full[times < args.cutoff]
+    rest = full[times >= args.cutoff].sort_values('datetime', kind='stable')
+    chunks = [rest.iloc[i:i + args.chunk_hours] for i in range(0, len(rest), args.chunk_hours)]
+
+    base.to_csv(csv_path, index=False)
+    started = time.perf_counter()
+    system = model_service.get_model_system()
+    print(f"initial training on {len(base)} rows: {time.perf_counter() - started:.2f}s\n")
+
+    # Request threads predicting through model_service during the updates
+    stop = threading.Event()
+    served, errors, worst = [0], [0], [0.0]
+    external = system._get_simulated_data()
+    weather = weather_inputs(external['current_weather'])
+
+    def request_loop():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                current = model_service.get_model_system()
+                row = current.feature_pipeline.transform_one(weather, pd.Timestamp.now().to_pydatetime())
+                current.make_prediction(row, external_data=external)
+                served[0] += 1
+            except Exception:
+                errors[0] += 1
+            worst[0] = max(worst[0], time.perf_counter() - started)
+
+    threads = [threading.Thread(target=request_loop, daemon=True) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+
+    updater = ModelUpdater()
+    print(f"{'rows':>6s} {'full retrain':>13s} {'update':>8s} {'status':>9s} {'holdout MAE':>17s} "
+          f"{'reference MAE':>17s} {'trees':>6s}")
+    seen = base
+    for chunk in chunks:
+        seen = pd.concat([seen, chunk])
+        seen.to_csv(csv_path, index=False)
+
+        started = time.perf_counter()
+        train_system(csv_path, dataset_cache_dir=settings.DATASET_CACHE_DIR)
+        retrain_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        report = updater.run_once() or {'status': 'none'}
+        update_seconds = time.perf_counter() - started
+
+        holdout, reference = report.get('holdout'), report.get('reference')
+        print(f"{len(chunk):6d} {retrain_seconds:12.2f}s {update_seconds:7.2f}s {report['status']:>9s} "
+              + (f"{holdout['mae_before']:7.3f} -> {holdout['mae_after']:6.3f} " if holdout else f"{'':18s}")
+              + (f"{reference['mae_before']:7.3f} -> {reference['mae_after']:6.3f} " if reference else f"{'':18s}")
+              + f"{report.get('trees', ''):>6}")
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"\npredictions served during updates: {served[0]}, failed: {errors[0]}, "
+          f"slowest: {worst[0] * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Measure /api/predictions/history/ query latency over a large PredictionLog.
+
+Seeds a temporary SQLite database with synthetic predictions spread over a
+year (10M rows by default) and their 5-minute rollups, then times the 30-day hourly query and a few
+other page shapes through the view, reporting p50/p99 against a target.
+
+    python -m benchmarks.prediction_history_query [--rows 10000000] [--runs 50] [--target-ms 250]
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+from .standins import setup_django, use_temporary_database
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def seed(path, rows, end, days=365, chunk=500_000):
+    """Insert `rows` predictions evenly spaced over `days` days before `end`"""
+    from django.db import transaction
+    from api.models import PredictionLog
+    from api.prediction_history import record_rollups
+
+    table = PredictionLog._meta.db_table
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    # Bulk load without the index, then build it once
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+
+    start = end - timedelta(days=days)
+    step = days * 86400 / rows
+    rng = random.Random(42)
+    for offset in range(0, rows, chunk):
+        batch = []
+        for i in range(offset, min(rows, offset + chunk)):
+            intensity = rng.random() * 100
+            batch.append((start + timedelta(seconds=i * step), intensity, intensity > 30, 0.5 + rng.random() / 2))
+        conn.executemany(
+            f'INSERT INTO "{table}" (timestamp, intensity, lights_on, confidence) VALUES (?, ?, ?, ?)',
+            [(ts.strftime('%Y-%m-%d %H:%M:%S.%f'), *values) for ts, *values in batch]
+        )
+        conn.commit()
+        # Same rollup path as PredictionLogBuffer.flush
+        with transaction.atomic():
+            record_rollups(batch)
+    for _, sql in indexes:
+        conn.execute(sql)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--target-ms', type=float, default=250, help='p99 target for the 30-day hourly query')
+    args = parser.parse_args()
+
+    setup_django(ML_WARMUP_ON_STARTUP='false', PREDICTION_LOG_ENABLED='false')
+    path = use_temporary_database()
+
+    from django.db import connection
+    from django.test import Client
+
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    connection.close()
+    started = time.perf_counter()
+    seed(path, args.rows, end)
+    print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.1f}s\n")
+
+    client = Client()
+    # The first request imports the view module (xgboost, pandas); keep it out of the timings
+    client.get('/api/predictions/history/', {'bucket': '1h'})
+    rng = random.Random(0)
+
+    def window(days):
+        # Random window inside the seeded year, so runs do not hit the same pages
+        window_end = end - timedelta(hours=rng.randrange(0, (365 - days) * 24))
+        return (window_end - timedelta(days=days)).isoformat(), window_end.isoformat()
+
+    def hourly_30_days():
+        start, stop = window(30)
+        return {'bucket': '1h', 'start': start, 'end': stop, 'limit': 720}
+
+    def five_minute_day():
+        start, stop = window(1)
+        return {'bucket': '5m', 'start': start, 'end': stop}
+
+    def daily_year():
+        return {'bucket': '1d', 'start': (end - timedelta(days=365)).isoformat(), 'end': end.isoformat()}
+
+    def raw_page():
+        start, stop = window(30)
+        return {'start': start, 'end': stop, 'limit': 500}
+
+    cases = [
+        ('30 days, 1h buckets', hourly_30_days),
+        ('1 day, 5m buckets', five_minute_day),
+        ('365 days, 1d buckets', daily_year),
+        ('raw page of 500', raw_page),
+    ]
+
+    results = {}
+    for label, make_params in cases:
+        latencies = []
+        buckets = 0
+        for _ in range(args.runs):
+            params = make_params()
+            started = time.perf_counter()
+            response = client.get('/api/predictions/history/', params)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.content
+            buckets = response.json()['count']
+        results[label] = latencies
+        print(f"{label:24s} p50 {percentile(latencies, 0.5) * 1e3:8.1f} ms   "
+              f"p99 {percentile(latencies, 0.99) * 1e3:8.1f} ms   ({buckets} results/page)")
+
+    p99 = percentile(results['30 days, 1h buckets'], 0.99) * 1e3
+    verdict = 'PASS' if p99 <= args.target_ms else 'FAIL'
+    print(f"\n30-day hourly p99 {p99:.1f} ms vs target {args.target_ms:.0f} ms: {verdict}")
+
+
+if __name__ == '__main__':
+    main()
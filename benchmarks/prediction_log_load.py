@@ -0,0 +1,105 @@
+"""
+Measure the per-request cost of recording predictions in PredictionLog.
+
+Times make_prediction with and without the prediction log sink, then drives
+record() from several threads at a fixed total rate while the background
+flusher bulk-writes into a temporary SQLite (WAL) database.
+
+    python -m benchmarks.prediction_log_load [--rate 500] [--seconds 5] [--threads 8]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from .standins import setup_django, use_temporary_database
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=int, default=500, help='total predictions per second')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=2000, help='make_prediction calls per round')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django(ML_WARMUP_ON_STARTUP='false')
+    use_temporary_database()
+
+    from api.models import PredictionLog
+    from api.prediction_log import PredictionLogBuffer
+    from api.model_service import get_model_system
+
+    system = get_model_system()
+    features = [25.0, 15.0, 20.0, 70.0, 1013.25, 30.0, 10.0, 300.0, 15.0, 20.0, 14, 150, 6, 0, 12.0, 210.0, 0.3]
+    # Request-path cost only: the flusher stays idle while make_prediction is timed
+    buffer = PredictionLogBuffer(batch_size=10 ** 9, flush_interval=3600, max_buffer=10 ** 9)
+
+    def time_calls(sink):
+        system.prediction_sink = sink
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            system.make_prediction(features)
+        return (time.perf_counter() - start) / args.calls
+
+    # Alternate the variants and keep the best round of each to cancel out noise
+    time_calls(None)
+    without_sink = min(time_calls(None) for _ in range(args.rounds))
+    with_sink = min(time_calls(buffer) for _ in range(args.rounds))
+    for _ in range(args.rounds):
+        without_sink = min(without_sink, time_calls(None))
+        with_sink = min(with_sink, time_calls(buffer))
+    system.prediction_sink = None
+
+    # Background cost: bulk_create of the buffered rows, amortized per row
+    buffered = len(buffer)
+    buffer.batch_size = 500
+    start = time.perf_counter()
+    while buffer.flush():
+        pass
+    flush_per_row = (time.perf_counter() - start) / buffered
+
+    print(f"make_prediction without log   {without_sink * 1e6:8.1f} us/call")
+    print(f"make_prediction with log      {with_sink * 1e6:8.1f} us/call")
+    print(f"request-path overhead         {(with_sink - without_sink) * 1e6:8.1f} us/call")
+    print(f"background flush cost         {flush_per_row * 1e6:8.1f} us/row (bulk_create, off the request path)\n")
+
+    # Paced load: record() latency while the flusher writes concurrently
+    PredictionLog.objects.all().delete()
+    buffer = PredictionLogBuffer()
+    per_thread_interval = args.threads / args.rate
+    latencies = [[] for _ in range(args.threads)]
+
+    def worker(samples):
+        deadline = time.monotonic() + args.seconds
+        next_at = time.monotonic()
+        while next_at < deadline:
+            start = time.perf_counter()
+            buffer.record(42.0, True, 0.5)
+            samples.append(time.perf_counter() - start)
+            next_at += per_thread_interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    threads = [threading.Thread(target=worker, args=(samples,)) for samples in latencies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    while buffer.flush():
+        pass
+
+    samples = [sample for thread_samples in latencies for sample in thread_samples]
+    print(f"paced load: {args.rate}/s for {args.seconds:g}s on {args.threads} threads, {len(samples)} records")
+    print(f"record() p50 {percentile(samples, 0.50) * 1e6:6.1f} us   p99 {percentile(samples, 0.99) * 1e6:6.1f} us   "
+          f"max {max(samples) * 1e6:8.1f} us   mean {statistics.mean(samples) * 1e6:6.1f} us")
+    print(f"rows persisted: {PredictionLog.objects.count()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Replaying the weather history through the decision pipeline, row by row
+against api.replay.
+
+The row-by-row path is what example_usage does: one feature list, one
+external_data dict and one make_prediction call per hour. The same history
+(the training CSV repeated --years times) then goes through replay(), with
+the AQI and traffic inputs replay simulated, and both decisions are
+compared hour by hour.
+
+    python -m benchmarks.replay [--years 1] [--sample 2000]
+"""
+import argparse
+import tempfile
+import time
+
+from .standins import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--years', type=int, default=1, help="copies of the training CSV to replay")
+    parser.add_argument('--sample', type=int, default=2000,
+                        help="hours timed row by row (the total is extrapolated)")
+    args = parser.parse_args()
+
+    setup_django(
+        ML_WARMUP_ON_STARTUP='false',
+        PREDICTION_LOG_ENABLED='false',
+        ML_MODEL_DIR=tempfile.mkdtemp(prefix='bench-replay-models-'),
+    )
+
+    import numpy as np
+    import pandas as pd
+    from django.conf import settings
+    from api.ml_model import create_features
+    from api.model_registry import read_training_data
+    from api.model_service import get_model_system
+    from api.replay import replay, summarize
+
+    system = get_model_system()
+    history = pd.concat([read_training_data(settings.TRAINING_DATA_PATH)] * args.years, ignore_index=True)
+
+    replay(system, history)
+    started = time.perf_counter()
+    decisions = replay(system, history)
+    replay_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    summary = summarize(decisions)
+    summarize(decisions, 'month')
+    summary_seconds = time.perf_counter() - started
+
+    sample = min(args.sample, len(history))
+    started = time.perf_counter()
+    features = create_features(history.iloc[:sample], system.feature_pipeline)[system.feature_columns].fillna(0)
+    row_by_row = []
+    for i, row in enumerate(features.itertuples(index=False)):
+        external_data = {
+            'air_quality': {'aqi': decisions['aqi'].iloc[i]},
+            'traffic_data': {
+                'pedestrian_count': decisions['pedestrian_count'].iloc[i],
+                'vehicle_count': decisions['vehicle_count'].iloc[i],
+            },
+        }
+        row_by_row.append(system.make_prediction(list(row), external_data=external_data))
+    row_seconds = (time.perf_counter() - started) / sample * len(history)
+
+    intensity = np.array([prediction['recommended_intensity'] for prediction in row_by_row])
+    on = np.array([prediction['lights_should_be_on'] for prediction in row_by_row])
+    max_diff = np.abs(intensity - decisions['recommended_intensity'].iloc[:sample]).max()
+    mismatches = int((on != decisions['lights_should_be_on'].iloc[:sample]).sum())
+
+    print(f"{len(history)} hours\n")
+    print(f"{'row by row (make_prediction)':32s} {row_seconds:9.3f} s  (extrapolated from {sample} hours)")
+    print(f"{'replay()':32s} {replay_seconds:9.3f} s")
+    print(f"{'summarize(), overall + monthly':32s} {summary_seconds:9.3f} s")
+    print(f"max intensity difference: {max_diff:.6f}, on/off mismatches: {mismatches}\n")
+    print(f"hours on {summary['hours_on']:.0f} of {summary['hours']:.0f} (rules: {summary['rule_hours_on']:.0f}), "
+          f"mean intensity {summary['mean_intensity']:.1f}, "
+          f"{summary['full_power_hours']:.0f} full-power hours, "
+          f"on/off agreement with the rules {summary['rule_agreement']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
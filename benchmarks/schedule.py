@@ -0,0 +1,115 @@
+"""
+Cost of the day-ahead lighting schedule against polling /api/predict/.
+
+Times building the schedule's predictions one hour at a time (transform_one
+and make_prediction per hour) and as one batch (transform_hours and
+make_prediction_batch), then a full refresh including the forecast fetch,
+and finally /api/schedule/ and /api/predict/ requests. Upstream APIs are
+answered by the local stand-in server after --delay seconds, and upstream
+calls are counted per request.
+
+    python -m benchmarks.schedule [--hours 36] [--requests 200] [--delay 0.05]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from .standins import StandinServer, setup_django, use_temporary_database
+
+
+def median_ms(fn, iterations):
+    fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hours', type=int, default=36)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.05, help='stand-in upstream latency in seconds')
+    args = parser.parse_args()
+
+    with StandinServer(delay=args.delay) as server:
+        setup_django(
+            ML_WARMUP_ON_STARTUP='false',
+            PREDICTION_LOG_ENABLED='false',
+            ML_MODEL_DIR=tempfile.mkdtemp(prefix='bench-schedule-models-'),
+            THINGSPEAK_API_URL=server.url,
+            VISUAL_CROSSING_API_URL=server.url,
+            VISUAL_CROSSING_API_KEY='benchmark',
+            SCHEDULE_HOURS=args.hours,
+        )
+        use_temporary_database()
+
+        import numpy as np
+        from django.test import Client
+        from api.features import FEATURE_COLUMNS, WEATHER_COLUMNS
+        from api.model_service import get_model_system
+        from api.schedule import build_schedule, fetch_forecast, forecast_hours, lighting_scheduler
+
+        system = get_model_system()
+        forecast = fetch_forecast('Harare,Zimbabwe')
+        start_epoch = int(time.time()) // 3600 * 3600
+        epochs, local_times, weather, daylight = forecast_hours(forecast, start_epoch, args.hours)
+        hourly = [
+            ({name: float(weather[name][i]) for name in WEATHER_COLUMNS},
+             local_times[i].astype(datetime), float(daylight[i]))
+            for i in range(len(epochs))
+        ]
+
+        def one_hour_at_a_time():
+            row = np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+            return [
+                system.make_prediction(system.feature_pipeline.transform_one(inputs, when, daylight_hours, out=row))
+                for inputs, when, daylight_hours in hourly
+            ]
+
+        def batched():
+            return build_schedule(system, forecast, start_epoch, args.hours)
+
+        batch = batched()
+        singles = one_hour_at_a_time()
+        max_diff = max(abs(round(float(single['recommended_intensity']), 2) - hour['recommended_intensity'])
+                       for single, hour in zip(singles, batch))
+
+        print(f"{len(batch)} forecast hours\n")
+        print(f"{'predictions, one hour at a time':34s} {median_ms(one_hour_at_a_time, 50):9.3f} ms")
+        print(f"{'predictions, one batch':34s} {median_ms(batched, 50):9.3f} ms")
+        print(f"max intensity difference: {max_diff:.3f}\n")
+
+        before = server.request_count
+        started = time.perf_counter()
+        lighting_scheduler.refresh('Harare,Zimbabwe', force=True)
+        refresh_ms = (time.perf_counter() - started) * 1e3
+        print(f"{'refresh (fetch, predict, store)':34s} {refresh_ms:9.3f} ms   "
+              f"{server.request_count - before} upstream call(s)\n")
+
+        client = Client()
+        calls_per_request = {}
+        for path in ('/api/schedule/', '/api/predict/'):
+            def request():
+                response = client.get(path)
+                assert response.status_code == 200, response.content[:200]
+            before = server.request_count
+            latency = median_ms(request, args.requests)
+            calls = calls_per_request[path] = (server.request_count - before) / (args.requests + 1)
+            print(f"{'GET ' + path:34s} {latency:9.3f} ms   {calls:.1f} upstream call(s)/request")
+
+        # A device polling /api/predict/ every 5 minutes, against one that
+        # pulls the schedule once per refresh interval
+        from django.conf import settings
+        polls, pulls = 24 * 12, 24 * 3600 / settings.SCHEDULE_REFRESH_INTERVAL
+        print(f"\nper device per day: {polls} predict polls = {polls * calls_per_request['/api/predict/']:.0f} "
+              f"upstream calls; {pulls:.0f} schedule pulls = "
+              f"{pulls * calls_per_request['/api/schedule/']:.0f} upstream calls")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure dashboard polling of the sensor endpoints against the local mirror.
+
+Several simulated viewers poll /api/sensor-logs/live/ and
+/api/get_sensor_data_from_thingspeak/ while a stand-in ThingSpeak answers
+after a WAN-like delay. Reports request latency and how many calls actually
+reached ThingSpeak.
+
+    python -m benchmarks.sensor_mirror [--viewers 20] [--polls 25] [--delay 0.2]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from .standins import StandinServer, setup_django, use_temporary_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--viewers', type=int, default=20)
+    parser.add_argument('--polls', type=int, default=25, help='polls per viewer')
+    parser.add_argument('--delay', type=float, default=0.2, help='stand-in ThingSpeak latency in seconds')
+    args = parser.parse_args()
+
+    with StandinServer(delay=args.delay, feed_results=20) as server:
+        setup_django(
+            ML_WARMUP_ON_STARTUP='false',
+            THINGSPEAK_API_URL=server.url,
+            THINGSPEAK_CHANNEL_ID='1',
+            THINGSPEAK_SYNC_INTERVAL='15',
+        )
+        use_temporary_database()
+
+        from django.db import close_old_connections
+        from django.test import Client
+
+        latencies = []
+        lock = threading.Lock()
+
+        def viewer():
+            client = Client()
+            samples = []
+            last_entry_id = 0
+            for _ in range(args.polls):
+                start = time.perf_counter()
+                live = client.get('/api/sensor-logs/live/', {'since_entry_id': last_entry_id})
+                client.get('/api/get_sensor_data_from_thingspeak/')
+                samples.append(time.perf_counter() - start)
+                assert live.status_code == 200, live.content
+                last_entry_id = live.json()['last_entry_id']
+            close_old_connections()
+            with lock:
+                latencies.extend(samples)
+
+        # The first request mirrors the feed; time steady-state polling after it
+        Client().get('/api/sensor-logs/live/')
+        baseline_requests = server.request_count
+
+        threads = [threading.Thread(target=viewer) for _ in range(args.viewers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        polls = args.viewers * args.polls
+        print(f"{args.viewers} viewers x {args.polls} polls (2 endpoints each) in {elapsed:.2f}s")
+        print(f"poll latency   p50 {statistics.median(latencies) * 1e3:6.1f} ms   "
+              f"max {max(latencies) * 1e3:6.1f} ms   (ThingSpeak proxying costs >= {2 * args.delay * 1e3:.0f} ms)")
+        print(f"ThingSpeak calls: {server.request_count - baseline_requests} during polling "
+              f"(proxying would make {2 * polls}), {baseline_requests} for the initial sync")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Hold many idle subscribers on the live sensor SSE stream and track memory.
+
+Opens --subscribers connections to /api/sensor-logs/stream/ through Django's
+ASGI application (in-process, no sockets), lets them idle through several
+heartbeats, then publishes entries into the mirror and checks every
+subscriber receives them. Python heap usage (tracemalloc) is sampled before
+and after connecting, after idling and after publishing; it should stay flat.
+
+    python -m benchmarks.sensor_stream_subscribers [--subscribers 1000] [--idle 5] [--entries 10]
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from .standins import StandinServer, setup_django, use_temporary_database
+
+
+def heap_mb():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] / 2 ** 20
+
+
+async def run(args, server):
+    from asgiref.sync import sync_to_async
+    from django.core.asgi import get_asgi_application
+    from django.urls import resolve
+    from django.utils import timezone
+    from api.models import SensorEntry
+    from api.sensor_stream import sensor_stream_hub
+
+    app = get_asgi_application()
+    # Import the views (xgboost, pandas) before measuring
+    resolve('/api/sensor-logs/stream/')
+    tracemalloc.start()
+    baseline = heap_mb()
+    disconnect = asyncio.Event()
+    received = {}
+    heartbeats = {}
+
+    async def subscriber(i):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': '/api/sensor-logs/stream/',
+            'raw_path': b'/api/sensor-logs/stream/', 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream')],
+            'client': ('127.0.0.1', 10000 + i), 'server': ('testserver', 80),
+        }
+        sent_request = False
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            body = message.get('body', b'')
+            received[i] = received.get(i, 0) + body.count(b'event: sensor')
+            heartbeats[i] = heartbeats.get(i, 0) + body.count(b': keepalive')
+
+        await app(scope, receive, send)
+
+    tasks = [asyncio.ensure_future(subscriber(i)) for i in range(args.subscribers)]
+    started = time.perf_counter()
+    while len(sensor_stream_hub) < args.subscribers:
+        await asyncio.sleep(0.05)
+    print(f"{args.subscribers} subscribers connected in {time.perf_counter() - started:.2f}s")
+
+    connected = heap_mb()
+    per_subscriber = (connected - baseline) * 2 ** 20 / args.subscribers / 1024
+    print(f"heap before connecting      {baseline:8.2f} MB")
+    print(f"heap after connect          {connected:8.2f} MB  ({per_subscriber:.1f} KB/subscriber)")
+
+    await asyncio.sleep(args.idle)
+    idle = heap_mb()
+    print(f"heap after {args.idle:.0f}s idle          {idle:8.2f} MB  (delta {idle - connected:+.2f} MB, "
+          f"{min(heartbeats.values())}+ heartbeats each)")
+
+    polls_before = sensor_stream_hub.polls
+    requests_before = server.request_count
+    last = await sync_to_async(
+        lambda: SensorEntry.objects.order_by('-entry_id').values_list('entry_id', flat=True).first() or 0
+    )()
+    for n in range(1, args.entries + 1):
+        await sync_to_async(SensorEntry.objects.create)(
+            channel_id=1, entry_id=last + n, created_at=timezone.now(), ambient_light=42.0, motion=1
+        )
+        await asyncio.sleep(args.poll_interval)
+    deadline = time.monotonic() + 10
+    while min(received.values()) < args.entries and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    published = heap_mb()
+    print(f"heap after {args.entries} entries        {published:8.2f} MB  (delta {published - connected:+.2f} MB)")
+
+    delivered = sum(1 for count in received.values() if count >= args.entries)
+    print(f"\nall {args.entries} entries delivered to {delivered}/{args.subscribers} subscribers")
+    print(f"hub polls of the mirror while publishing: {sensor_stream_hub.polls - polls_before} "
+          f"(one per interval, shared by all subscribers)")
+    print(f"ThingSpeak calls while streaming: {server.request_count - requests_before}")
+
+    disconnect.set()
+    await asyncio.wait(tasks, timeout=10)
+    print(f"subscribers left after disconnect: {len(sensor_stream_hub)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--idle', type=float, default=5, help='seconds to idle with heartbeats')
+    parser.add_argument('--entries', type=int, default=10, help='entries to publish')
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with StandinServer(feed_results=5) as server:
+        setup_django(
+            ML_WARMUP_ON_STARTUP='false',
+            THINGSPEAK_API_URL=server.url,
+            THINGSPEAK_CHANNEL_ID='1',
+            SENSOR_STREAM_POLL_INTERVAL=str(args.poll_interval),
+            SENSOR_STREAM_HEARTBEAT='1',
+        )
+        use_temporary_database()
+        asyncio.run(run(args, server))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare single-row inference paths for the light intensity booster.
+
+Times one feature row through XGBRegressor.predict (as a list and as a float32
+row), Booster.inplace_predict, the NumPy tree export (TreeEnsemblePredictor)
+and make_prediction end to end, then checks the export against predict() on
+--rows random rows, a share of them with missing values.
+
+    python -m benchmarks.single_row_predict [--calls 5000] [--rows 5000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .standins import setup_django, use_temporary_database
+
+
+def best_time(fn, calls, rounds=3):
+    fn()
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=5000, help='random rows for the output check')
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    setup_django(ML_WARMUP_ON_STARTUP='false', PREDICTION_LOG_ENABLED='false')
+    use_temporary_database()
+
+    from api.model_service import get_model_system
+
+    system = get_model_system()
+    model = system.light_intensity_model
+    booster = model.get_booster()
+    predictor = system.single_row_predictor
+    assert predictor is not None, 'single-row predictor was not built'
+
+    features = [25.0, 15.0, 20.0, 70.0, 1013.25, 30.0, 10.0, 300.0, 15.0, 20.0, 14, 150, 6, 0, 12.0, 210.0, 0.3]
+    row = np.asarray(features, dtype=np.float32).reshape(1, -1)
+
+    paths = [
+        ('predict(list)', lambda: model.predict([features])),
+        ('predict(float32 row)', lambda: model.predict(row)),
+        ('inplace_predict', lambda: booster.inplace_predict(row)),
+        ('tree export', lambda: predictor.predict_one(row)),
+        ('make_prediction', lambda: system.make_prediction(row)),
+    ]
+    baseline = None
+    for name, fn in paths:
+        seconds = best_time(fn, args.calls)
+        baseline = baseline or seconds
+        print(f"{name:22s} {seconds * 1e6:8.1f} us   {baseline / seconds:5.1f}x")
+
+    # Random rows spread around the training ranges, 10% of values missing
+    rng = np.random.default_rng(0)
+    X = (rng.normal(1.0, 0.5, size=(args.rows, row.shape[1])) * row).astype(np.float32)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    expected = model.predict(X)
+    actual = predictor.predict(X)
+    diff = float(np.max(np.abs(expected - actual)))
+    print(f"\nmax |tree export - predict| over {args.rows} rows: {diff:.3g} (tolerance {args.tolerance:g})")
+    assert diff <= args.tolerance
+
+
+if __name__ == '__main__':
+    main()
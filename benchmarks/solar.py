@@ -0,0 +1,85 @@
+"""
+Speed and accuracy of the local solar geometry (api.solar).
+
+Times a year of hourly solar elevation and clear-sky irradiance, a year of
+daily sunrise/sunset, and the cached per-request site_sun() call. Then
+replays the training data through the model as live predictions see it:
+once with the old guesses (solar radiation 200 W/m², 12 hours of daylight),
+once with radiation estimated from the sun's position and the cloud cover.
+Both are scored against the intensity the labelling rules give for the
+measured weather.
+
+    python -m benchmarks.solar
+"""
+import statistics
+import tempfile
+import time
+
+from .standins import setup_django
+
+
+def median_ms(fn, iterations):
+    fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    setup_django(ML_WARMUP_ON_STARTUP='false', ML_MODEL_DIR=tempfile.mkdtemp(prefix='bench-solar-models-'))
+
+    import numpy as np
+    import pandas as pd
+    from django.conf import settings
+    from api import solar
+    from api.features import FEATURE_COLUMNS, natural_light_index
+    from api.ml_model import create_features
+    from api.model_registry import read_training_data, train_system
+
+    latitude, longitude = solar.site_coordinates()
+    hours = np.arange('2025-01-01T00', '2026-01-01T00', dtype='datetime64[h]')
+    days = np.arange('2025-01-01', '2026-01-01', dtype='datetime64[D]')
+
+    def hourly():
+        solar.clear_sky_irradiance(solar.solar_elevation(hours, latitude, longitude))
+
+    print(f"{'year of hourly elevation + irradiance':40s} {median_ms(hourly, 50):8.3f} ms  ({len(hours)} hours)")
+    print(f"{'year of sunrise/sunset':40s} {median_ms(lambda: solar.sun_times(days, latitude, longitude), 50):8.3f} ms")
+    print(f"{'site_sun(), cached day':40s} {median_ms(solar.site_sun, 20000) * 1e3:8.3f} us")
+
+    raw = read_training_data(settings.TRAINING_DATA_PATH)
+    system = train_system(settings.TRAINING_DATA_PATH)
+    df = system.preprocess_weather_data(create_features(raw))
+    target = system.create_streetlight_targets(df)['light_intensity'].to_numpy()
+
+    estimated = solar.site_solar_radiation(df['datetime'], df['cloudcover'])
+    print(f"\nsolar radiation vs measured: MAE {np.abs(estimated - df['solarradiation']).mean():6.1f} W/m² "
+          f"(constant 200: {np.abs(200 - df['solarradiation']).mean():6.1f} W/m²)")
+
+    def replay(radiation, daylight):
+        X = df[FEATURE_COLUMNS].copy()
+        X['solarradiation'] = radiation
+        X['daylight_duration'] = daylight
+        X['natural_light_index'] = natural_light_index(
+            X['solarradiation'], X['cloudcover'], X['visibility'], system.feature_pipeline.stats['visibility_q95']
+        )
+        predictions = system.make_prediction_batch(X.fillna(0).to_numpy(dtype=np.float32), record=False)
+        intensity = predictions['recommended_intensity']
+        on_agreement = np.mean(predictions['lights_should_be_on'] == (target > 15))
+        return np.abs(intensity - target).mean(), on_agreement
+
+    print(f"\n{'live inputs':24s} {'intensity MAE':>14s} {'on/off agreement':>17s}")
+    for name, radiation, daylight in (
+        ('guesses (200, 12 h)', 200.0, 12.0),
+        ('solar geometry', estimated, df['daylight_duration']),
+        ('measured radiation', df['solarradiation'], df['daylight_duration']),
+    ):
+        mae, agreement = replay(radiation, daylight)
+        print(f"{name:24s} {mae:14.2f} {agreement:17.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Local stand-in servers for the upstream APIs (ThingSpeak, Visual Crossing)
+and Django setup shared by the benchmark scripts.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(**env):
+    """Configure Django for a benchmark run; `env` overrides settings read from the environment"""
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    os.chdir(ROOT_DIR)
+    for name, value in env.items():
+        os.environ[name] = str(value)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "IntelligentStrLighting.settings")
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+    # Benchmarks measure upstream traffic, so never answer from the shared weather cache
+    settings.CACHES = {
+        **settings.CACHES,
+        settings.WEATHER_CACHE_ALIAS: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+    }
+
+
+def use_temporary_database():
+    """
+    Point the default database at a fresh, migrated SQLite file so benchmarks
+    never touch db.sqlite3. Call after setup_django and before any query.
+    Returns the database path.
+    """
+    import tempfile
+    from django.conf import settings
+    from django.core.management import call_command
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = path
+    call_command('migrate', verbosity=0)
+    return path
+
+
+def thingspeak_feed(results=1, first_entry_id=1):
+    """A ThingSpeak feeds.json payload with `results` entries"""
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    feeds = [
+        {
+            'created_at': now,
+            'entry_id': first_entry_id + i,
+            'field1': str(10 + (i * 7) % 90),
+            'field2': str(i % 2),
+            'field3': '0',
+        }
+        for i in range(results)
+    ]
+    return {'channel': {'id': 0, 'last_entry_id': first_entry_id + results - 1}, 'feeds': feeds}
+
+
+def visual_crossing_timeline(n_days=3, tzoffset=2.0):
+    """
+    A Visual Crossing timeline payload: current conditions and `n_days` days
+    of hourly forecast from today (UTC+`tzoffset` local time, like Harare)
+    """
+    today = datetime.now(timezone.utc).date()
+    offset = int(tzoffset * 3600)
+    days = []
+    for day_index in range(n_days):
+        date = today + timedelta(days=day_index)
+        midnight = int(datetime(date.year, date.month, date.day, tzinfo=timezone.utc).timestamp()) - offset
+        hours = [
+            {
+                'datetime': f'{hour:02d}:00:00',
+                'datetimeEpoch': midnight + hour * 3600,
+                'temp': 18.0 + hour / 4,
+                'humidity': 60.0,
+                'pressure': 1018.0,
+                'cloudcover': (40.0 + 20 * day_index + hour) % 100,
+                'visibility': 10.0,
+                'windspeed': 8.0,
+                'precipprob': 10.0 * day_index,
+                'solarradiation': max(0.0, 800.0 - abs(hour - 12) * 130.0),
+                'uvindex': 5,
+            }
+            for hour in range(24)
+        ]
+        days.append({
+            'datetime': date.isoformat(),
+            'datetimeEpoch': midnight,
+            'tempmax': 25.0,
+            'tempmin': 12.0,
+            'sunriseEpoch': midnight + 6 * 3600,
+            'sunsetEpoch': midnight + 18 * 3600 + 15 * 60,
+            'hours': hours,
+        })
+    return {
+        'tzoffset': tzoffset,
+        'currentConditions': {
+            'temp': 21.0, 'humidity': 55.0, 'cloudcover': 35.0,
+            'visibility': 10.0, 'windspeed': 9.0, 'conditions': 'Partially cloudy',
+        },
+        'days': days,
+    }
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, text, status=200):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.record_request()
+        time.sleep(self.server.delay)
+        path = urlparse(self.path).path
+        if path.endswith('/feeds.json'):
+            self._send_json(thingspeak_feed(self.server.feed_results))
+        elif '/timeline/' in path:
+            self._send_json(visual_crossing_timeline())
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        self.server.record_request()
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        time.sleep(self.server.delay)
+        if urlparse(self.path).path == '/update':
+            self._send_text(str(self.server.request_count))
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering like ThingSpeak/Visual Crossing after `delay` seconds"""
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, feed_results=1):
+        super().__init__(('127.0.0.1', 0), StandinHandler)
+        self.delay = delay
+        self.feed_results = feed_results
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,260 @@
+"""
+Benchmark suite for the feature, training and prediction hot paths.
+
+Each case runs in its own Python process so peak RSS is per case. A case is
+timed over several iterations, then run once more under tracemalloc for
+allocation figures. Upstream APIs are answered by the local stand-in server.
+Results are written as JSON and compared against a stored baseline. The run
+exits non-zero when a metric regresses past --threshold.
+
+    python -m benchmarks.suite                   # run, save results, compare to the baseline
+    python -m benchmarks.suite --save-baseline   # run and store the results as the new baseline
+    python -m benchmarks.suite --cases make_prediction predict_light --iterations 500
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from .standins import ROOT_DIR, StandinServer, setup_django, use_temporary_database
+
+
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, 'latest.json')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+# Metrics compared against the baseline; higher is worse for all of them
+COMPARED_METRICS = ('median_ms', 'alloc_peak_kb', 'peak_rss_mb')
+
+
+def _training_frame():
+    from django.conf import settings
+    from api.model_registry import read_training_data
+    return read_training_data(settings.TRAINING_DATA_PATH)
+
+
+def case_create_features():
+    from api.ml_model import create_features
+    df = _training_frame()
+    return lambda: create_features(df), 20
+
+
+def case_preprocess_weather_data():
+    from api.ml_model import StreetlightMLSystem, create_features
+    df = create_features(_training_frame())
+    system = StreetlightMLSystem()
+    system.feature_pipeline.fit(df)
+    return lambda: system.preprocess_weather_data(df.copy()), 20
+
+
+def case_train_models():
+    from api.ml_model import StreetlightMLSystem, create_features
+    df = create_features(_training_frame())
+
+    def train():
+        StreetlightMLSystem().train_models(df)
+    return train, 3
+
+
+def case_make_prediction():
+    from api.ml_model import weather_inputs
+    from api.model_service import get_model_system
+    system = get_model_system()
+    external = system._get_simulated_data()
+    sensor = {'ambient_light_sensor': 40.0, 'motion_sensor': 1}
+    row = system.feature_pipeline.transform_one(weather_inputs(external['current_weather']), datetime.now()).copy()
+    return lambda: system.make_prediction(row, external_data=external, sensor_data=sensor), 2000
+
+
+def case_predict_light():
+    from django.test import Client
+    from django.urls import resolve
+    from api.model_service import get_model_system
+
+    get_model_system()
+    resolve('/api/predict/')
+    client = Client()
+
+    def request():
+        response = client.get('/api/predict/')
+        assert response.status_code == 200, response.content[:200]
+    return request, 200
+
+
+CASES = {
+    'create_features': case_create_features,
+    'preprocess_weather_data': case_preprocess_weather_data,
+    'train_models': case_train_models,
+    'make_prediction': case_make_prediction,
+    'predict_light': case_predict_light,
+}
+
+
+def measure(fn, iterations):
+    """Time `fn` over `iterations` calls, then trace the allocations of one more call"""
+    fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    fn()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'mean_ms': statistics.fmean(samples) * 1e3,
+        'median_ms': statistics.median(samples) * 1e3,
+        'p95_ms': samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1e3,
+        'min_ms': samples[0] * 1e3,
+        'alloc_peak_kb': (peak - before) / 1024,
+        'alloc_retained_kb': (after - before) / 1024,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_case(name, iterations, result_file):
+    """Child process entry point: run one case and write its metrics to `result_file`"""
+    with StandinServer() as server:
+        setup_django(
+            ML_WARMUP_ON_STARTUP='false',
+            PREDICTION_LOG_ENABLED='false',
+            THINGSPEAK_API_URL=server.url,
+            VISUAL_CROSSING_API_URL=server.url,
+            VISUAL_CROSSING_API_KEY='benchmark',
+        )
+        use_temporary_database()
+        fn, default_iterations = CASES[name]()
+        result = measure(fn, iterations or default_iterations)
+    with open(result_file, 'w') as f:
+        json.dump(result, f)
+
+
+def run_suite(cases, iterations):
+    # One model artifact and dataset cache shared by the case processes,
+    # outside the repo's models/ and .cache/
+    workdir = tempfile.mkdtemp(prefix='bench-suite-')
+    env = dict(
+        os.environ,
+        ML_MODEL_DIR=os.path.join(workdir, 'models'),
+        DATASET_CACHE_DIR=os.path.join(workdir, 'dataset'),
+    )
+    results = {}
+    for name in cases:
+        result_file = os.path.join(workdir, f'{name}.json')
+        command = [sys.executable, '-m', 'benchmarks.suite', '--run-case', name, '--result-file', result_file]
+        if iterations:
+            command += ['--iterations', str(iterations)]
+        proc = subprocess.run(command, cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stdout[-2000:] + proc.stderr[-4000:])
+            raise SystemExit(f'benchmark case {name} failed')
+        with open(result_file) as f:
+            results[name] = json.load(f)
+        r = results[name]
+        print(f"{name:24s} median {r['median_ms']:9.3f} ms  p95 {r['p95_ms']:9.3f} ms  "
+              f"alloc peak {r['alloc_peak_kb']:10.1f} KB  peak RSS {r['peak_rss_mb']:7.1f} MB")
+    return results
+
+
+def environment():
+    import numpy
+    import pandas
+    import xgboost
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'xgboost': xgboost.__version__,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline per metric; returns the regressed (case, metric) pairs"""
+    regressions = []
+    print(f"\n{'case':24s} {'metric':14s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for name, result in results.items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f"{name:24s} (not in baseline)")
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), result[metric]
+            if not old:
+                continue
+            change = new / old - 1
+            regressed = change > threshold
+            if regressed:
+                regressions.append((name, metric))
+            print(f"{name:24s} {metric:14s} {old:12.3f} {new:12.3f} {change:+8.1%}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def write_json(path, payload):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--iterations', type=int, help='override every case\'s iteration count')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative increase over the baseline reported as a regression')
+    parser.add_argument('--run-case', choices=list(CASES), help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case, args.iterations, args.result_file)
+        return
+
+    payload = {'environment': environment(), 'cases': run_suite(args.cases, args.iterations)}
+    write_json(args.output, payload)
+    print(f"\nresults written to {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, payload)
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; store one with --save-baseline")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(payload['cases'], baseline, args.threshold)
+    if regressions:
+        raise SystemExit(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+    print(f"\nno regressions over {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()